@@ -0,0 +1,84 @@
+# admission.py
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Iterable
+
+CRITICAL_CUES = ("BRAKE_NOW", "INCREASE_HEADWAY")
+
+@dataclass
+class Rejection:
+    status: int          # 429: this session is over its share, 503: server overloaded / deadline can't be met
+    reason: str
+    retry_after_s: float
+
+    def body(self) -> Dict[str, Any]:
+        return {"detail": self.reason, "shed": True, "retry_after_ms": int(self.retry_after_s*1000)}
+
+class AdmissionController:
+    """In-flight limits + deadline-aware load shedding for the inference endpoints.
+
+    Normal sessions may use max_inflight - reserve slots; sessions whose last result carried a
+    safety-critical cue (BRAKE_NOW, INCREASE_HEADWAY) may also use the reserved ones. A frame is
+    rejected up front when the expected finish time (service-time EMA x queue position) is past
+    its deadline, since a late cue is worthless and would only delay the frames behind it.
+    `servers` is how many frames the detector can work on at once (model replicas).
+    Called from the event loop only, so no locking.
+    """
+    def __init__(self, max_inflight: int = 8, per_session: int = 2, reserve: int = 2,
+                 priority_hold_s: float = 2.0, ema_alpha: float = 0.2, init_service_s: float = 0.05,
+                 servers: int = 1):
+        self.max_inflight = max_inflight; self.per_session = per_session; self.servers = max(1, servers)
+        self.reserve = min(reserve, max_inflight-1); self.priority_hold_s = priority_hold_s
+        self.ema_alpha = ema_alpha; self.service_s = init_service_s
+        self.inflight = 0; self.last_done = 0.0
+        self.by_session: Dict[str, int] = {}
+        self.priority_until: Dict[str, float] = {}
+        self.counts = {"admitted": 0, "priority": 0, "rejected_session": 0,
+                       "rejected_overload": 0, "rejected_deadline": 0}
+
+    def is_priority(self, session_id: str, now: Optional[float] = None) -> bool:
+        until = self.priority_until.get(session_id)
+        return until is not None and (now or time.monotonic()) < until
+
+    def admit(self, session_id: str, deadline: Optional[float] = None) -> Optional[Rejection]:
+        """None if admitted (caller must release()), else why not. deadline is epoch seconds."""
+        prio = self.is_priority(session_id)
+        if self.by_session.get(session_id, 0) >= self.per_session:
+            self.counts["rejected_session"] += 1
+            return Rejection(429, "session has too many frames in flight", self.service_s)
+        limit = self.max_inflight if prio else self.max_inflight - self.reserve
+        if self.inflight >= limit:
+            self.counts["rejected_overload"] += 1
+            return Rejection(503, "inference overloaded", self.service_s*(self.inflight - limit + 1)/self.servers)
+        if deadline is not None:
+            eta = time.time() + self.service_s*math.ceil((self.inflight + 1)/self.servers)
+            if eta > deadline:
+                self.counts["rejected_deadline"] += 1
+                return Rejection(503, "frame would miss its deadline", self.service_s*self.inflight/self.servers)
+        self.inflight += 1
+        self.by_session[session_id] = self.by_session.get(session_id, 0) + 1
+        self.counts["admitted"] += 1; self.counts["priority"] += prio
+        return None
+
+    def release(self, session_id: str, elapsed_s: Optional[float] = None, cues: Optional[Iterable[Dict[str, Any]]] = None):
+        """Free the slot; feed the request's wall time and the result's cues back in."""
+        now = time.monotonic()
+        self.inflight -= 1
+        n = self.by_session.get(session_id, 1) - 1
+        if n > 0: self.by_session[session_id] = n
+        else: self.by_session.pop(session_id, None)
+        if elapsed_s is not None:
+            # while busy, completions are service_s / servers apart (wall time also counts queueing)
+            self.service_s += self.ema_alpha*(min(elapsed_s, (now - self.last_done)*self.servers) - self.service_s)
+            self.last_done = now
+        if cues is not None and any(c.get("cue") in CRITICAL_CUES for c in cues):
+            self.priority_until[session_id] = now + self.priority_hold_s
+
+    def forget(self, session_id: str):
+        self.priority_until.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return dict(self.counts, inflight=self.inflight, service_ms_ema=round(1000.0*self.service_s, 1),
+                    priority_sessions=sum(1 for u in self.priority_until.values() if u > now))
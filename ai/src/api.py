@@ -1,15 +1,32 @@
-from fastapi import FastAPI, UploadFile, File, Body, Form
-from pydantic import BaseModel
+from fastapi import FastAPI, UploadFile, File, Body, Form, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import numpy as np, cv2
+import asyncio
 import json
+import math
 import os
 import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 
 # Add current directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from detector import YoloDetector, estimate_lead_distance_px
-from rules import ScoringState, Telemetry
+from detector_pool import DetectorPool
+from rules import ScoringState, ScoreTimeline, Telemetry
+from ttc_engine import LoomingTTCEngine
+from rate_control import AdaptiveRate, RateConfig
+from roi_planner import CorridorPlanner
+from frame_cache import FrameChangeDetector
+from fast_decode import ReducedDecoder, scale_dets
+from shm_transport import serve_shm
+from admission import AdmissionController, Rejection
+from tracing import from_env as tracer_from_env, CallProfiler, MemorySnapshots
+import json_codec
+from starlette.concurrency import run_in_threadpool
+from dataclasses import dataclass, field
 
 app=FastAPI()
 
@@ -19,14 +36,131 @@ if not os.path.exists(model_path):
     # If not found, try downloading or use default
     model_path = "yolov8n.pt"  # YOLO will auto-download if needed
 
-det=YoloDetector(model_path, conf=0.25, imgsz=640)
-scorer=ScoringState()
+# DETECTOR_REPLICAS > 1 runs that many model replicas (DETECTOR_MODE process|thread), each on
+# DETECTOR_THREADS cores (default: cores / replicas); pick values with `python detector_pool.py --autotune`
+DETECTOR_REPLICAS = int(os.getenv("DETECTOR_REPLICAS", "1"))
+if DETECTOR_REPLICAS > 1:
+    det=DetectorPool(model_path, conf=0.25, imgsz=640, replicas=DETECTOR_REPLICAS,
+                     threads=int(os.getenv("DETECTOR_THREADS", "0")) or None,
+                     mode=os.getenv("DETECTOR_MODE", "process"))
+    det_lock=nullcontext()     # the pool hands each call an idle replica
+else:
+    det=YoloDetector(model_path, conf=0.25, imgsz=640)
+    det_lock=threading.Lock()  # one model; in-process callers may score from several threads
 
-class TelemetryIn(BaseModel):
-    t: float; speed_mps: float; speed_limit_mps: float
-    throttle: float; brake: float; steer_deg: float
-    lane_offset_m: float|None=None; tl_state: str|None=None
-    in_stop_zone: bool|None=None; collision: bool=False
+# Adaptive per-session inference rate (ADAPTIVE_RATE=0 runs the detector on every frame)
+ADAPTIVE_RATE = os.getenv("ADAPTIVE_RATE", "1") != "0"
+RATE_CFG = RateConfig(min_hz=float(os.getenv("INFER_MIN_HZ", "2.0")),
+                      max_hz=float(os.getenv("INFER_MAX_HZ", "15.0")))
+# Forward-corridor cropped inference with per-frame imgsz (full-frame pass every ROI_FULL_EVERY frames)
+ROI_INFER = os.getenv("ROI_INFER", "0") == "1"
+ROI_FULL_EVERY = int(os.getenv("ROI_FULL_EVERY", "10"))
+# Near-duplicate frames reuse the last perception result (FRAME_CACHE=0 disables)
+FRAME_CACHE = os.getenv("FRAME_CACHE", "1") != "0"
+FRAME_CACHE_THRESH = float(os.getenv("FRAME_CACHE_THRESH", "6.0"))
+FRAME_CACHE_MAX_AGE_S = float(os.getenv("FRAME_CACHE_MAX_AGE_S", "1.0"))
+# Decode JPEGs at 1/2, 1/4 or 1/8 size when that still covers imgsz (DECODE_REDUCED=0 disables)
+DECODE_REDUCED = os.getenv("DECODE_REDUCED", "1") != "0"
+decoder = ReducedDecoder(det.imgsz)
+# Rolling window scores: SCORE_WINDOWS seconds are reported with every result (empty disables);
+# GET /score_window answers any window up to SCORE_HORIZON_S
+SCORE_WINDOWS = [float(w) for w in os.getenv("SCORE_WINDOWS", "30,60").split(",") if w.strip()]
+SCORE_BUCKET_S = float(os.getenv("SCORE_BUCKET_S", "1.0"))
+SCORE_HORIZON_S = float(os.getenv("SCORE_HORIZON_S", "600"))
+# Admission control: in-flight limits, deadline shedding, reserved slots for safety-critical sessions (ADMISSION=0 disables)
+ADMISSION = os.getenv("ADMISSION", "1") != "0"
+FRAME_BUDGET_S = float(os.getenv("FRAME_BUDGET_S", "0.5"))   # deadline = sent_ts + budget when no explicit deadline
+admission = AdmissionController(max_inflight=int(os.getenv("MAX_INFLIGHT", "8")),
+                                per_session=int(os.getenv("MAX_INFLIGHT_PER_SESSION", "2")),
+                                reserve=int(os.getenv("PRIORITY_RESERVE", "2")),
+                                servers=DETECTOR_REPLICAS)
+# Sampled per-frame spans (TRACE_SAMPLE, TRACE_DIR), written per session on /end_session;
+# DEBUG_ENDPOINTS=1 adds /debug/profile (cProfile) and /debug/tracemalloc
+tracer = tracer_from_env("api")
+# Sessions whose client went away without /end_session are dropped after SESSION_IDLE_S without a frame (0 keeps them)
+SESSION_IDLE_S = float(os.getenv("SESSION_IDLE_S", "600"))
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "0") == "1"
+profiler = CallProfiler()
+memsnap = MemorySnapshots()
+
+@dataclass
+class Session:
+    scorer: ScoringState=field(default_factory=lambda: ScoringState(timeline=ScoreTimeline(SCORE_BUCKET_S, SCORE_HORIZON_S)))
+    tracker: LoomingTTCEngine=field(default_factory=LoomingTTCEngine)
+    rate: AdaptiveRate=field(default_factory=lambda: AdaptiveRate(RATE_CFG))
+    planner: CorridorPlanner=field(default_factory=lambda: CorridorPlanner(det.imgsz, full_every=ROI_FULL_EVERY))
+    frame_cache: FrameChangeDetector=field(default_factory=lambda: FrameChangeDetector(FRAME_CACHE_THRESH, FRAME_CACHE_MAX_AGE_S))
+    last: dict|None=None   # last perception pass, reused on skipped / near-duplicate frames
+    last_ttc: float|None=None; last_cues: list=field(default_factory=list)   # last scored frame (batch planning)
+    lock: threading.Lock=field(default_factory=threading.Lock)  # frames of one session are scored one at a time
+    last_used: float=field(default_factory=time.monotonic)      # for the idle sweep
+
+sessions: dict[str,Session]={}
+sessions_lock=threading.Lock()
+sessions_expired=0
+
+def get_session(session_id: str) -> Session:
+    sess=sessions.get(session_id)
+    if sess is None:
+        with sessions_lock:
+            sess=sessions.get(session_id) or sessions.setdefault(session_id, Session())
+    sess.last_used=time.monotonic()
+    return sess
+
+@contextmanager
+def locked_session(session_id: str, trace_id: str|None=None):
+    """The session with its lock held. A session swept or ended while we waited for its lock is
+    no longer in `sessions`; then we start over, so a frame is never scored into a dropped session."""
+    while True:
+        sess=get_session(session_id)
+        with tracer.span(trace_id, "api.session_wait"):
+            sess.lock.acquire()
+        if sessions.get(session_id) is sess: break
+        sess.lock.release()
+    try:
+        yield sess
+    finally:
+        sess.lock.release()
+
+def sweep_sessions(idle_s: float=SESSION_IDLE_S) -> list[str]:
+    """Drop sessions unused for idle_s (client disconnected without /end_session); returns their ids."""
+    global sessions_expired
+    cutoff=time.monotonic()-idle_s
+    stale=[]
+    with sessions_lock:
+        for sid, s in list(sessions.items()):
+            # only while nobody holds it; a request already holding `s` re-checks membership (locked_session)
+            if s.last_used < cutoff and s.lock.acquire(blocking=False):
+                del sessions[sid]; s.lock.release(); stale.append(sid)
+        sessions_expired+=len(stale)
+    for sid in stale:
+        admission.forget(sid)
+        tracer.flush(sid)
+    return stale
+
+SWEEP_INTERVAL_S = min(60.0, SESSION_IDLE_S/4)
+
+def expire_idle() -> list[str]:
+    """Idle-session sweep plus trace-buffer expiry, every SWEEP_INTERVAL_S: by the startup task below,
+    or by the host when api is imported in-process (livekit_backend INFER_MODE=inprocess)."""
+    stale=sweep_sessions()
+    tracer.expire()   # spans of sessions that never got a Session (e.g. all shed)
+    return stale
+
+def parse_telemetry(telemetry: str|bytes) -> Telemetry:
+    """The one telemetry parse per frame: JSON straight into the scorer's Telemetry record."""
+    return Telemetry.from_dict(json_codec.loads(telemetry))
+
+def parse_telemetry_list(telemetry: str|bytes, n_images: int) -> list[Telemetry]:
+    """A batch's telemetry array, one entry per image."""
+    items = json_codec.loads(telemetry)
+    if not isinstance(items, list): raise ValueError("telemetry must be a JSON array")
+    if len(items) != n_images: raise ValueError(f"{n_images} images but {len(items)} telemetry entries")
+    return [Telemetry.from_dict(d) for d in items]
+
+def json_response(obj) -> Response:
+    """Encode with json_codec (orjson / msgspec when installed) instead of FastAPI's encoder walk."""
+    return Response(json_codec.dumps(obj), media_type="application/json")
 
 def px_to_ttc(px_proxy: float|None, speed_mps: float)->float|None:
     if px_proxy is None or speed_mps<0.1: return None
@@ -39,53 +173,280 @@ def px_to_dist_m(px_proxy: float|None) -> float|None:
     if px_proxy is None: return None
     return 40.0 * px_proxy
 
-@app.post("/infer_frame")
-async def infer_frame(
-    image: UploadFile = File(...),
-    telemetry: str = Form(...),   # <-- accept as string from multipart
-):
-    # Parse telemetry JSON string into the Pydantic model
-    telemetry_obj = TelemetryIn.model_validate_json(telemetry)
+def _min_ttc(*vals: float|None) -> float|None:
+    vals=[v for v in vals if v is not None]
+    return min(vals) if vals else None
+
+COLLISION_DIST_M = 0.6   # tune as needed
+TTC_COLLISION_S  = 0.25  # seconds
+
+def perceive(sess: Session, bgr: np.ndarray, t: float, dets: list|None=None, r: int=1, trace_id: str|None=None) -> dict:
+    """Detector (unless dets are given, e.g. from a batch) + tracking for one frame.
 
-    data = await image.read()
-    bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    bgr may be decoded at 1/r resolution; detections and shapes are mapped back to
+    full resolution, since the TTC / distance heuristics work in upload pixels.
+    """
+    if dets is None:
+        roi, imgsz = None, None
+        if ROI_INFER:
+            prev = scale_dets(sess.last["dets"], 1.0/r) if sess.last else None
+            roi, imgsz = sess.planner.plan(bgr.shape, prev)
+        with tracer.span(trace_id, "api.detect", roi=roi is not None, imgsz=imgsz), det_lock:
+            dets = det.infer(bgr, roi=roi, imgsz=imgsz)
+    dets = scale_dets(dets, r)
+    shape = (bgr.shape[0]*r, bgr.shape[1]*r) + bgr.shape[2:]
+    with tracer.span(trace_id, "api.track"):
+        tracks = sess.tracker.step(dets, t)
+    return {"dets": dets, "tracks": tracks,
+            "lead_proxy": estimate_lead_distance_px(dets, shape),
+            "loom_ttc": sess.tracker.min_ttc(shape)}
 
-    dets = det.infer(bgr)
-    lead_proxy = estimate_lead_distance_px(dets, bgr.shape)
-    ttc = px_to_ttc(lead_proxy, telemetry_obj.speed_mps)
-    lead_dist_m = px_to_dist_m(lead_proxy)
+def _decode(image_data: bytes|np.ndarray) -> tuple[np.ndarray, int]:
+    """(bgr, r) with bgr at 1/r of the upload's resolution."""
+    if isinstance(image_data, np.ndarray):
+        return image_data, 1
+    if DECODE_REDUCED:
+        return decoder.decode(image_data)
+    return cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR), 1
+
+def _needs_inference(sess: Session, image_data: bytes|np.ndarray, t: float, have_last: bool|None=None) -> tuple[bool, bool]:
+    """(run the detector?, near-duplicate cache hit?) for this frame.
+    have_last: whether a perception result will exist by then (batch planning); default sess.last."""
+    have_last = sess.last is not None if have_last is None else have_last
+    inferred = (not ADAPTIVE_RATE) or sess.rate.should_infer(t) or not have_last   # should_infer first: it records t
+    cache_hit = False
+    if inferred and FRAME_CACHE:
+        cache_hit = sess.frame_cache.check(image_data, t) and have_last
+        inferred = not cache_hit
+    return inferred, cache_hit
+
+def _score(sess: Session, tel: Telemetry, inferred: bool, cache_hit: bool, update_rate: bool=True) -> dict:
+    """Step the session's scorer with the latest perception result."""
+    p = sess.last
+
+    # Looming TTC over all tracked vehicles (covers cut-ins); keep the headway heuristic as a floor
+    ttc = _min_ttc(px_to_ttc(p["lead_proxy"], tel.speed_mps), p["loom_ttc"])
+    lead_dist_m = px_to_dist_m(p["lead_proxy"])
 
     # Simple collision heuristic: very close or extremely low TTC
-    COLLISION_DIST_M = 0.6   # tune as needed
-    TTC_COLLISION_S  = 0.25  # seconds
     collided = False
     if lead_dist_m is not None and lead_dist_m < COLLISION_DIST_M:
         collided = True
     if ttc is not None and ttc < TTC_COLLISION_S:
         collided = True
 
-    tel = Telemetry(**telemetry_obj.model_dump())
     if collided:
         tel.collision = True
 
-    cues = scorer.step(tel, ttc)
+    cues = sess.scorer.step(tel, ttc)
+    sess.last_ttc, sess.last_cues = ttc, cues
+    if ADAPTIVE_RATE and update_rate:
+        sess.rate.update(tel, ttc, cues)
     return {
         "cues": cues,
         "ttc": ttc,
         "lead_distance_m": lead_dist_m,
         "collision": tel.collision,
-        "detections": len(dets),
+        "detections": len(p["dets"]),
+        "tracks": p["tracks"],
+        "inferred": inferred,
+        "cache_hit": cache_hit,
+        "window_scores": {f"{w:g}": sess.scorer.timeline.window(w)["final"] for w in SCORE_WINDOWS},
     }
 
+def process_image_and_telemetry(image_data: bytes|np.ndarray, telemetry: str|Telemetry, session_id: str="default",
+                                trace_id: str|None=None) -> dict:
+    """Score one frame. image_data is encoded image bytes, or an already decoded BGR array (in-process callers);
+    telemetry is JSON or an already parsed Telemetry."""
+    telemetry_obj = telemetry if isinstance(telemetry, Telemetry) else parse_telemetry(telemetry)
+
+    with locked_session(session_id, trace_id) as sess:
+        with tracer.span(trace_id, "api.frame_cache"):
+            inferred, cache_hit = _needs_inference(sess, image_data, telemetry_obj.t)
+        if inferred:
+            with tracer.span(trace_id, "api.decode"):
+                bgr, r = _decode(image_data)
+            sess.last = perceive(sess, bgr, telemetry_obj.t, r=r, trace_id=trace_id)
+        with tracer.span(trace_id, "api.score"):
+            return _score(sess, telemetry_obj, inferred, cache_hit)
+
+def process_batch(images: list[bytes], telemetry: str|list[Telemetry], session_id: str="default") -> list[dict]:
+    """Score a burst of frames: one detector call for every frame that needs it, scoring in timestamp order.
+
+    Cropped inference (ROI_INFER) is not applied here; crops of different sizes don't batch.
+    """
+    tels = parse_telemetry_list(telemetry, len(images)) if isinstance(telemetry, (str, bytes)) else telemetry
+    order = sorted(range(len(tels)), key=lambda i: tels[i].t)
+
+    with locked_session(session_id) as sess:
+        # decide per frame in time order, as sequential frames would be: the first inferred frame
+        # provides a perception result for the rest, and the rate adapts to each frame's telemetry
+        # (TTC / cues as of the last scored frame; this burst's own detections aren't known yet).
+        # Then run the detector once over the frames that need it.
+        plan = {}; have_last = sess.last is not None
+        for i in order:
+            plan[i] = _needs_inference(sess, images[i], tels[i].t, have_last)
+            have_last = have_last or plan[i][0]
+            if ADAPTIVE_RATE: sess.rate.update(tels[i], sess.last_ttc, sess.last_cues)
+        todo = [i for i in order if plan[i][0]]
+        bgrs = {i: _decode(images[i]) for i in todo}
+        with det_lock:
+            batch_dets = det.infer_batch([bgrs[i][0] for i in todo])
+        dets_by_idx = dict(zip(todo, batch_dets))
+
+        results = []
+        for i in order:
+            inferred, cache_hit = plan[i]
+            if inferred:
+                bgr, r = bgrs[i]
+                sess.last = perceive(sess, bgr, tels[i].t, dets=dets_by_idx[i], r=r)
+            out = _score(sess, tels[i], inferred, cache_hit, update_rate=False)
+            out["index"] = i; out["t"] = tels[i].t
+            results.append(out)
+        if ADAPTIVE_RATE and order:   # the next burst starts from the latest frame's real TTC / cues
+            sess.rate.update(tels[order[-1]], sess.last_ttc, sess.last_cues)
+        return results
+
+async def run_admitted(session_id: str, deadline: float|None, fn, *args):
+    """fn(*args) on the threadpool under admission control; returns a Rejection if the request is shed."""
+    if not ADMISSION:
+        return await run_in_threadpool(profiler.call, fn, *args)
+    rej = admission.admit(session_id, deadline)
+    if rej is not None:
+        return rej
+    t0 = time.monotonic(); out = None
+    try:
+        out = await run_in_threadpool(profiler.call, fn, *args)
+        return out
+    finally:
+        last = out if isinstance(out, dict) else (out[-1] if out else None)
+        admission.release(session_id, time.monotonic() - t0, last["cues"] if last else None)
+
+def _deadline(deadline: float|None, sent_ts: float|None) -> float|None:
+    if deadline is not None: return deadline
+    return sent_ts + FRAME_BUDGET_S if sent_ts is not None else None
+
+def _shed(rej: Rejection) -> JSONResponse:
+    return JSONResponse(rej.body(), status_code=rej.status,
+                        headers={"Retry-After": str(max(1, math.ceil(rej.retry_after_s)))})
+
 @app.post("/infer_frame")
 async def infer_frame(
     image: UploadFile = File(...),
     telemetry: str = Form(...),   # <-- accept as string from multipart
+    session_id: str = Form("default"),
+    sent_ts: float|None = Form(None),    # epoch seconds the frame left the client
+    deadline: float|None = Form(None),   # epoch seconds after which the result is useless
+    trace_id: str|None = Form(None),     # "<session_id>:<seq>", shared with the gateway's spans
+):
+    with tracer.span(trace_id, "api.request"):
+        try:   # only malformed telemetry is the client's fault; errors while scoring stay 500s
+            tel = parse_telemetry(telemetry)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        image_data = await image.read()
+        out = await run_admitted(session_id, _deadline(deadline, sent_ts),
+                                 process_image_and_telemetry, image_data, tel, session_id, trace_id)
+    return _shed(out) if isinstance(out, Rejection) else json_response(out)
+
+@app.post("/infer_batch")
+async def infer_batch(
+    images: list[UploadFile] = File(...),
+    telemetry: str = Form(...),   # JSON array, one entry per image (same order as the uploads)
+    session_id: str = Form("default"),
+    deadline: float|None = Form(None),
 ):
-    # This endpoint can now call the new function
-    image_data = await image.read()
-    return process_image_and_telemetry(image_data, telemetry)
+    try:
+        tels = parse_telemetry_list(telemetry, len(images))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    datas = [await im.read() for im in images]
+    results = await run_admitted(session_id, deadline, process_batch, datas, tels, session_id)
+    return _shed(results) if isinstance(results, Rejection) else json_response({"results": results})
 
 @app.post("/end_session")
-async def end_session():
-    return scorer.finalize()
+async def end_session(session_id: str = Form("default")):
+    admission.forget(session_id)
+    await run_in_threadpool(tracer.flush, session_id)   # file write
+    return await run_in_threadpool(finalize_session, session_id)
+
+def finalize_session(session_id: str) -> dict:
+    """Remove the session and score it once any frame still being scored has finished (takes sess.lock)."""
+    with sessions_lock:
+        sess = sessions.pop(session_id, None) or Session()
+    with sess.lock:
+        out = sess.scorer.finalize()
+        out["rate"] = sess.rate.stats()
+    return out
+
+@app.get("/score_window")
+def score_window(session_id: str = "default", seconds: float = 30.0, every: float|None = None):
+    """Score of the last `seconds` of telemetry time; with `every`, consecutive windows of that length.
+    Plain def: FastAPI runs it in the threadpool, since sess.lock is held while a frame is scored."""
+    sess = sessions.get(session_id)
+    if sess is None:
+        raise HTTPException(status_code=404, detail="unknown session")
+    with sess.lock:
+        tl = sess.scorer.timeline
+        if every is not None:
+            return {"every_s": every, "windows": tl.series(every, sess.scorer.weights)}
+        return tl.window(seconds, sess.scorer.weights)
+
+@app.get("/healthz")
+async def healthz():
+    return {"ok": True, "sessions": len(sessions), "sessions_expired": sessions_expired}
+
+@app.get("/stats")
+async def stats():
+    return {
+        "decode": decoder.stats(),
+        "admission": admission.stats(),
+        "detector": det.stats() if isinstance(det, DetectorPool) else None,
+        "tracing": tracer.stats(),
+        "sessions": {sid: {"rate": s.rate.stats(), "roi": s.planner.stats(), "frame_cache": s.frame_cache.stats()}
+                     for sid, s in sessions.items()},
+    }
+
+if DEBUG_ENDPOINTS:
+    @app.get("/debug/profile")
+    async def debug_profile(calls: int = 50, timeout_s: float = 30.0, top: int = 30, sort: str = "cumulative"):
+        """cProfile the next `calls` frames (or whatever arrives within timeout_s), aggregated."""
+        profiler.arm(calls)
+        await run_in_threadpool(profiler.done.wait, timeout_s)
+        profiler.disarm()
+        return PlainTextResponse(profiler.report(top, sort))
+
+    @app.get("/debug/tracemalloc")
+    async def debug_tracemalloc(top: int = 25, stop: bool = False):
+        """First call starts tracemalloc; each later call returns the allocation growth since the previous one."""
+        return memsnap.step(top, stop)
+
+# Co-located gateways can hand frames over through shared memory instead of multipart HTTP
+SHM_SOCKET = os.getenv("SHM_SOCKET", "")
+
+@app.on_event("shutdown")
+async def close_detector_pool():
+    if isinstance(det, DetectorPool):
+        det.close()
+
+@app.on_event("startup")
+async def start_session_sweep():
+    if SESSION_IDLE_S > 0:
+        async def sweep():
+            while True:
+                await asyncio.sleep(SWEEP_INTERVAL_S)
+                await run_in_threadpool(expire_idle)   # counted in /healthz
+        app.state.session_sweep = asyncio.create_task(sweep())
+
+@app.on_event("shutdown")
+async def stop_session_sweep():
+    task = getattr(app.state, "session_sweep", None)
+    if task is not None: task.cancel()
+
+@app.on_event("startup")
+async def start_shm_transport():
+    if SHM_SOCKET:
+        async def handle(view: np.ndarray, telemetry: str, session_id: str, trace_id: str|None=None) -> dict:
+            out = await run_admitted(session_id, None, process_image_and_telemetry, view, telemetry, session_id, trace_id)
+            return out.body() if isinstance(out, Rejection) else out
+        app.state.shm_server = await serve_shm(SHM_SOCKET, handle)
@@ -0,0 +1,74 @@
+# bench_hotpath.py
+"""Per-frame serialization / logging overhead outside inference, before vs after the fast path.
+
+Replays what one v1 frame costs in the gateway (backend/app.py) and the API (api.py) minus
+decode / detect / score, using a representative telemetry message and result:
+  before: json.loads, json.dumps for the form, print of telemetry and result, pydantic
+          validate -> model_dump -> Telemetry(**...), FastAPI's jsonable_encoder + json.dumps
+          for the response, json.dumps again for the WebSocket reply
+  after:  one json_codec parse per hop, Telemetry.from_dict, json_codec for the response and the
+          reply, log.debug calls that are disabled at LOG_LEVEL=INFO
+Usage: python bench_hotpath.py [--frames 20000]
+"""
+import argparse, io, json, logging, os, sys, time
+from contextlib import redirect_stdout
+from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+import json_codec
+from log_setup import configure
+from rules import Telemetry
+
+TEL = json.dumps({"t": 12.345, "speed_mps": 13.4, "speed_limit_mps": 13.9, "throttle": 0.31, "brake": 0.0,
+                  "steer_deg": -2.5, "lane_offset_m": 0.18, "tl_state": "green", "in_stop_zone": False, "collision": False})
+RESULT = {"cues": [{"cue": "INCREASE_HEADWAY", "level": 0.62, "t": 12.3}, {"cue": "LANE_DRIFT", "level": 0.25, "t": 12.3}],
+          "ttc": 2.71, "lead_distance_m": 18.4, "collision": False, "detections": 4,
+          "tracks": [{"id": i, "box": [100.0+i, 200.0, 180.0+i, 260.0], "ttc": 3.1} for i in range(4)],
+          "inferred": True, "cache_hit": False, "window_scores": {"30": 87.5, "60": 90.1}}
+
+class TelemetryIn(BaseModel):   # the API's pydantic model before the fast path
+    t: float; speed_mps: float; speed_limit_mps: float
+    throttle: float; brake: float; steer_deg: float
+    lane_offset_m: float|None=None; tl_state: str|None=None
+    in_stop_zone: bool|None=None; collision: bool=False
+
+def before(sink) -> None:
+    data = json.loads(TEL)                                           # gateway: telemetry message
+    with redirect_stdout(sink): print("Received telemetry:", data)
+    form = json.dumps(data)                                          # gateway: form field
+    tel = Telemetry(**TelemetryIn.model_validate_json(form).model_dump())   # API
+    body = json.dumps(jsonable_encoder(dict(RESULT))).encode()       # API: response
+    result = json.loads(body)                                        # gateway: response
+    with redirect_stdout(sink): print("Inference result:", result)
+    json.dumps(dict(result, type="inference"))                       # gateway: WebSocket reply
+
+def after(loads, dumps, log) -> None:
+    data = loads(TEL)
+    log.debug("telemetry %s", data)
+    form = dumps(data).decode()
+    tel = Telemetry.from_dict(loads(form))
+    body = dumps(RESULT)
+    result = loads(body)
+    log.debug("inference result %s", result)
+    dumps(dict(result, type="inference")).decode()
+
+def timeit(fn, frames: int, *args) -> float:
+    for _ in range(min(1000, frames)): fn(*args)   # warm up
+    t0 = time.perf_counter()
+    for _ in range(frames): fn(*args)
+    return (time.perf_counter() - t0) / frames * 1e6
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--frames", type=int, default=20000)
+    args = ap.parse_args()
+    log = configure("bench", level="INFO")
+    with open(os.devnull, "w") as devnull:
+        base = timeit(before, args.frames, devnull)
+    print(f"{'before (json + pydantic + print)':40s} {base:7.1f} us/frame")
+    for name in ("json", "orjson", "msgspec"):
+        try: _, loads, dumps = json_codec.pick(name)
+        except ImportError:
+            print(f"{'after (' + name + ')':40s}   not installed"); continue
+        us = timeit(after, args.frames, loads, dumps, log)
+        print(f"{'after (' + name + ')':40s} {us:7.1f} us/frame  ({base/us:.1f}x)")
+    print(f"default codec here: {json_codec.NAME}", file=sys.stderr)
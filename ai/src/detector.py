@@ -11,12 +11,27 @@ class YoloDetector:
         self.conf = conf
         self.imgsz = imgsz
 
-    def infer(self, bgr_frame: np.ndarray) -> List[Dict[str, Any]]:
-        res = self.model.predict(bgr_frame, imgsz=self.imgsz, conf=self.conf, verbose=False)[0]
+    def infer(self, bgr_frame: np.ndarray, roi: Optional[Tuple[int,int,int,int]] = None,
+              imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Detect on the full frame, or on an (x1,y1,x2,y2) crop mapped back to full-frame coords."""
+        ox = oy = 0
+        if roi is not None:
+            x1,y1,x2,y2 = roi; ox, oy = x1, y1
+            bgr_frame = bgr_frame[y1:y2, x1:x2]
+        res = self.model.predict(bgr_frame, imgsz=imgsz or self.imgsz, conf=self.conf, verbose=False)[0]
+        return self._parse(res, ox, oy)
+
+    def infer_batch(self, bgr_frames: List[np.ndarray], imgsz: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Detect on several full frames in one model call; one detection list per frame, in order."""
+        if not bgr_frames: return []
+        results = self.model.predict(bgr_frames, imgsz=imgsz or self.imgsz, conf=self.conf, verbose=False)
+        return [self._parse(res) for res in results]
+
+    def _parse(self, res, ox: float = 0, oy: float = 0) -> List[Dict[str, Any]]:
         out: List[Dict[str, Any]] = []
         if res.boxes is None or res.boxes.xyxy is None:
             return out
-        boxes = res.boxes.xyxy.cpu().numpy()
+        boxes = res.boxes.xyxy.cpu().numpy() + np.array([ox,oy,ox,oy], np.float32)
         clss = res.boxes.cls.cpu().numpy().astype(int)
         confs = res.boxes.conf.cpu().numpy()
         names = self.model.names
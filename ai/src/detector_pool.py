@@ -0,0 +1,273 @@
+# detector_pool.py
+"""Several YoloDetector replicas, each on its own slice of cores, behind one YoloDetector-like API.
+
+- mode "process": each replica is a spawned worker process with its own torch / OpenCV thread
+  pools, pinned with sched_setaffinity; frames travel through a per-replica shared-memory ring
+  (shm_transport.ShmRing), only the slot and shape go over the pipe.
+- mode "thread": replicas share the process; each has a dedicated worker thread pinned to its
+  cores. torch's thread count is process-wide here, so this isolates less than processes.
+- infer() / infer_batch() block until a replica is idle and run there (least recently used first).
+
+Pick replicas x threads for a box with the autotune benchmark:
+    python detector_pool.py --autotune --video sample_drive.mp4 --target-p99-ms 150
+"""
+import argparse, json, logging, os, queue, threading, time
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+log = logging.getLogger("detector_pool")
+
+def available_cores() -> List[int]:
+    try: return sorted(os.sched_getaffinity(0))
+    except AttributeError: return list(range(os.cpu_count() or 1))
+
+def core_slices(replicas: int, threads: Optional[int] = None, cores: Optional[List[int]] = None) -> List[List[int]]:
+    """`threads` cores per replica (default: split the available cores evenly); disjoint when they fit,
+    otherwise slices wrap around and share cores."""
+    cores = cores or available_cores()
+    threads = threads or max(1, len(cores)//replicas)
+    if replicas*threads > len(cores):
+        log.warning("%d replicas x %d threads > %d cores, replicas will share cores", replicas, threads, len(cores))
+    return [[cores[(i*threads + k) % len(cores)] for k in range(min(threads, len(cores)))] for i in range(replicas)]
+
+def configure_threads(threads: int, cores: Optional[List[int]] = None, torch_global: bool = True):
+    """Pin the calling thread (and threads it starts later) to `cores`; size the OpenCV / torch pools."""
+    if cores:
+        try: os.sched_setaffinity(0, cores)
+        except (AttributeError, OSError): pass
+    import cv2
+    cv2.setNumThreads(threads)
+    if torch_global:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+def _replica_main(conn, model_path: str, conf: float, imgsz: int, threads: int, cores: List[int], ring_name: str,
+                  slots: int, slot_bytes: int):
+    """Worker process: load one model on its core slice and serve requests from the pipe."""
+    os.environ["OMP_NUM_THREADS"] = str(threads)   # before torch is imported
+    configure_threads(threads, cores)
+    try:
+        import torch; torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    from shm_transport import ShmRing
+    from detector import YoloDetector
+    det = YoloDetector(model_path, conf=conf, imgsz=imgsz)
+    ring = ShmRing(ring_name, slots, slot_bytes, create=False)
+    # spawned children share the parent's resource tracker; put back the entry ShmRing dropped
+    from multiprocessing import resource_tracker
+    resource_tracker.register(ring.shm._name, "shared_memory")
+    det.infer(np.zeros((imgsz, imgsz, 3), np.uint8))   # warm-up outside the timed path
+    conn.send(("ready", os.getpid()))
+    while True:
+        msg = conn.recv()
+        if msg[0] == "close": break
+        try:
+            if msg[0] == "infer":
+                _, shape, roi, size = msg
+                out = det.infer(ring.view(0, shape), roi=roi, imgsz=size)
+            elif msg[0] == "infer_arr":
+                _, frame, roi, size = msg
+                out = det.infer(frame, roi=roi, imgsz=size)
+            else:  # "batch"
+                _, shapes, size = msg
+                out = det.infer_batch([ring.view(i, s) for i, s in enumerate(shapes)], imgsz=size)
+            conn.send(("ok", out))
+        except Exception as e:
+            conn.send(("err", repr(e)))
+    ring.shm.close()
+
+class _ProcessReplica:
+    def __init__(self, idx: int, model_path: str, conf: float, imgsz: int, threads: int, cores: List[int],
+                 slots: int = 8, slot_bytes: int = 1920*1080*3):
+        from shm_transport import ShmRing
+        self.idx = idx; self.cores = cores
+        self.ring = ShmRing(slots=slots, slot_bytes=slot_bytes)
+        self.conn, child = mp.get_context("spawn").Pipe()
+        self.proc = mp.get_context("spawn").Process(
+            target=_replica_main, name=f"detector-{idx}", daemon=True,
+            args=(child, model_path, conf, imgsz, threads, cores, self.ring.name, slots, slot_bytes))
+        self.proc.start()
+        while not self.conn.poll(1.0):   # wait for the model to load
+            if not self.proc.is_alive():
+                self.ring.close()
+                raise RuntimeError(f"detector replica {idx} exited during startup (code {self.proc.exitcode})")
+        kind, self.pid = self.conn.recv()
+
+    def _call(self, msg):
+        self.conn.send(msg)
+        kind, out = self.conn.recv()
+        if kind == "err": raise RuntimeError(f"detector replica {self.idx}: {out}")
+        return out
+
+    def infer(self, bgr: np.ndarray, roi=None, imgsz=None):
+        if bgr.nbytes > self.ring.slot_bytes:
+            return self._call(("infer_arr", bgr, roi, imgsz))
+        return self._call(("infer", self.ring.write(0, bgr), roi, imgsz))
+
+    def infer_batch(self, frames: List[np.ndarray], imgsz=None):
+        out = []
+        for i in range(0, len(frames), self.ring.slots):   # a ring's worth per call
+            chunk = frames[i:i+self.ring.slots]
+            if any(f.nbytes > self.ring.slot_bytes for f in chunk):
+                out.extend(self.infer(f, imgsz=imgsz) for f in chunk)
+            else:
+                out.extend(self._call(("batch", [self.ring.write(k, f) for k, f in enumerate(chunk)], imgsz)))
+        return out
+
+    def close(self):
+        try:
+            self.conn.send(("close",)); self.proc.join(timeout=5)
+        except (BrokenPipeError, OSError):
+            pass
+        if self.proc.is_alive(): self.proc.terminate()
+        self.ring.close()
+
+class _ThreadReplica:
+    def __init__(self, idx: int, model_path: str, conf: float, imgsz: int, threads: int, cores: List[int]):
+        from detector import YoloDetector
+        self.idx = idx; self.cores = cores; self.pid = os.getpid()
+        # the worker thread pins itself; OpenMP threads it creates inherit the mask
+        self.exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"detector-{idx}",
+                                       initializer=configure_threads, initargs=(threads, cores, False))
+        self.det = YoloDetector(model_path, conf=conf, imgsz=imgsz)
+
+    def infer(self, bgr, roi=None, imgsz=None):
+        return self.exec.submit(self.det.infer, bgr, roi, imgsz).result()
+
+    def infer_batch(self, frames, imgsz=None):
+        return self.exec.submit(self.det.infer_batch, frames, imgsz).result()
+
+    def close(self):
+        self.exec.shutdown(wait=False)
+
+class DetectorPool:
+    """Drop-in for YoloDetector (infer / infer_batch / imgsz) that spreads calls over replicas."""
+    def __init__(self, model_path: str, conf: float = 0.25, imgsz: int = 640, replicas: int = 2,
+                 threads: Optional[int] = None, mode: str = "process", cores: Optional[List[int]] = None):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"unknown detector pool mode {mode!r}")
+        self.conf = conf; self.imgsz = imgsz; self.mode = mode
+        slices = core_slices(replicas, threads, cores)
+        self.threads = len(slices[0])
+        if mode == "thread":
+            configure_threads(self.threads)   # torch's intra-op pool is process-wide
+            self.replicas = [_ThreadReplica(i, model_path, conf, imgsz, self.threads, c) for i, c in enumerate(slices)]
+        else:
+            self.replicas = [_ProcessReplica(i, model_path, conf, imgsz, self.threads, c) for i, c in enumerate(slices)]
+        self.idle: "queue.Queue" = queue.Queue()
+        for r in self.replicas: self.idle.put(r)
+        self.lock = threading.Lock()
+        self.calls = [0]*len(self.replicas); self.busy_s = [0.0]*len(self.replicas)
+        self.wait_s = 0.0; self.t0 = time.perf_counter()
+
+    def _run(self, method: str, *args):
+        t0 = time.perf_counter()
+        r = self.idle.get()   # FIFO: the replica idle the longest goes first
+        t1 = time.perf_counter()
+        try:
+            return getattr(r, method)(*args)
+        finally:
+            t2 = time.perf_counter()
+            self.idle.put(r)
+            with self.lock:
+                self.calls[r.idx] += 1; self.busy_s[r.idx] += t2 - t1; self.wait_s += t1 - t0
+
+    def infer(self, bgr_frame: np.ndarray, roi: Optional[Tuple[int,int,int,int]] = None,
+              imgsz: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._run("infer", bgr_frame, roi, imgsz)
+
+    def infer_batch(self, bgr_frames: List[np.ndarray], imgsz: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        if not bgr_frames: return []
+        return self._run("infer_batch", bgr_frames, imgsz)
+
+    def stats(self) -> Dict[str, Any]:
+        up = time.perf_counter() - self.t0
+        with self.lock:
+            return {"mode": self.mode, "threads_per_replica": self.threads,
+                    "dispatch_wait_ms_total": round(1000.0*self.wait_s, 1),
+                    "replicas": [{"pid": r.pid, "cores": r.cores, "calls": self.calls[r.idx],
+                                  "utilization": round(self.busy_s[r.idx]/max(up, 1e-9), 3)} for r in self.replicas]}
+
+    def close(self):
+        for r in self.replicas: r.close()
+
+# ---- autotune ----
+def _bench_frames(video: Optional[str], n: int = 64, max_side: int = 720) -> List[np.ndarray]:
+    import cv2
+    from frame_store import open_capture
+    frames = []
+    if video:
+        cap = open_capture(video)   # a video file or a frame store directory
+        while len(frames) < n:
+            ok, f = cap.read()
+            if not ok: break
+            h, w = f.shape[:2]; s = max(h, w)/max_side
+            frames.append(cv2.resize(f, (int(w/s), int(h/s))) if s > 1 else f)
+        cap.release()
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (405, 720, 3), np.uint8) for _ in range(n)]
+    return frames
+
+def bench(pool: DetectorPool, frames: List[np.ndarray], clients: int, duration_s: float) -> Dict[str, Any]:
+    """Closed-loop load: `clients` threads call pool.infer back to back for duration_s."""
+    lat: List[float] = []; lock = threading.Lock()
+    stop = time.perf_counter() + duration_s
+
+    def client(k: int):
+        i = k
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter(); pool.infer(frames[i % len(frames)])
+            with lock: lat.append(time.perf_counter() - t0)
+            i += clients
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as ex:
+        list(ex.map(client, range(clients)))
+    elapsed = time.perf_counter() - t0
+    a = np.array(lat)*1000.0
+    return {"fps": round(len(lat)/elapsed, 2), "p50_ms": round(float(np.percentile(a, 50)), 1),
+            "p99_ms": round(float(np.percentile(a, 99)), 1)}
+
+def autotune(model_path: str, imgsz: int, video: Optional[str], target_p99_ms: float, duration_s: float,
+             mode: str = "process", max_cores: Optional[int] = None) -> Dict[str, Any]:
+    cores = available_cores()[:max_cores] if max_cores else available_cores()
+    frames = _bench_frames(video)
+    rows = []
+    for threads in sorted({t for t in (1, 2, 4, 8, 16) if t <= len(cores)} | {len(cores)}):
+        replicas = len(cores)//threads
+        pool = DetectorPool(model_path, imgsz=imgsz, replicas=replicas, threads=threads, mode=mode, cores=cores)
+        try:
+            bench(pool, frames, replicas, min(2.0, duration_s))   # warm-up
+            res = dict(replicas=replicas, threads=threads, **bench(pool, frames, 2*replicas, duration_s))
+        finally:
+            pool.close()
+        rows.append(res)
+        print(json.dumps(res))
+    ok = [r for r in rows if r["p99_ms"] <= target_p99_ms]
+    best = max(ok or rows, key=lambda r: r["fps"] if ok else -r["p99_ms"])
+    return {"results": rows, "best": best, "meets_target": bool(ok),
+            "env": {"DETECTOR_REPLICAS": best["replicas"], "DETECTOR_THREADS": best["threads"], "DETECTOR_MODE": mode}}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Detector pool autotune: replicas x threads with the best throughput at a p99 target")
+    ap.add_argument("--autotune", action="store_true")
+    ap.add_argument("--model", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "yolov8n.pt"))
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--video", default=None, help="Video or frame store directory to benchmark on (random frames if omitted)")
+    ap.add_argument("--target-p99-ms", type=float, default=150.0)
+    ap.add_argument("--duration", type=float, default=10.0, help="Seconds per configuration")
+    ap.add_argument("--mode", choices=["process", "thread"], default="process")
+    ap.add_argument("--max-cores", type=int, default=None)
+    args = ap.parse_args()
+    if not args.autotune:
+        ap.error("nothing to do (use --autotune)")
+    out = autotune(args.model, args.imgsz, args.video, args.target_p99_ms, args.duration, args.mode, args.max_cores)
+    print("\n=== BEST ===")
+    print(json.dumps({k: out[k] for k in ("best", "meets_target", "env")}, indent=2))
@@ -0,0 +1,93 @@
+# fast_decode.py
+import struct, threading, time
+import cv2, numpy as np
+from typing import Optional, Tuple, List, Dict, Any
+
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+_SOF = {0xC0,0xC1,0xC2,0xC3,0xC5,0xC6,0xC7,0xC9,0xCA,0xCB,0xCD,0xCE,0xCF}
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int,int]]:
+    """(w, h) from the JPEG SOF header without decoding; None if not a (parsable) JPEG."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8: return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF: return None
+        marker = data[i+1]
+        if marker == 0xFF: i += 1; continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7: i += 2; continue
+        seg_len = struct.unpack(">H", data[i+2:i+4])[0]
+        if marker in _SOF:
+            h, w = struct.unpack(">HH", data[i+5:i+9])
+            return w, h
+        i += 2 + seg_len
+    return None
+
+def scale_dets(dets: List[Dict[str, Any]], s: float) -> List[Dict[str, Any]]:
+    """Detections from a frame decoded at 1/s resolution, in full-resolution coordinates."""
+    if s == 1: return dets
+    return [dict(d, xyxy=[v*s for v in d["xyxy"]], center=[v*s for v in d["center"]]) for d in dets]
+
+class ReducedDecoder:
+    """JPEG decode straight at (close to) inference resolution via DCT-domain downscaling.
+
+    Picks the largest 1/2, 1/4 or 1/8 reduction whose long side still covers `imgsz`, so
+    YOLO's own resize never upsamples. Every `sample_every`-th reduced decode also times
+    a full decode to keep a running estimate of the time saved. Safe to share between
+    threadpool workers: decodes run unlocked, only the counters are updated under a lock.
+    """
+    def __init__(self, imgsz: int = 640, sample_every: int = 100):
+        self.imgsz = imgsz; self.sample_every = sample_every
+        self.frames = 0; self.reduced = 0; self.decode_s = 0.0
+        self.full_ms_per_px = None; self.saved_s = 0.0
+        self.lock = threading.Lock()
+
+    def factor(self, w: int, h: int) -> int:
+        for r in (8, 4, 2):
+            if max(w, h) // r >= self.imgsz: return r
+        return 1
+
+    def decode(self, data: bytes) -> Tuple[Optional[np.ndarray], int]:
+        """Return (bgr, r): the frame at 1/r of its encoded resolution."""
+        buf = np.frombuffer(data, np.uint8)
+        size = jpeg_size(data)
+        r = self.factor(*size) if size else 1
+        t0 = time.perf_counter()
+        bgr = cv2.imdecode(buf, REDUCED_FLAGS[r])
+        dt = time.perf_counter() - t0
+        reduced = r > 1 and bgr is not None
+        with self.lock:
+            self.frames += 1; self.decode_s += dt
+            if reduced: self.reduced += 1
+            sample = reduced and (self.full_ms_per_px is None or self.reduced % self.sample_every == 1)
+        if not reduced: return bgr, r
+        full_ms_per_px = None
+        if sample:
+            t1 = time.perf_counter(); cv2.imdecode(buf, cv2.IMREAD_COLOR)
+            full_ms_per_px = (time.perf_counter() - t1) * 1000.0 / (size[0]*size[1])
+        with self.lock:
+            if full_ms_per_px is not None: self.full_ms_per_px = full_ms_per_px
+            if self.full_ms_per_px is not None:   # None only while another worker's first sample runs
+                self.saved_s += max(0.0, self.full_ms_per_px * size[0]*size[1] / 1000.0 - dt)
+        return bgr, r
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            frames, reduced, decode_s, saved_s = self.frames, self.reduced, self.decode_s, self.saved_s
+        return {"frames": frames, "reduced": reduced,
+                "avg_decode_ms": round(1000.0*decode_s/max(frames,1), 3),
+                "est_saved_ms_total": round(1000.0*saved_s, 1)}
+
+class ResizeBuffer:
+    """cv2.resize into a reused output buffer (one allocation per output shape)."""
+    def __init__(self):
+        self.buf: Optional[np.ndarray] = None
+
+    def fit(self, frame: np.ndarray, max_side: int = 720) -> np.ndarray:
+        h, w = frame.shape[:2]
+        scale = max(w, h) / max_side
+        if scale <= 1.0: return frame
+        size = (int(w/scale), int(h/scale))
+        if self.buf is None or self.buf.shape[:2] != (size[1], size[0]) or self.buf.shape[2:] != frame.shape[2:]:
+            self.buf = np.empty((size[1], size[0]) + frame.shape[2:], frame.dtype)
+        return cv2.resize(frame, size, dst=self.buf)
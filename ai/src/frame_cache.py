@@ -0,0 +1,42 @@
+# frame_cache.py
+import cv2, numpy as np
+from typing import Optional, Dict, Any, Union
+
+class FrameChangeDetector:
+    """Near-duplicate frame check on a tiny grayscale thumbnail, done before the full decode.
+
+    The thumbnail comes from a 1/8 DCT-domain JPEG decode, area-resized to `size`. A frame
+    is a hit when no thumbnail cell moved more than `thresh` grey levels from the last
+    frame that went through inference, and that frame is younger than `max_age_s`.
+    Comparing against the last inferred frame (not the previous one) stops slow drift
+    from being reused forever.
+    """
+    def __init__(self, thresh: float = 6.0, max_age_s: float = 1.0, size=(32, 18)):
+        self.thresh = thresh; self.max_age_s = max_age_s; self.size = size
+        self.ref: Optional[np.ndarray] = None
+        self.ref_t: Optional[float] = None
+        self.hits = 0; self.misses = 0
+
+    def thumb(self, frame: Union[bytes, np.ndarray]) -> Optional[np.ndarray]:
+        if isinstance(frame, np.ndarray):  # already decoded (in-process callers)
+            g = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        else:
+            g = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if g is None: return None
+        return cv2.resize(g, self.size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def check(self, frame: Union[bytes, np.ndarray], t: float) -> bool:
+        """True if the previous perception result can be reused for this frame (JPEG bytes or BGR array)."""
+        th = self.thumb(frame)
+        fresh = self.ref_t is not None and 0.0 <= t - self.ref_t <= self.max_age_s
+        if th is not None and fresh and self.ref is not None and th.shape == self.ref.shape \
+                and int(np.abs(th - self.ref).max()) <= self.thresh:
+            self.hits += 1
+            return True
+        self.ref, self.ref_t = th, t
+        self.misses += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits/total, 3) if total else 0.0}
@@ -0,0 +1,176 @@
+# frame_store.py
+"""Decode a video once, at the replay working resolution, into a memory-mapped frame array.
+
+Perception tuning (lane / flow / traffic-light parameters) re-runs the same clip many times;
+reading frames from a store skips video decode and resize entirely, and every process that
+opens the same store shares one page-cached copy. A store is a directory:
+    frames.u8   n x h x w x 3 uint8 BGR, frames back to back
+    t.npy       float64 timestamp per frame (seconds, from the container)
+    meta.json   shape, fps, max_side and the source's path / size / mtime (meta.json is written
+                last, so a store without it is incomplete and gets rebuilt)
+
+    python frame_store.py build data/sample_drive.mp4 cache/sample_drive-720
+    python frame_store.py bench data/sample_drive.mp4 cache/sample_drive-720
+    python -m src.replay_video_only --video data/sample_drive.mp4 --frame-cache cache/
+"""
+import argparse, json, os, shutil, time
+import cv2, numpy as np
+from typing import Optional, Union
+
+META = "meta.json"
+
+def _fit(frame: np.ndarray, max_side: int) -> np.ndarray:
+    h, w = frame.shape[:2]; scale = max(w, h)/max_side
+    return cv2.resize(frame, (int(w/scale), int(h/scale))) if scale > 1.0 else frame   # same as ResizeBuffer.fit
+
+def _source_id(video: str) -> dict:
+    st = os.stat(video)
+    return {"source": os.path.abspath(video), "source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+STORE_FILES = {META, "frames.u8", "t.npy"}
+
+def _clear(out_dir: str):
+    """Remove an old (possibly incomplete) store; refuse to delete a directory that isn't one."""
+    if not os.path.exists(out_dir): return
+    names = set(os.listdir(out_dir)) if os.path.isdir(out_dir) else None
+    if names is None or not (names <= STORE_FILES and (not names or names & {META, "frames.u8"})):
+        raise FileExistsError(f"{out_dir} exists and is not a frame store; not overwriting it")
+    shutil.rmtree(out_dir)
+
+def build(video: str, out_dir: str, max_side: int = 720) -> "FrameStore":
+    """Decode `video` once into a store at `out_dir` (replacing an existing store there)."""
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened(): raise IOError(f"cannot open {video}")
+    _clear(out_dir)
+    os.makedirs(out_dir)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    ts = []; shape = None
+    with open(os.path.join(out_dir, "frames.u8"), "wb") as f:
+        while True:
+            ok, frame = cap.read()
+            if not ok: break
+            frame = np.ascontiguousarray(_fit(frame, max_side))
+            if shape is None: shape = frame.shape
+            elif frame.shape != shape: raise ValueError(f"frame {len(ts)} is {frame.shape}, expected {shape}")
+            pos = cap.get(cv2.CAP_PROP_POS_MSEC)
+            ts.append(pos/1000.0 if pos > 0 or not ts else len(ts)/fps)
+            f.write(frame.data)
+    cap.release()
+    if shape is None: raise ValueError(f"no frames decoded from {video}")
+    np.save(os.path.join(out_dir, "t.npy"), np.asarray(ts, np.float64))
+    with open(os.path.join(out_dir, META), "w") as f:
+        json.dump(dict(_source_id(video), count=len(ts), shape=list(shape), fps=fps, max_side=max_side), f)
+    return FrameStore(out_dir)
+
+class FrameStore:
+    """Read-only view of a store; frames[i] is an (h, w, 3) uint8 array backed by the page cache.
+
+    Frames are read-only: every reader shares the page-cached file, so callers that draw on a
+    frame (HUD overlays) copy it first.
+    """
+    def __init__(self, path: str):
+        with open(os.path.join(path, META)) as f:
+            self.meta = json.load(f)
+        self.path = path; self.fps = float(self.meta["fps"])
+        self.shape = tuple(self.meta["shape"])
+        self.frames = np.memmap(os.path.join(path, "frames.u8"), np.uint8, mode="r",
+                                shape=(self.meta["count"],) + self.shape)
+        self.t = np.load(os.path.join(path, "t.npy"))
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.frames[i]
+
+    def index_at(self, t: float) -> int:
+        """Frame shown at time t (the last one whose timestamp is <= t)."""
+        return max(0, int(np.searchsorted(self.t, t, side="right")) - 1)
+
+    def matches(self, video: str, max_side: int) -> bool:
+        try: src = _source_id(video)
+        except OSError: return False
+        return self.meta.get("max_side") == max_side and all(self.meta.get(k) == v for k, v in src.items())
+
+    @classmethod
+    def cached(cls, video: str, cache_dir: str, max_side: int = 720) -> "FrameStore":
+        """The store for `video` under cache_dir, built on first use and rebuilt when the video changes."""
+        path = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(video))[0]}-{max_side}")
+        if os.path.exists(os.path.join(path, META)):
+            store = cls(path)
+            if store.matches(video, max_side): return store
+        return build(video, path, max_side)
+
+class StoreCapture:
+    """cv2.VideoCapture stand-in over a FrameStore: read() hands out read-only frames in place (no copy)."""
+    def __init__(self, store: FrameStore, start: int = 0, stop: Optional[int] = None):
+        self.store = store; self.pos = start
+        self.stop = len(store) if stop is None else min(stop, len(store))
+
+    def isOpened(self) -> bool:
+        return self.store is not None
+
+    def read(self):
+        if self.store is None or self.pos >= self.stop: return False, None
+        frame = self.store.frames[self.pos]; self.pos += 1
+        return True, frame
+
+    def get(self, prop: int) -> float:
+        s = self.store
+        if prop == cv2.CAP_PROP_FPS: return s.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT: return float(len(s))
+        if prop == cv2.CAP_PROP_POS_FRAMES: return float(self.pos)
+        if prop == cv2.CAP_PROP_POS_MSEC: return 1000.0*float(s.t[self.pos-1]) if self.pos else 0.0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH: return float(s.shape[1])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT: return float(s.shape[0])
+        return 0.0
+
+    def set(self, prop: int, value: float) -> bool:
+        if prop == cv2.CAP_PROP_POS_FRAMES: self.pos = max(0, min(int(value), len(self.store))); return True
+        if prop == cv2.CAP_PROP_POS_MSEC: self.pos = self.store.index_at(value/1000.0); return True
+        return False
+
+    def release(self):
+        self.store = None
+
+def open_capture(source: Union[str, int], cache_dir: Optional[str] = None, max_side: int = 720):
+    """VideoCapture-like source: a store directory, a video (through the store cache when
+    cache_dir is set) or a camera index."""
+    if isinstance(source, int): return cv2.VideoCapture(source)
+    if os.path.isdir(source) and os.path.exists(os.path.join(source, META)): return StoreCapture(FrameStore(source))
+    if cache_dir: return StoreCapture(FrameStore.cached(source, cache_dir, max_side))
+    return cv2.VideoCapture(source)
+
+def bench(video: str, store: FrameStore) -> dict:
+    """Per-frame cost of getting a working-resolution frame (plus a grayscale pass, so pages are touched)."""
+    cap = cv2.VideoCapture(video); n = 0; t0 = time.perf_counter()
+    while True:
+        ok, f = cap.read()
+        if not ok: break
+        cv2.cvtColor(_fit(f, store.meta["max_side"]), cv2.COLOR_BGR2GRAY); n += 1
+    decode_ms = 1000.0*(time.perf_counter() - t0)/max(n, 1)
+    src = StoreCapture(store); m = 0; t0 = time.perf_counter()
+    while True:
+        ok, f = src.read()
+        if not ok: break
+        cv2.cvtColor(f, cv2.COLOR_BGR2GRAY); m += 1
+    store_ms = 1000.0*(time.perf_counter() - t0)/max(m, 1)
+    return {"frames": m, "decode_resize_ms": round(decode_ms, 3), "store_ms": round(store_ms, 3),
+            "speedup": round(decode_ms/max(store_ms, 1e-9), 1)}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Decoded-frame stores for repeated replays")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("build", help="decode a video into a store"); p.add_argument("video"); p.add_argument("out")
+    p.add_argument("--max-side", type=int, default=720)
+    p = sub.add_parser("info", help="summarize a store"); p.add_argument("store")
+    p = sub.add_parser("bench", help="video decode + resize vs store reads"); p.add_argument("video"); p.add_argument("store")
+    args = ap.parse_args()
+    if args.cmd == "build":
+        t0 = time.perf_counter(); s = build(args.video, args.out, args.max_side)
+        print(f"{len(s)} frames {s.shape} in {time.perf_counter()-t0:.1f}s -> {args.out} ({s.frames.nbytes/2**20:.0f} MiB)")
+    elif args.cmd == "info":
+        s = FrameStore(args.store)
+        print(json.dumps(dict(s.meta, duration_s=round(float(s.t[-1] - s.t[0]), 3) if len(s) else 0.0)))
+    else:
+        print(json.dumps(bench(args.video, FrameStore(args.store))))
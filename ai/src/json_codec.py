@@ -0,0 +1,49 @@
+# json_codec.py
+"""JSON for the per-frame hot path: orjson if installed, else msgspec, else the stdlib json module.
+
+JSON_CODEC=json|orjson|msgspec picks one explicitly (e.g. to compare them with bench_hotpath.py).
+All backends write compact output, accept str or bytes, convert numpy scalars / arrays, and raise
+json.JSONDecodeError on bad input, so callers can keep their existing except clauses.
+"""
+import json, os
+import numpy as np
+
+def _default(obj):
+    if isinstance(obj, np.generic): return obj.item()
+    if isinstance(obj, np.ndarray): return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+def _stdlib():
+    enc = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default).encode
+    return json.loads, lambda obj: enc(obj).encode()
+
+def _orjson():
+    import orjson
+    opts = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    return orjson.loads, lambda obj: orjson.dumps(obj, default=_default, option=opts)  # orjson's error subclasses JSONDecodeError
+
+def _msgspec():
+    import msgspec
+    dec = msgspec.json.Decoder().decode; enc = msgspec.json.Encoder(enc_hook=_default).encode
+    def loads(s):
+        try: return dec(s)
+        except msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), s if isinstance(s, str) else s.decode(errors="replace"), 0) from None
+    return loads, enc
+
+_BACKENDS = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+def pick(name: str = ""):
+    """(name, loads, dumps) for one backend; empty name = the fastest one installed."""
+    if name:
+        return (name, *_BACKENDS[name]())
+    for name in ("orjson", "msgspec"):
+        try: return (name, *_BACKENDS[name]())
+        except ImportError: pass
+    return ("json", *_stdlib())
+
+NAME, loads, dumps = pick(os.getenv("JSON_CODEC", ""))   # dumps -> bytes
+
+def dumps_str(obj) -> str:
+    """For text WebSocket messages and form fields."""
+    return dumps(obj).decode()
@@ -1,6 +1,7 @@
 # lane_simple.py
 import cv2, numpy as np
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Union
+from .pyramid import FramePyramid, as_pyramid, ref_scale, odd
 
 def _roi_mask(img: np.ndarray) -> np.ndarray:
     h, w = img.shape[:2]
@@ -16,7 +17,7 @@ def _roi_mask(img: np.ndarray) -> np.ndarray:
 
 def _fit_line(points):
     if len(points) < 2: return None
-    vx, vy, x0, y0 = cv2.fitLine(np.array(points, np.float32), cv2.DIST_L2,0,0.01,0.01)
+    vx, vy, x0, y0 = cv2.fitLine(np.array(points, np.float32), cv2.DIST_L2,0,0.01,0.01).ravel()
     return float(vx), float(vy), float(x0), float(y0)
 
 def _x_at_y(line, y):
@@ -26,20 +27,29 @@ def _x_at_y(line, y):
     t = (y - y0) / vy
     return x0 + vx * t
 
-def estimate_lane_offset_m(bgr: np.ndarray, lane_width_m: float = 3.7):
-    """Return (offset_m, dbg) where + is right of center; None if cannot estimate."""
-    h, w = bgr.shape[:2]
-    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5,5), 0)
-    edges = cv2.Canny(blur, 60, 150)
+def estimate_lane_offset_m(src: Union[np.ndarray, FramePyramid], lane_width_m: float = 3.7, work_side: Optional[int] = None):
+    """Return (offset_m, dbg) where + is right of center; None if cannot estimate.
+
+    Runs on the pyramid level with long side work_side (None = frame resolution); pixel
+    parameters are tuned at 720 px and scaled to the level, dbg is in frame pixels.
+    """
+    pyr = as_pyramid(src)
+    gray = pyr.gray(work_side)
+    h, w = gray.shape[:2]; s = ref_scale(gray)
+    k = odd(5*s)
+    blur = cv2.GaussianBlur(gray, (k,k), 0)
+    # texture gradients grow as pixels get bigger (~1/s) while sharp marking edges don't; meet halfway
+    g = s**-0.5
+    edges = cv2.Canny(blur, 60*g, 150*g)
     edges = _roi_mask(edges)
 
-    lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=60, minLineLength=40, maxLineGap=50)
+    lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=max(10, round(60*s)),
+                            minLineLength=40*s, maxLineGap=50*s)
     left_pts, right_pts = [], []
     cx = w/2
 
     if lines is not None:
-        for x1,y1,x2,y2 in lines[:,0,:]:
+        for x1,y1,x2,y2 in lines.reshape(-1,4):  # (N,1,4) in OpenCV 4, (N,4) in 5
             if y2==y1: continue
             slope = (x2-x1)/(y2-y1)
             if abs(slope) < 0.2:  # reject near-horizontal
@@ -53,7 +63,8 @@ def estimate_lane_offset_m(bgr: np.ndarray, lane_width_m: float = 3.7):
     xl = _x_at_y(L, y_eval) if L else None
     xr = _x_at_y(R, y_eval) if R else None
 
-    dbg = {"xl": xl, "xr": xr, "y_eval": y_eval}
+    up = 1.0 / pyr.scale(gray)
+    dbg = {"xl": None if xl is None else xl*up, "xr": None if xr is None else xr*up, "y_eval": int(y_eval*up)}
     if xl is None or xr is None or xr <= xl: return (None, dbg)
 
     lane_center_x = 0.5*(xl + xr)
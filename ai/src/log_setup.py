@@ -0,0 +1,80 @@
+# log_setup.py
+"""Level-gated, non-blocking logging for the frame loop (stdlib logging underneath).
+
+    log = configure("backend")
+    log.debug("inference result %s", result, extra={"session": sid})
+
+Records go through a bounded queue to one writer thread, which formats and writes them, so a
+disabled level costs one isEnabledFor check and an enabled one never waits on stderr. Message
+formatting (the %-args) also happens on the writer thread; a full queue drops records instead of
+blocking (counted in stats()). LOG_LEVEL (default INFO) and LOG_FORMAT (text | json: one object
+per line with the `extra` fields as keys) configure it.
+"""
+import atexit, json, logging, os, queue, sys, time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# attributes every LogRecord has; anything else came in through extra={...}
+_STD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+def _fields(record: logging.LogRecord) -> Dict[str, object]:
+    return {k: v for k, v in vars(record).items() if k not in _STD}
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record):
+        s = super().format(record)
+        extra = _fields(record)
+        return s + "".join(f" {k}={v}" for k, v in extra.items()) if extra else s
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {"ts": round(record.created, 6), "level": record.levelname, "logger": record.name,
+               "msg": record.getMessage()}
+        out.update(_fields(record))
+        if record.exc_info: out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+class _Handoff(QueueHandler):
+    """Enqueue the record as is (the stock prepare() formats on the caller's thread) and never block."""
+    def __init__(self, q):
+        super().__init__(q); self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try: self.queue.put_nowait(record)
+        except queue.Full: self.dropped += 1
+
+_handoff: Optional[_Handoff] = None
+_listener: Optional[QueueListener] = None
+
+def configure(process: str, level: Optional[str] = None, fmt: Optional[str] = None, max_queue: int = 10000) -> logging.Logger:
+    """Logger `process`, writing to stderr through the background thread (set up once per process)."""
+    global _handoff, _listener
+    log = logging.getLogger(process)
+    log.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    if _listener is None:
+        out = logging.StreamHandler(sys.stderr)
+        out.setFormatter(JsonFormatter() if (fmt or os.getenv("LOG_FORMAT", "text")) == "json" else TextFormatter())
+        _handoff = _Handoff(queue.Queue(max_queue))
+        _listener = QueueListener(_handoff.queue, out, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)   # drains what is queued
+    if _handoff not in log.handlers:
+        log.addHandler(_handoff); log.propagate = False
+    return log
+
+def stats() -> Dict[str, int]:
+    return {"queued": _handoff.queue.qsize() if _handoff else 0, "dropped": _handoff.dropped if _handoff else 0}
+
+if __name__ == "__main__":
+    log = configure("demo")
+    log.info("hello %s", "world", extra={"session": "s1", "seq": 3})
+    log.debug("not shown at INFO")
+    t0 = time.perf_counter()
+    for i in range(10000): log.debug("frame %d", i)
+    print(f"disabled debug: {(time.perf_counter()-t0)/10000*1e9:.0f} ns/call", file=sys.stderr)
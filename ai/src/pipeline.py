@@ -0,0 +1,82 @@
+# pipeline.py
+import cv2, time, queue, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, Iterable, Tuple, Optional
+import numpy as np
+from .fast_decode import ResizeBuffer
+
+Frame = Tuple[int, float, np.ndarray]   # (index, t seconds since start, bgr)
+
+def read_frames(cap, max_side: int = 720, reuse_buffer: bool = True, video_time: bool = False) -> Iterator[Frame]:
+    """Frames from a cv2.VideoCapture-like source, downscaled to max_side.
+
+    With reuse_buffer the same output array is overwritten every frame, which is only
+    safe when each frame is fully consumed before the next one is read. t is wall time
+    since the first read, or with video_time the frame's position in the file (for runs
+    faster or slower than real time).
+    """
+    resize = ResizeBuffer() if reuse_buffer else None
+    t0 = time.time(); idx = 0
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    while True:
+        ok, frame = cap.read()
+        if not ok: break
+        if resize is not None:
+            frame = resize.fit(frame, max_side)
+        else:
+            h, w = frame.shape[:2]; scale = max(w, h)/max_side
+            if scale > 1.0: frame = cv2.resize(frame, (int(w/scale), int(h/scale)))
+        yield idx, (idx / fps if video_time else time.time() - t0), frame
+        idx += 1
+
+def prefetch(frames: Iterable[Frame], maxsize: int = 8) -> Iterator[Frame]:
+    """Run capture + decode on a background thread, handing frames over through a bounded queue."""
+    q: "queue.Queue" = queue.Queue(maxsize=maxsize)
+    done = object(); stop = threading.Event()
+
+    def worker():
+        try:
+            for item in frames:
+                while not stop.is_set():
+                    try: q.put(item, timeout=0.1); break
+                    except queue.Full: continue
+                if stop.is_set(): return
+        finally:
+            q.put(done)
+
+    th = threading.Thread(target=worker, name="prefetch", daemon=True); th.start()
+    try:
+        while (item := q.get()) is not done:
+            yield item
+    finally:
+        stop.set()
+
+def run_inline(frames: Iterable[Frame], stages: Dict[str, Callable[[np.ndarray], Any]]) -> Iterator[Tuple[Frame, Dict[str, Any]]]:
+    """Reference sequential executor: every stage, one after another, per frame."""
+    for item in frames:
+        yield item, {name: fn(item[2]) for name, fn in stages.items()}
+
+def run_pipelined(frames: Iterable[Frame], stages: Dict[str, Callable[[np.ndarray], Any]],
+                  depth: int = 4, prefetch_size: int = 8) -> Iterator[Tuple[Frame, Dict[str, Any]]]:
+    """Stage-parallel executor with in-order output.
+
+    Each stage gets its own single worker thread, so stages of the same frame run
+    concurrently while each stage still sees frames in order (stateful stages such as
+    optical flow stay correct). Up to `depth` frames are in flight; together with the
+    bounded prefetch queue this caps memory. Throughput tends to the slowest stage as
+    long as the stages release the GIL (OpenCV, torch).
+    """
+    execs = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"stage-{name}") for name in stages}
+    inflight: deque = deque()
+    try:
+        for item in prefetch(frames, prefetch_size):
+            inflight.append((item, {name: execs[name].submit(fn, item[2]) for name, fn in stages.items()}))
+            if len(inflight) >= depth:
+                head, futs = inflight.popleft()
+                yield head, {name: f.result() for name, f in futs.items()}
+        while inflight:
+            head, futs = inflight.popleft()
+            yield head, {name: f.result() for name, f in futs.items()}
+    finally:
+        for ex in execs.values(): ex.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,52 @@
+# pyramid.py
+import threading
+import cv2, numpy as np
+from typing import Dict, Optional, Union
+
+REF_SIDE = 720   # long side the lane / flow pixel parameters were tuned at
+
+class FramePyramid:
+    """Grayscale pyramid of one frame, shared by the lane and flow estimators.
+
+    Levels are built on first use only: the full-resolution gray image, then pyrDown octaves
+    down to the first one still covering the requested size, then one INTER_AREA resize to the
+    exact long side. Every level is cached, so estimators asking for the same working size share
+    one image. Safe to use from several pipeline stage threads at once.
+    """
+    def __init__(self, bgr: np.ndarray):
+        self.bgr = bgr
+        self.shape = bgr.shape
+        self.long_side = max(bgr.shape[:2])
+        self.octaves: list = []                       # gray at full, 1/2, 1/4, ... resolution
+        self.levels: Dict[int, np.ndarray] = {}       # long side -> gray
+        self.lock = threading.Lock()
+
+    def gray(self, max_side: Optional[int] = None) -> np.ndarray:
+        """Gray image with long side min(max_side, frame long side)."""
+        side = self.long_side if not max_side else min(max_side, self.long_side)
+        with self.lock:
+            g = self.levels.get(side)
+            if g is not None: return g
+            if not self.octaves: self.octaves.append(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+            while (max(self.octaves[-1].shape) + 1) // 2 >= side:   # next octave still covers side
+                self.octaves.append(cv2.pyrDown(self.octaves[-1]))
+            base = next(o for o in reversed(self.octaves) if max(o.shape) >= side)   # smallest that covers it
+            if max(base.shape) != side:
+                h, w = base.shape; f = side / max(h, w)
+                base = cv2.resize(base, (max(1, round(w*f)), max(1, round(h*f))), interpolation=cv2.INTER_AREA)
+            self.levels[side] = base
+            return base
+
+    def scale(self, level: np.ndarray) -> float:
+        """level size / frame size."""
+        return max(level.shape[:2]) / self.long_side
+
+def as_pyramid(src: Union[np.ndarray, FramePyramid]) -> FramePyramid:
+    return src if isinstance(src, FramePyramid) else FramePyramid(src)
+
+def ref_scale(level: np.ndarray) -> float:
+    """Pixel parameters tuned at REF_SIDE are multiplied by this at `level`'s size."""
+    return max(level.shape[:2]) / REF_SIDE
+
+def odd(x: float, lo: int = 3) -> int:
+    return max(lo, int(round(x)) | 1)
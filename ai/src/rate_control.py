@@ -0,0 +1,53 @@
+# rate_control.py
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any
+from rules import Telemetry
+
+@dataclass
+class RateConfig:
+    min_hz: float = 2.0           # calm scene (parked, open road, centred in lane)
+    max_hz: float = 15.0          # safety-critical: low TTC or cues active
+    urgent_ttc_s: float = 2.0     # TTC at/below this -> max rate
+    calm_ttc_s: float = 6.0       # TTC at/above this counts as calm
+    lane_calm_m: float = 0.2
+    calm_hold_s: float = 1.5      # calm must persist this long before rate drops
+
+class AdaptiveRate:
+    """Per-session inference rate: jumps to max_hz on urgency, decays to min_hz once calm."""
+    def __init__(self, cfg: Optional[RateConfig] = None):
+        self.cfg = cfg or RateConfig()
+        self.hz = self.cfg.max_hz
+        self.last_infer_t: Optional[float] = None
+        self.calm_since: Optional[float] = None
+        self.inferred = 0; self.skipped = 0
+
+    def should_infer(self, t: float) -> bool:
+        if self.last_infer_t is None or t < self.last_infer_t or t - self.last_infer_t >= 1.0/self.hz - 1e-3:
+            self.last_infer_t = t; self.inferred += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def update(self, tel: Telemetry, ttc: Optional[float], cues: List[Dict[str,Any]]) -> float:
+        c = self.cfg
+        urgency = 0.0
+        if cues or tel.collision or (tel.in_stop_zone and tel.tl_state == "red"):
+            urgency = 1.0
+        if ttc is not None:
+            urgency = max(urgency, min(1.0, max(0.0, (c.calm_ttc_s - ttc) / max(c.calm_ttc_s - c.urgent_ttc_s, 1e-3))))
+        if tel.speed_mps > tel.speed_limit_mps:
+            urgency = max(urgency, 0.5)
+        if tel.lane_offset_m is not None and abs(tel.lane_offset_m) > c.lane_calm_m:
+            urgency = max(urgency, 0.5)
+
+        target = c.min_hz + urgency * (c.max_hz - c.min_hz)
+        if target >= self.hz:  # rise immediately
+            self.hz = target; self.calm_since = None
+        else:                  # fall only after the scene has stayed calmer for calm_hold_s
+            if self.calm_since is None: self.calm_since = tel.t
+            if tel.t - self.calm_since >= c.calm_hold_s: self.hz = target
+        return self.hz
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hz": round(self.hz, 2), "inferred": self.inferred, "skipped": self.skipped}
@@ -1,6 +1,9 @@
-import cv2, time, math, numpy as np
+import argparse, cv2, time, math, numpy as np
 from .detector import YoloDetector, estimate_lead_distance_px
 from .rules import ScoringState, Telemetry
+from .fast_decode import ResizeBuffer
+from .video_export import VideoExporter, draw_hud, export_paths
+from .frame_store import open_capture
 
 VIDEO_PATH = "src/sample_drive.mp4"
 IMG_SIZE = 640
@@ -24,44 +27,54 @@ def px_to_ttc(px_proxy: float|None, speed_mps: float) -> float|None:
     k=40.0; dist=k*px_proxy; return dist/max(speed_mps,0.1)
 
 def main():
-    cap=cv2.VideoCapture(VIDEO_PATH); 
+    ap=argparse.ArgumentParser()
+    ap.add_argument("--export", metavar="OUT.mp4", help="headless: write the HUD video here and per-frame signals/cues to OUT.jsonl")
+    ap.add_argument("--frame-cache", metavar="DIR", help="decode the video once into a frame store under DIR and replay from it")
+    ap.add_argument("--no-overlay", action="store_true", help="skip HUD drawing (with --export only the JSONL is written; without it, no window)")
+    args=ap.parse_args()
+    cap=open_capture(VIDEO_PATH, args.frame_cache)
     if not cap.isOpened(): raise SystemExit(f"Cannot open {VIDEO_PATH}")
     det=YoloDetector("yolov8n.pt", conf=0.25, imgsz=IMG_SIZE)
     scorer=ScoringState()
     frame_period=1.0/FPS_INFER; next_tick=time.time(); t0=time.time()
+    resize=ResizeBuffer()
+    exporter=VideoExporter(*export_paths(args.export), fps=FPS_INFER, overlay=not args.no_overlay) if args.export else None
+    # live: paced at FPS_INFER on the wall clock; headless: as fast as possible on the same FPS_INFER timeline
+    live=exporter is None and not args.no_overlay
+    idx=0
 
     while True:
-        now=time.time()
-        if now<next_tick: time.sleep(max(0.0, next_tick-now))
-        next_tick+=frame_period
+        if live:
+            now=time.time()
+            if now<next_tick: time.sleep(max(0.0, next_tick-now))
+            next_tick+=frame_period
         ok, frame=cap.read()
         if not ok: break
-        h,w=frame.shape[:2]; scale=max(w,h)/720
-        if scale>1.0: frame=cv2.resize(frame,(int(w/scale),int(h/scale)))
+        frame=resize.fit(frame, 720)
 
         dets=det.infer(frame)
         lead_proxy=estimate_lead_distance_px(dets, frame.shape)
 
-        t=time.time()-t0
+        t=time.time()-t0 if live else idx*frame_period
         tel=synthetic_telemetry(t)
         ttc=px_to_ttc(lead_proxy, tel.speed_mps)
 
-        cues=scorer.step(tel, ttc)
+        cues=scorer.step(tel, ttc, now=t)
 
-        for d in dets:
-            x1,y1,x2,y2=map(int,d["xyxy"])
-            cv2.rectangle(frame,(x1,y1),(x2,y2),(0,255,0),2)
-            cv2.putText(frame,f"{d['cls_name']} {d['conf']:.2f}",(x1,max(12,y1-6)),cv2.FONT_HERSHEY_SIMPLEX,0.45,(0,255,0),1)
+        hud=dict(dets=dets, cues=cues[:2],
+                 text=f"spd={tel.speed_mps*2.236:.1f}mph lim={tel.speed_limit_mps*2.236:.0f}  lane={tel.lane_offset_m:+.2f}m  TTC={'{:.2f}s'.format(ttc) if ttc else 'NA'}")
+        if exporter is not None:
+            exporter.submit(frame, hud, {"frame": idx, "t": round(t,4), "speed_mps": tel.speed_mps, "lane_offset_m": tel.lane_offset_m,
+                                         "ttc": ttc, "tl_state": tel.tl_state, "detections": len(dets),
+                                         "cues": [[c["cue"], round(c["level"],3)] for c in cues]})
+        elif live:
+            cv2.imshow("Scoring Replay (q to quit)", draw_hud(frame.copy(), **hud))   # frame may be a read-only store page
+            if cv2.waitKey(1)&0xFF==ord('q'): break
+        idx+=1
 
-        hud=f"spd={tel.speed_mps*2.236:.1f}mph lim={tel.speed_limit_mps*2.236:.0f}  lane={tel.lane_offset_m:+.2f}m  TTC={'{:.2f}s'.format(ttc) if ttc else 'NA'}"
-        cv2.putText(frame,hud,(10,22),cv2.FONT_HERSHEY_SIMPLEX,0.55,(50,200,255),2)
-        y=45
-        for cue in cues[:2]:
-            cv2.putText(frame,f"CUE: {cue['cue']} {cue['level']:.2f}",(10,y),cv2.FONT_HERSHEY_SIMPLEX,0.6,(0,0,255),2); y+=22
-        cv2.imshow("Scoring Replay (q to quit)", frame)
-        if cv2.waitKey(1)&0xFF==ord('q'): break
-
-    cap.release(); cv2.destroyAllWindows()
+    cap.release()
+    if live: cv2.destroyAllWindows()
+    if exporter is not None: print("export:", exporter.close())
     print("\n=== SCORECARD ===")
     print(scorer.finalize())
 
@@ -1,55 +1,78 @@
 # replay_video_only.py
 import argparse, cv2, time
+from functools import partial
 from .detector import YoloDetector
 from .rules import ScoringState, Telemetry
-from .video_only import FlowSpeedEstimator, LeadTTC, classify_traffic_light_color, pick_lead_vehicle
+from .video_only import FlowSpeedEstimator, classify_traffic_light_color, pick_lead_vehicle
+from .ttc_engine import LoomingTTCEngine
 from .lane_simple import estimate_lane_offset_m
+from .pipeline import read_frames, run_inline, run_pipelined
+from .video_export import VideoExporter, draw_hud, export_paths
+from .frame_store import open_capture
+from .pyramid import FramePyramid
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--video", default="data/sample_drive.mp4", help="path or 0 for webcam")
+parser.add_argument("--video", default="data/sample_drive.mp4", help="path, frame store directory, or 0 for webcam")
+parser.add_argument("--frame-cache", metavar="DIR", help="decode the video once into a frame store under DIR and replay from it")
 parser.add_argument("--limit_mph", type=float, default=30.0, help="assumed speed limit for demo")
 parser.add_argument("--scale_k", type=float, default=2.5, help="optical flow scale to m/s")
+parser.add_argument("--pipeline", action="store_true", help="prefetch capture and run detector/flow/lane stages concurrently")
+parser.add_argument("--depth", type=int, default=4, help="frames in flight with --pipeline")
+parser.add_argument("--work-side", type=int, default=0, help="long side (px) lane + flow run at on the shared pyramid (0 = frame size)")
+parser.add_argument("--export", metavar="OUT.mp4", help="headless: write the HUD video here and per-frame signals/cues to OUT.jsonl")
+parser.add_argument("--no-overlay", action="store_true", help="skip HUD drawing (with --export only the JSONL is written; without it, no window)")
 args = parser.parse_args()
 VIDEO_PATH = 0 if args.video == "0" else args.video
 SPEED_LIMIT_MPS = args.limit_mph * 0.44704
 
 det = YoloDetector("yolov8n.pt", conf=0.25, imgsz=640)
 scorer = ScoringState()
-flow_speed = FlowSpeedEstimator(scale_k=args.scale_k)
-lead_ttc = LeadTTC()
+flow_speed = FlowSpeedEstimator(scale_k=args.scale_k, work_side=args.work_side or None)
+ttc_engine = LoomingTTCEngine()
 
-cap = cv2.VideoCapture(VIDEO_PATH)
+cap = open_capture(VIDEO_PATH, args.frame_cache)
 if not cap.isOpened():
     raise SystemExit(f"Cannot open {VIDEO_PATH}")
 
-t0 = time.time()
-
-while True:
-    ok, frame = cap.read()
-    if not ok: break
-
-    # Downscale lightly for speed
-    h,w = frame.shape[:2]
-    scale = max(w,h)/720
-    if scale > 1.0:
-        frame = cv2.resize(frame, (int(w/scale), int(h/scale)))
-
-    t = time.time() - t0
-
+exporter = None
+if args.export:
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    exporter = VideoExporter(*export_paths(args.export), fps=fps, overlay=not args.no_overlay)
+show = exporter is None and not args.no_overlay
+# headless runs go as fast as the pipeline allows, so scoring follows the video clock instead of the wall clock
+
+def with_pyramid(frames):
+    """Stages get a FramePyramid, so lane and flow share one gray image per working size."""
+    for idx, t, frame in frames:
+        yield idx, t, FramePyramid(frame)
+
+# Perception stages; each sees frames in order, so the pipelined executor can overlap them
+stages = {"dets": lambda pyr: det.infer(pyr.bgr), "speed": flow_speed.step,
+          "lane": partial(estimate_lane_offset_m, work_side=args.work_side or None)}
+if args.pipeline:
+    # frames stay in flight across stages, so each one needs its own buffer
+    results = run_pipelined(with_pyramid(read_frames(cap, 720, reuse_buffer=False, video_time=not show)), stages, depth=args.depth)
+else:
+    # Downscale lightly for speed (into a reused buffer)
+    results = run_inline(with_pyramid(read_frames(cap, 720, video_time=not show)), stages)
+
+for (idx, t, pyr), out in results:
+    frame = pyr.bgr
     # Perception
-    dets = det.infer(frame)
+    dets = out["dets"]
     lead_box = pick_lead_vehicle(dets, frame.shape)
 
     # Derived signals from video
-    speed_mps = flow_speed.step(frame)                         # relative m/s
-    lane_off_m, lane_dbg = estimate_lane_offset_m(frame)       # may be None
+    speed_mps = out["speed"]                                   # relative m/s
+    lane_off_m, lane_dbg = out["lane"]                         # may be None
     tl_crop = None
     for d in dets:
         if d["cls_name"] == "traffic light":
             tl_crop = frame[int(d["xyxy"][1]):int(d["xyxy"][3]), int(d["xyxy"][0]):int(d["xyxy"][2])]
             break
     tl_state = classify_traffic_light_color(tl_crop)           # 'red'|'green'|None
-    ttc = lead_ttc.step(lead_box, t)                           # seconds, or None
+    tracks = ttc_engine.step(dets, t)                          # every tracked vehicle
+    ttc = ttc_engine.min_ttc(frame.shape)                      # seconds, or None
 
     # Build Telemetry from estimates
     tel = Telemetry(
@@ -66,35 +89,27 @@ while True:
     )
 
     # Update scoring & get sticky cues
-    scorer.step(tel, ttc)
-    display_cues = scorer.get_display_cues()
-
-    # ---- HUD overlays (debug) ----
-    for d in dets:
-        x1,y1,x2,y2 = map(int, d["xyxy"])
-        cv2.rectangle(frame,(x1,y1),(x2,y2),(0,255,0),2)
-        cv2.putText(frame, f"{d['cls_name']} {d['conf']:.2f}", (x1,max(12,y1-6)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.45,(0,255,0),1)
-    if lead_box:
-        x1,y1,x2,y2 = map(int, lead_box)
-        cv2.rectangle(frame,(x1,y1),(x2,y2),(255,200,0),2)
+    scorer.step(tel, ttc, now=t)
+    display_cues = scorer.get_display_cues(now=t)
 
+    # ---- HUD overlays (debug) ----; drawn on the export thread when exporting
     spd_txt = f"spd≈{speed_mps*2.236:.1f}mph (video) lim={SPEED_LIMIT_MPS*2.236:.0f}"
     lane_txt = f"lane={lane_off_m:+.2f}m" if lane_off_m is not None else "lane=NA"
     ttc_txt = f"TTC={ttc:.2f}s" if ttc is not None else "TTC=NA"
     light_txt = f"light={tl_state or 'NA'}"
-    cv2.putText(frame, f"{spd_txt}  {lane_txt}  {ttc_txt}  {light_txt}", (10,22),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.55,(50,200,255),2)
-
-    y=46
-    for cue in display_cues:
-        cv2.putText(frame, f"CUE: {cue['cue']} {cue['level']:.2f}", (10,y),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.65,(0,0,255),2)
-        y+=24
-
-    cv2.imshow("Video-only Scoring (q to quit)", frame)
-    if cv2.waitKey(1)&0xFF==ord('q'): break
-
-cap.release(); cv2.destroyAllWindows()
+    hud = dict(dets=dets, text=f"{spd_txt}  {lane_txt}  {ttc_txt}  {light_txt}", cues=display_cues,
+               lead_box=lead_box, tracks=tracks)
+
+    if exporter is not None:
+        exporter.submit(frame, hud, {"frame": idx, "t": round(t, 4), "speed_mps": speed_mps, "lane_offset_m": lane_off_m,
+                                     "ttc": ttc, "tl_state": tl_state, "lead_box": lead_box, "detections": len(dets),
+                                     "cues": [[c["cue"], round(c["level"], 3)] for c in display_cues]})
+    elif show:
+        cv2.imshow("Video-only Scoring (q to quit)", draw_hud(frame.copy(), **hud))   # frame may be a read-only store page
+        if cv2.waitKey(1)&0xFF==ord('q'): break
+
+cap.release()
+if show: cv2.destroyAllWindows()
+if exporter is not None: print("export:", exporter.close())
 print("\n=== SCORECARD (video-only) ===")
 print(scorer.finalize())
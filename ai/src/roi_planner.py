@@ -0,0 +1,55 @@
+# roi_planner.py
+import math
+from typing import List, Dict, Any, Optional, Tuple
+from detector import COCO
+
+VEHICLES = {COCO["car"],COCO["bus"],COCO["truck"],COCO["motorcycle"],COCO["bicycle"]}
+SIGNALS = {COCO["traffic light"],COCO["stop sign"]}
+
+def _ceil32(x: float) -> int:
+    return int(math.ceil(x/32.0))*32
+
+class CorridorPlanner:
+    """Chooses a per-frame crop + imgsz for YoloDetector.infer from the previous frame's detections.
+
+    The crop is the forward corridor (a bit wider than the 0.22*w lead band used by
+    estimate_lead_distance_px) unioned with the last traffic lights / stop signs.
+    imgsz keeps the full-frame pixel density inside the crop, and shrinks further when
+    every object of interest is large enough to survive it. Every `full_every` frames
+    (or whenever there is nothing to follow) a full-frame pass picks up new objects.
+    """
+    def __init__(self, base_imgsz: int = 640, band: float = 0.30, top: float = 0.30,
+                 margin: float = 0.15, full_every: int = 10, min_obj_px: float = 24.0, min_imgsz: int = 160):
+        self.base_imgsz = base_imgsz; self.band = band; self.top = top; self.margin = margin
+        self.full_every = full_every; self.min_obj_px = min_obj_px; self.min_imgsz = min_imgsz
+        self.frames = 0; self.full_passes = 0
+
+    def plan(self, frame_shape: Tuple[int,...], prev: Optional[List[Dict[str, Any]]]
+             ) -> Tuple[Optional[Tuple[int,int,int,int]], int]:
+        """Return (roi or None for full frame, imgsz)."""
+        h, w = frame_shape[:2]
+        self.frames += 1
+        follow = [d for d in (prev or []) if d["cls_id"] in VEHICLES or d["cls_id"] in SIGNALS]
+        if not follow or (self.frames - 1) % self.full_every == 0:
+            self.full_passes += 1
+            return None, self.base_imgsz
+
+        x1, y1 = w/2 - self.band*w, self.top*h
+        x2, y2 = w/2 + self.band*w, float(h)
+        for d in follow:
+            bx1,by1,bx2,by2 = d["xyxy"]
+            if d["cls_id"] in VEHICLES and abs((bx1+bx2)/2 - w/2) >= self.band*w: continue
+            mx, my = self.margin*(bx2-bx1), self.margin*(by2-by1)
+            x1 = min(x1, bx1-mx); y1 = min(y1, by1-my); x2 = max(x2, bx2+mx); y2 = max(y2, by2+my)
+        roi = (max(0,int(x1)), max(0,int(y1)), min(w,int(math.ceil(x2))), min(h,int(math.ceil(y2))))
+
+        # same density as the full pass, or coarser if the smallest followed object allows it
+        scale = self.base_imgsz / max(h, w)
+        smallest = min(min(d["xyxy"][2]-d["xyxy"][0], d["xyxy"][3]-d["xyxy"][1]) for d in follow)
+        scale = min(scale, self.min_obj_px / max(smallest, 1.0))
+        long_side = max(roi[2]-roi[0], roi[3]-roi[1])
+        imgsz = max(self.min_imgsz, min(self.base_imgsz, _ceil32(long_side*scale)))
+        return roi, imgsz
+
+    def stats(self) -> Dict[str, Any]:
+        return {"frames": self.frames, "full_passes": self.full_passes}
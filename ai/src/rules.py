@@ -1,9 +1,10 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
 from typing import Optional, Dict, Any, List
-import time
+import math, time
+import numpy as np
 
-@dataclass
+@dataclass(slots=True)
 class Telemetry:
     t: float
     speed_mps: float
@@ -16,6 +17,32 @@ class Telemetry:
     in_stop_zone: Optional[bool]=None
     collision: bool=False
 
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Telemetry":
+        """Validate + coerce one decoded telemetry object; ValueError names the bad field."""
+        if not isinstance(d, dict): raise ValueError("telemetry must be a JSON object")
+        try:
+            vals = [_num(d[k], k) for k in _REQUIRED]
+        except KeyError as e:
+            raise ValueError(f"telemetry field {e} is required") from None
+        lane = d.get("lane_offset_m"); tl = d.get("tl_state"); stop = d.get("in_stop_zone")
+        if tl is not None and not isinstance(tl, str): raise ValueError("telemetry field 'tl_state' must be a string")
+        return cls(*vals, None if lane is None else _num(lane, "lane_offset_m"), tl,
+                   None if stop is None else _flag(stop, "in_stop_zone"), _flag(d.get("collision", False), "collision"))
+
+_REQUIRED = ("t", "speed_mps", "speed_limit_mps", "throttle", "brake", "steer_deg")
+_FLAGS = {True: True, False: False, 1: True, 0: False, "true": True, "false": False, "1": True, "0": False}
+
+def _num(v, name: str) -> float:
+    if isinstance(v, float): return v
+    if isinstance(v, bool) or v is None: raise ValueError(f"telemetry field '{name}' must be a number")
+    try: return float(v)
+    except (TypeError, ValueError): raise ValueError(f"telemetry field '{name}' must be a number") from None
+
+def _flag(v, name: str) -> bool:
+    try: return _FLAGS[v.lower() if isinstance(v, str) else v]
+    except (KeyError, TypeError): raise ValueError(f"telemetry field '{name}' must be a boolean") from None
+
 @dataclass
 class CuesConfig:
     # thresholds with hysteresis
@@ -39,6 +66,26 @@ class CuesConfig:
 class ScoreWeights:
     speeding: float=0.25; lane: float=0.25; headway: float=0.20; smooth: float=0.15; compliance: float=0.15
 
+def score_from_tallies(total_time: float, over_speed_time: float, out_lane_time: float, ttc_bad_time: float,
+                       harsh_events: int, red_violations: int, collisions: int,
+                       weights: Optional[ScoreWeights]=None) -> Dict[str,Any]:
+    """Subscores + weighted final score from tallies (a whole session or any window of one)."""
+    w=weights or ScoreWeights()
+    eps=1e-6
+    speeding_pen=min(25.0, 100.0*(over_speed_time/max(total_time,eps)))
+    lane_pen=min(25.0, 100.0*(out_lane_time/max(total_time,eps)))
+    headway_pen=min(25.0, 100.0*(ttc_bad_time/max(total_time,eps)))
+    smooth_pen=min(25.0, harsh_events*5.0)
+    compliance_pen=min(25.0, red_violations*10.0 + collisions*10.0)
+    subs={"speeding":max(0,100-speeding_pen),"lane":max(0,100-lane_pen),
+          "headway":max(0,100-headway_pen),"smooth":max(0,100-smooth_pen),
+          "compliance":max(0,100-compliance_pen)}
+    final=(subs["speeding"]*w.speeding + subs["lane"]*w.lane +
+           subs["headway"]*w.headway + subs["smooth"]*w.smooth +
+           subs["compliance"]*w.compliance)
+    return {"subscores":subs,"final":round(final,1),
+            "violations":{"red_light":red_violations,"collisions":collisions}}
+
 @dataclass
 class ScoringState:
     cfg: CuesConfig=field(default_factory=CuesConfig)
@@ -55,7 +102,11 @@ class ScoringState:
     last_emit_ts: Dict[str,float]=field(default_factory=dict)
     active_cues: Dict[str,Dict[str,float]]=field(default_factory=dict)  # name -> {level, until}
 
-    def step(self, tel: Telemetry, lead_ttc_s: Optional[float]) -> List[Dict[str,Any]]:
+    # optional rolling per-window tallies (see ScoreTimeline)
+    timeline: Optional[ScoreTimeline]=None
+
+    def step(self, tel: Telemetry, lead_ttc_s: Optional[float], now: Optional[float]=None) -> List[Dict[str,Any]]:
+        now=time.time() if now is None else now
         if self.last_t is None:
             self.last_t=tel.t; self.last_brake=tel.brake
             return []
@@ -67,76 +118,68 @@ class ScoringState:
         over_clear= tel.speed_mps > tel.speed_limit_mps + self.cfg.speed_margin_clear_mps
         if over_warn:
             self.over_speed_time+=dt
-            self._activate_cue("SLOW_DOWN", level=min(1.0,(tel.speed_mps - (tel.speed_limit_mps+self.cfg.speed_margin_warn_mps))/5.0))
+            self._activate_cue("SLOW_DOWN", level=min(1.0,(tel.speed_mps - (tel.speed_limit_mps+self.cfg.speed_margin_warn_mps))/5.0), now=now)
         else:
             if over_clear:
-                self._extend_if_active("SLOW_DOWN", self.cfg.sustain_after_clear_s)
+                self._extend_if_active("SLOW_DOWN", self.cfg.sustain_after_clear_s, now=now)
 
         # 2) Lane keeping (hysteresis)
         if tel.lane_offset_m is not None:
             off = abs(tel.lane_offset_m)
             if off > self.cfg.lane_offset_warn_m:
                 self.out_lane_time+=dt
-                self._activate_cue("KEEP_LANE", level=min(1.0,(off - self.cfg.lane_offset_warn_m)/0.5))
+                self._activate_cue("KEEP_LANE", level=min(1.0,(off - self.cfg.lane_offset_warn_m)/0.5), now=now)
             elif off > self.cfg.lane_offset_clear_m:
-                self._extend_if_active("KEEP_LANE", self.cfg.sustain_after_clear_s)
+                self._extend_if_active("KEEP_LANE", self.cfg.sustain_after_clear_s, now=now)
 
         # 3) Headway / TTC (hysteresis)
         if lead_ttc_s is not None:
             if lead_ttc_s < self.cfg.ttc_warn_s:
                 self.ttc_bad_time+=dt
                 lvl=max(0.3,min(1.0,(self.cfg.ttc_warn_s-lead_ttc_s)/self.cfg.ttc_warn_s))
-                self._activate_cue("INCREASE_HEADWAY", level=lvl)
+                self._activate_cue("INCREASE_HEADWAY", level=lvl, now=now)
             elif lead_ttc_s < self.cfg.ttc_clear_s:
-                self._extend_if_active("INCREASE_HEADWAY", self.cfg.sustain_after_clear_s)
+                self._extend_if_active("INCREASE_HEADWAY", self.cfg.sustain_after_clear_s, now=now)
 
         # 4) Harsh braking
         if self.last_brake is not None and dt>0:
             db=tel.brake-self.last_brake
             if db/max(dt,1e-3) > self.cfg.harsh_brake_thresh*10:
                 self.harsh_events+=1
-                self._activate_cue("SMOOTHER_BRAKE", level=min(1.0, db))
+                self._activate_cue("SMOOTHER_BRAKE", level=min(1.0, db), now=now)
 
         # 5) Compliance
         if tel.in_stop_zone and tel.tl_state=="red" and tel.speed_mps>0.5:
             self.red_violations+=1
-            self._activate_cue("BRAKE_NOW", level=1.0)
+            self._activate_cue("BRAKE_NOW", level=1.0, now=now)
 
         if tel.collision: self.collisions+=1
 
         self.last_t=tel.t; self.last_brake=tel.brake
-        self._prune_expired()
+        if self.timeline is not None: self.timeline.record(tel.t, self)
+        self._prune_expired(now)
 
         # Return the display cues instead of empty list
-        return self.get_display_cues()
+        return self.get_display_cues(now)
 
-    def get_display_cues(self) -> List[Dict[str,Any]]:
-        now=time.time()
-        self._prune_expired()
+    def get_display_cues(self, now: Optional[float]=None) -> List[Dict[str,Any]]:
+        now=time.time() if now is None else now
+        self._prune_expired(now)
         items=[{"cue":k,"level":v["level"],"t_emit":now} for k,v in self.active_cues.items() if v["until"]>now]
         items.sort(key=lambda x: x["level"], reverse=True)
         return items[:self.cfg.max_concurrent_cues]
 
+    def tallies(self) -> tuple:
+        return (self.total_time, self.over_speed_time, self.out_lane_time, self.ttc_bad_time,
+                self.harsh_events, self.red_violations, self.collisions)
+
     def finalize(self)->Dict[str,Any]:
-        eps=1e-6
-        speeding_pen=min(25.0, 100.0*(self.over_speed_time/max(self.total_time,eps)))
-        lane_pen=min(25.0, 100.0*(self.out_lane_time/max(self.total_time,eps)))
-        headway_pen=min(25.0, 100.0*(self.ttc_bad_time/max(self.total_time,eps)))
-        smooth_pen=min(25.0, self.harsh_events*5.0)
-        compliance_pen=min(25.0, self.red_violations*10.0 + self.collisions*10.0)
-        subs={"speeding":max(0,100-speeding_pen),"lane":max(0,100-lane_pen),
-              "headway":max(0,100-headway_pen),"smooth":max(0,100-smooth_pen),
-              "compliance":max(0,100-compliance_pen)}
-        final=(subs["speeding"]*self.weights.speeding + subs["lane"]*self.weights.lane +
-               subs["headway"]*self.weights.headway + subs["smooth"]*self.weights.smooth +
-               subs["compliance"]*self.weights.compliance)
-        return {"subscores":subs,"final":round(final,1),
-                "violations":{"red_light":self.red_violations,"collisions":self.collisions}}
+        return score_from_tallies(*self.tallies(), weights=self.weights)
 
     # ---- cue helpers ----
-    def _activate_cue(self, name:str, level:float):
-        now=time.time()
-        last=self.last_emit_ts.get(name, 0.0)
+    def _activate_cue(self, name:str, level:float, now: Optional[float]=None):
+        now=time.time() if now is None else now
+        last=self.last_emit_ts.get(name, -math.inf)   # never emitted: no cooldown, even at now=0
         if now-last < self.cfg.cue_cooldown_s and name not in self.active_cues:
             return
         self.last_emit_ts[name]=now
@@ -149,12 +192,241 @@ class ScoringState:
         else:
             self.active_cues[name]={"level":level, "until": now + self.cfg.min_display_s}
 
-    def _extend_if_active(self, name:str, extra_s:float):
-        now=time.time()
+    def _extend_if_active(self, name:str, extra_s:float, now: Optional[float]=None):
+        now=time.time() if now is None else now
         if name in self.active_cues:
             self.active_cues[name]["until"]=max(self.active_cues[name]["until"], now + extra_s)
 
-    def _prune_expired(self):
-        now=time.time()
+    def _prune_expired(self, now: Optional[float]=None):
+        now=time.time() if now is None else now
         for k in [k for k,v in self.active_cues.items() if v["until"]<=now]:
             del self.active_cues[k]
+
+
+class ScoreTimeline:
+    """Rolling-window scores without keeping telemetry.
+
+    A ring of `horizon_s / bucket_s` rows holds the cumulative tallies at the end of each
+    bucket of telemetry time; a window's tallies are "now minus the row at its start", so
+    window() is O(1) and memory is fixed. Each step's increment is attributed to the bucket
+    of its own t. Windows reaching past the horizon are truncated (see span_s).
+    """
+    def __init__(self, bucket_s: float=1.0, horizon_s: float=600.0):
+        self.bucket_s=bucket_s
+        self.n=max(2, int(round(horizon_s/bucket_s)))
+        self.ring=np.zeros((self.n, 7), np.float64)
+        self.cur=np.zeros(7, np.float64)   # cumulative tallies as of the last record()
+        self.first_b: Optional[int]=None; self.cur_b: Optional[int]=None
+
+    def record(self, t: float, st: ScoringState):
+        b=int(t//self.bucket_s)
+        if self.cur_b is None:
+            self.first_b=self.cur_b=b
+        elif b>self.cur_b:
+            # close buckets cur_b .. b-1 at the previous cumulative value (only the last n matter)
+            for k in range(max(self.cur_b, b-self.n), b):
+                self.ring[k % self.n]=self.cur
+            self.cur_b=b
+        self.cur[:]=st.tallies()
+
+    def window_tallies(self, seconds: float) -> tuple:
+        """(tallies over the last `seconds` incl. the current bucket, covered span in seconds)."""
+        if self.cur_b is None: return np.zeros(7), 0.0
+        k=max(1, int(round(seconds/self.bucket_s)))
+        start=self.cur_b-k                      # bucket closed just before the window
+        oldest=self.cur_b-self.n+1              # oldest closed bucket still in the ring
+        if start<self.first_b:
+            # window starts before the session did; the "before" tallies were zeros
+            return self.cur.copy(), (self.cur_b-self.first_b+1)*self.bucket_s
+        start=max(start, oldest)
+        return self.cur-self.ring[start % self.n], (self.cur_b-start)*self.bucket_s
+
+    def window(self, seconds: float, weights: Optional[ScoreWeights]=None) -> Dict[str,Any]:
+        d, span=self.window_tallies(seconds)
+        out=score_from_tallies(*(float(x) for x in d[:4]), *(int(round(x)) for x in d[4:]), weights=weights)
+        out["span_s"]=span
+        return out
+
+    def series(self, every_s: float, weights: Optional[ScoreWeights]=None) -> List[Dict[str,Any]]:
+        """Scores of consecutive `every_s` windows (e.g. each minute) back to the horizon, oldest first."""
+        if self.cur_b is None: return []
+        k=max(1, int(round(every_s/self.bucket_s)))
+        lo=max(self.first_b-1, self.cur_b-self.n+1)
+        out=[]
+        hi=self.cur_b
+        while hi>lo:
+            start=max(hi-k, lo)
+            end_row=self.cur if hi==self.cur_b else self.ring[hi % self.n]
+            start_row=np.zeros(7) if start<self.first_b else self.ring[start % self.n]
+            d=end_row-start_row
+            sc=score_from_tallies(*(float(x) for x in d[:4]), *(int(round(x)) for x in d[4:]), weights=weights)
+            sc["t_start"]=(start+1)*self.bucket_s; sc["t_end"]=(hi+1)*self.bucket_s
+            out.append(sc)
+            hi=start
+        return out[::-1]
+
+
+# ---- struct-of-arrays bank: many sessions stepped in one vectorized call ----
+CUE_NAMES = ("SLOW_DOWN", "KEEP_LANE", "INCREASE_HEADWAY", "SMOOTHER_BRAKE", "BRAKE_NOW")  # order cues are raised in step()
+SLOW, LANE, HEADWAY, SMOOTH, BRAKE = range(len(CUE_NAMES))
+
+class ScoringBank:
+    """ScoringState for many sessions at once: tallies, previous values and cue timers live in
+    numpy arrays indexed by session slot, and step() advances a batch of slots together with one
+    clock reading. Given the same `now`, results match ScoringState.step() exactly (same float
+    ops, same cue order including ties, which follow dict insertion order there).
+    """
+    def __init__(self, capacity: int=256, cfg: Optional[CuesConfig]=None, weights: Optional[ScoreWeights]=None):
+        self.cfg=cfg or CuesConfig(); self.weights=weights or ScoreWeights()
+        self.capacity=0; self.free: List[int]=[]; self.n_steps=0
+        self._grow(max(1, capacity))
+
+    def _grow(self, capacity: int):
+        nc=len(CUE_NAMES); old=self.capacity
+        def ext(name, shape, dtype, fill):
+            a=np.full(shape, fill, dtype)
+            if old: a[:old]=getattr(self, name)
+            setattr(self, name, a)
+        for name in ("total_time", "over_speed_time", "out_lane_time", "ttc_bad_time", "last_t", "last_brake"):
+            ext(name, capacity, np.float64, 0.0)
+        for name in ("harsh_events", "red_violations", "collisions"):
+            ext(name, capacity, np.int64, 0)
+        ext("started", capacity, bool, False)     # last_t / last_brake are set
+        ext("present", (capacity, nc), bool, False)  # cue is in active_cues (possibly expired, not yet pruned)
+        ext("level", (capacity, nc), np.float64, 0.0)
+        ext("until", (capacity, nc), np.float64, 0.0)
+        ext("last_emit", (capacity, nc), np.float64, -np.inf)   # never emitted
+        ext("born", (capacity, nc), np.int64, 0)  # insertion order into active_cues
+        self.free.extend(range(capacity-1, old-1, -1))
+        self.capacity=capacity
+
+    def alloc(self) -> int:
+        if not self.free: self._grow(2*self.capacity)
+        return self.free.pop()
+
+    def release(self, slot: int):
+        for name in ("total_time", "over_speed_time", "out_lane_time", "ttc_bad_time", "last_t", "last_brake",
+                     "harsh_events", "red_violations", "collisions", "started", "present", "level", "until",
+                     "born"):
+            getattr(self, name)[slot]=0
+        self.last_emit[slot]=-np.inf
+        self.free.append(slot)
+
+    def step(self, slots, tels: List[Telemetry], ttcs: List[Optional[float]], now: Optional[float]=None) -> List[List[Dict[str,Any]]]:
+        """Step each slot with its telemetry / lead TTC; returns each slot's display cues."""
+        nan=float("nan")
+        return self.step_arrays(
+            slots,
+            t=np.array([x.t for x in tels], np.float64),
+            speed=np.array([x.speed_mps for x in tels], np.float64),
+            limit=np.array([x.speed_limit_mps for x in tels], np.float64),
+            brake=np.array([x.brake for x in tels], np.float64),
+            lane=np.array([nan if x.lane_offset_m is None else x.lane_offset_m for x in tels], np.float64),
+            red_in_zone=np.array([bool(x.in_stop_zone) and x.tl_state=="red" for x in tels], bool),
+            collision=np.array([bool(x.collision) for x in tels], bool),
+            ttc=np.array([nan if v is None else v for v in ttcs], np.float64),
+            now=now)
+
+    def step_arrays(self, slots, t, speed, limit, brake, lane, red_in_zone, collision, ttc,
+                    now: Optional[float]=None) -> List[List[Dict[str,Any]]]:
+        """Vectorized step; lane / ttc use NaN for "unknown". Each slot may appear once per call."""
+        now=time.time() if now is None else now
+        slots=np.asarray(slots, np.int64)
+        if len(np.unique(slots))!=len(slots):
+            raise ValueError("a slot can only be stepped once per batch")
+        cfg=self.cfg; self.n_steps+=1
+
+        # first frame of a session only records t / brake (no cues)
+        first=~self.started[slots]
+        fs=slots[first]
+        self.last_t[fs]=t[first]; self.last_brake[fs]=brake[first]; self.started[fs]=True
+        run=~first
+        s=slots[run]; t=t[run]; speed=speed[run]; limit=limit[run]; brake=brake[run]
+        lane=lane[run]; red_in_zone=red_in_zone[run]; collision=collision[run]; ttc=ttc[run]
+
+        dt=np.maximum(0.0, t-self.last_t[s]); self.total_time[s]+=dt
+
+        # 1) speeding
+        over_warn=speed > limit + cfg.speed_margin_warn_mps
+        over_clear=speed > limit + cfg.speed_margin_clear_mps
+        self.over_speed_time[s]+=np.where(over_warn, dt, 0.0)
+        self._activate(s, SLOW, over_warn, np.minimum(1.0, (speed - (limit+cfg.speed_margin_warn_mps))/5.0), now)
+        self._extend(s, SLOW, ~over_warn & over_clear, cfg.sustain_after_clear_s, now)
+
+        # 2) lane keeping (NaN compares False)
+        off=np.abs(lane)
+        lane_warn=off > cfg.lane_offset_warn_m
+        self.out_lane_time[s]+=np.where(lane_warn, dt, 0.0)
+        self._activate(s, LANE, lane_warn, np.minimum(1.0, (off - cfg.lane_offset_warn_m)/0.5), now)
+        self._extend(s, LANE, ~lane_warn & (off > cfg.lane_offset_clear_m), cfg.sustain_after_clear_s, now)
+
+        # 3) headway / TTC
+        ttc_warn=ttc < cfg.ttc_warn_s
+        self.ttc_bad_time[s]+=np.where(ttc_warn, dt, 0.0)
+        self._activate(s, HEADWAY, ttc_warn, np.maximum(0.3, np.minimum(1.0, (cfg.ttc_warn_s-ttc)/cfg.ttc_warn_s)), now)
+        self._extend(s, HEADWAY, ~ttc_warn & (ttc < cfg.ttc_clear_s), cfg.sustain_after_clear_s, now)
+
+        # 4) harsh braking
+        db=brake-self.last_brake[s]
+        with np.errstate(invalid="ignore"):
+            harsh=(dt>0) & (db/np.maximum(dt, 1e-3) > cfg.harsh_brake_thresh*10)
+        self.harsh_events[s]+=harsh
+        self._activate(s, SMOOTH, harsh, np.minimum(1.0, db), now)
+
+        # 5) compliance
+        red=red_in_zone & (speed>0.5)
+        self.red_violations[s]+=red
+        self._activate(s, BRAKE, red, np.ones_like(speed), now)
+        self.collisions[s]+=collision
+
+        self.last_t[s]=t; self.last_brake[s]=brake
+        self.present[s]&=self.until[s]>now
+
+        out: List[List[Dict[str,Any]]]=[[] for _ in range(len(slots))]
+        for i, cues in zip(np.flatnonzero(run), self._display(s, now)):
+            out[i]=cues
+        return out
+
+    def _activate(self, s, c: int, mask, level, now: float):
+        present=self.present[s, c]
+        ok=mask & ~((now-self.last_emit[s, c] < self.cfg.cue_cooldown_s) & ~present)
+        if not ok.any(): return
+        s=s[ok]; present=present[ok]
+        level=np.maximum(0.0, np.minimum(1.0, level[ok]))
+        a=self.cfg.level_ema_alpha
+        self.last_emit[s, c]=now
+        self.level[s, c]=np.where(present, a*level + (1-a)*self.level[s, c], level)
+        self.until[s, c]=np.where(present, np.maximum(self.until[s, c], now + self.cfg.min_display_s), now + self.cfg.min_display_s)
+        self.born[s, c]=np.where(present, self.born[s, c], self.n_steps*len(CUE_NAMES) + c)
+        self.present[s, c]=True
+
+    def _extend(self, s, c: int, mask, extra_s: float, now: float):
+        s=s[mask & self.present[s, c]]
+        self.until[s, c]=np.maximum(self.until[s, c], now + extra_s)
+
+    def _display(self, s, now: float) -> List[List[Dict[str,Any]]]:
+        """Top cues per slot: level descending, ties in insertion order (as ScoringState sorts its dict)."""
+        vis=self.present[s] & (self.until[s]>now)
+        lvl=self.level[s]
+        order=np.lexsort((self.born[s], np.where(vis, -lvl, np.inf)))[:, :self.cfg.max_concurrent_cues]
+        rows=[]
+        for r, idx in enumerate(order):
+            rows.append([{"cue": CUE_NAMES[c], "level": float(lvl[r, c]), "t_emit": now} for c in idx if vis[r, c]])
+        return rows
+
+    def to_state(self, slot: int) -> ScoringState:
+        """One slot as a ScoringState (for finalize, or to hand a session back to the scalar path)."""
+        st=ScoringState(cfg=self.cfg, weights=self.weights,
+                        total_time=float(self.total_time[slot]), over_speed_time=float(self.over_speed_time[slot]),
+                        out_lane_time=float(self.out_lane_time[slot]), ttc_bad_time=float(self.ttc_bad_time[slot]),
+                        harsh_events=int(self.harsh_events[slot]), red_violations=int(self.red_violations[slot]),
+                        collisions=int(self.collisions[slot]))
+        if self.started[slot]:
+            st.last_t=float(self.last_t[slot]); st.last_brake=float(self.last_brake[slot])
+        st.last_emit_ts={n: float(self.last_emit[slot, c]) for c, n in enumerate(CUE_NAMES) if np.isfinite(self.last_emit[slot, c])}
+        for c in sorted(np.flatnonzero(self.present[slot]), key=lambda c: self.born[slot, c]):
+            st.active_cues[CUE_NAMES[c]]={"level": float(self.level[slot, c]), "until": float(self.until[slot, c])}
+        return st
+
+    def finalize(self, slot: int) -> Dict[str,Any]:
+        return self.to_state(slot).finalize()
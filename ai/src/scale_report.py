@@ -0,0 +1,81 @@
+# scale_report.py
+"""Accuracy vs working scale for the pyramid-based lane offset and flow speed estimators.
+
+Every frame (at the replays' <=720 px working size) gets one FramePyramid; the estimators run
+at each requested long side against the full-size run as reference:
+
+    python -m src.scale_report --video data/sample_drive.mp4 --sides 540,360,270,180
+    python -m src.scale_report --video cache/sample_drive-720 --json scale_report.json   # frame store
+
+Lane: agreement (both found / both not found), MAE and p95 of the offset where both found it.
+Flow: MAE in m/s, MAE relative to the mean reference speed, correlation with the reference.
+Times are per frame and include building that side's pyramid level.
+"""
+import argparse, json, time
+import numpy as np
+from .frame_store import open_capture
+from .pipeline import read_frames
+from .pyramid import FramePyramid
+from .lane_simple import estimate_lane_offset_m
+from .video_only import FlowSpeedEstimator
+
+def run(video: str, sides, max_frames: int = 0, scale_k: float = 2.5):
+    cap = open_capture(video)
+    if not cap.isOpened(): raise SystemExit(f"Cannot open {video}")
+    runs = [None] + list(sides)            # None = frame resolution (reference)
+    flows = {s: FlowSpeedEstimator(scale_k, work_side=s) for s in runs}
+    lane = {s: [] for s in runs}; speed = {s: [] for s in runs}
+    t_lane = {s: 0.0 for s in runs}; t_flow = {s: 0.0 for s in runs}
+    ref_side = None; n = 0
+    for idx, t, frame in read_frames(cap, 720, video_time=True):
+        if max_frames and n >= max_frames: break
+        pyr = FramePyramid(frame); ref_side = pyr.long_side
+        for s in runs:
+            t0 = time.perf_counter(); off, _ = estimate_lane_offset_m(pyr, work_side=s); t1 = time.perf_counter()
+            v = flows[s].step(pyr); t2 = time.perf_counter()
+            lane[s].append(np.nan if off is None else off); speed[s].append(v)
+            t_lane[s] += t1 - t0; t_flow[s] += t2 - t1
+        n += 1
+    cap.release()
+    if not n: raise SystemExit("no frames")
+
+    L0 = np.array(lane[None]); V0 = np.array(speed[None])[1:]   # the first flow step has no previous frame
+    rows = []
+    for s in runs:
+        L = np.array(lane[s]); V = np.array(speed[s])[1:]
+        both = ~np.isnan(L) & ~np.isnan(L0); err = np.abs(L - L0)[both]
+        verr = np.abs(V - V0)
+        side = ref_side if s is None else min(s, ref_side)
+        rows.append({
+            "side": side, "pixels": round((side/ref_side)**2, 3),
+            "lane_ms": round(1000*t_lane[s]/n, 3), "flow_ms": round(1000*t_flow[s]/n, 3),
+            "lane_found": round(float((~np.isnan(L)).mean()), 3),
+            "lane_agree": round(float((np.isnan(L) == np.isnan(L0)).mean()), 3),
+            "lane_mae_m": round(float(err.mean()), 4) if err.size else None,
+            "lane_p95_m": round(float(np.percentile(err, 95)), 4) if err.size else None,
+            "speed_mae_mps": round(float(verr.mean()), 4) if V.size else None,
+            "speed_rel_mae": round(float(verr.mean() / max(np.abs(V0).mean(), 1e-9)), 4) if V.size else None,
+            "speed_corr": round(float(np.corrcoef(V, V0)[0, 1]), 4) if V.size > 2 and V.std() > 0 and V0.std() > 0 else None,
+        })
+    return {"video": str(video), "frames": n, "reference_side": ref_side, "rows": rows}
+
+def print_table(rep):
+    print(f"{rep['frames']} frames, reference = {rep['reference_side']} px")
+    cols = ["side", "pixels", "lane_ms", "flow_ms", "lane_found", "lane_agree", "lane_mae_m", "lane_p95_m",
+            "speed_mae_mps", "speed_rel_mae", "speed_corr"]
+    print("  ".join(f"{c:>13s}" for c in cols))
+    for r in rep["rows"]:
+        print("  ".join(f"{'-' if r[c] is None else r[c]!s:>13s}" for c in cols))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Lane / flow accuracy vs pyramid working scale")
+    ap.add_argument("--video", required=True, help="video file or frame store directory")
+    ap.add_argument("--sides", default="540,360,270,180", help="working long sides to compare (px)")
+    ap.add_argument("--frames", type=int, default=0, help="stop after this many frames (0 = all)")
+    ap.add_argument("--scale_k", type=float, default=2.5)
+    ap.add_argument("--json", help="also write the report here")
+    args = ap.parse_args()
+    rep = run(args.video, [int(s) for s in args.sides.split(",") if s.strip()], args.frames, args.scale_k)
+    print_table(rep)
+    if args.json:
+        with open(args.json, "w") as f: json.dump(rep, f, indent=2)
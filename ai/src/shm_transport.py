@@ -0,0 +1,150 @@
+# shm_transport.py
+"""Co-located frame transport: frames live in a shared-memory ring, only slot/shape/telemetry
+travel over a Unix socket as JSON lines.
+
+Gateway side (backend/app.py, livekit_backend.py):
+    client = ShmClient("/tmp/crashcourse-infer.sock"); await client.connect()
+    result = await client.infer(bgr, telemetry_str, session_id)
+Inference side (api.py, when SHM_SOCKET is set):
+    await serve_shm(path, handler)   # handler(view, telemetry_str, session_id, trace_id) -> dict
+"""
+import asyncio, os, uuid
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Tuple, Dict, Any, Callable, Awaitable
+from json_codec import loads, dumps
+
+class ShmRing:
+    """Fixed-size slots in one SharedMemory block; slot i starts at i*slot_bytes."""
+    def __init__(self, name: Optional[str] = None, slots: int = 8, slot_bytes: int = 1920*1080*3, create: bool = True):
+        self.slots = slots; self.slot_bytes = slot_bytes; self.owner = create
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name or f"cc_{uuid.uuid4().hex[:12]}", create=True,
+                                                  size=slots*slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # attaching registers the block with this process's resource tracker, which would
+            # unlink it when we exit; only the creating gateway owns its lifetime
+            try: resource_tracker.unregister(self.shm._name, "shared_memory")
+            except Exception: pass
+        self.name = self.shm.name
+
+    def view(self, slot: int, shape: Tuple[int,...], dtype=np.uint8) -> np.ndarray:
+        """ndarray over the slot's bytes, no copy. Valid until the slot is reused."""
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if not 0 <= slot < self.slots or nbytes > self.slot_bytes:
+            raise ValueError(f"bad slot {slot} or frame of {nbytes} bytes > slot_bytes={self.slot_bytes}")
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot*self.slot_bytes)
+
+    def write(self, slot: int, arr: np.ndarray) -> Tuple[int,...]:
+        np.copyto(self.view(slot, arr.shape, arr.dtype), arr)
+        return arr.shape
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            try: self.shm.unlink()
+            except FileNotFoundError: pass
+
+class ShmClient:
+    """Gateway-side client. Pipelines up to `slots` frames; a slot is reused only after its reply.
+
+    The slot goes back to the free list when the server answers that request (result or error),
+    not when the caller stops waiting: a cancelled or timed-out infer() leaves the slot with the
+    server until its reply arrives, so a frame still being read is never overwritten.
+    """
+    def __init__(self, path: str, slots: int = 8, slot_bytes: int = 1920*1080*3):
+        self.path = path; self.ring = ShmRing(slots=slots, slot_bytes=slot_bytes)
+        self.reader: Optional[asyncio.StreamReader] = None; self.writer: Optional[asyncio.StreamWriter] = None
+        self.free: asyncio.Queue = asyncio.Queue()
+        for i in range(slots): self.free.put_nowait(i)
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.slot_of: Dict[int, int] = {}   # request id -> ring slot the server may still be reading
+        self.next_id = 0; self.recv_task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path, limit=1 << 20)
+        self._send({"ring": self.ring.name, "slots": self.ring.slots, "slot_bytes": self.ring.slot_bytes})
+        self.recv_task = asyncio.create_task(self._recv_loop())
+
+    async def infer(self, bgr: np.ndarray, telemetry: str, session_id: str, trace_id: Optional[str] = None) -> Dict[str, Any]:
+        slot = await self.free.get()
+        rid = self.next_id; self.next_id += 1
+        try:
+            shape = self.ring.write(slot, bgr)
+            fut = asyncio.get_running_loop().create_future()
+            self.pending[rid] = fut; self.slot_of[rid] = slot
+            self._send({"id": rid, "slot": slot, "shape": list(shape), "telemetry": telemetry,
+                        "session_id": session_id, "trace_id": trace_id})
+        except BaseException:   # never reached the server: the slot is ours again
+            self.pending.pop(rid, None); self.slot_of.pop(rid, None)
+            self.free.put_nowait(slot)
+            raise
+        try:
+            msg = await fut
+        finally:
+            self.pending.pop(rid, None)   # cancelled / timed out: the reply is dropped when it comes
+        if "error" in msg: raise RuntimeError(msg["error"])
+        return msg["result"]
+
+    async def close(self):
+        if self.recv_task: self.recv_task.cancel()
+        if self.writer: self.writer.close()
+        self.ring.close()
+
+    def _send(self, obj: dict):
+        self.writer.write(dumps(obj) + b"\n")
+
+    async def _recv_loop(self):
+        try:
+            while line := await self.reader.readline():
+                msg = loads(line); rid = msg.get("id")
+                slot = self.slot_of.pop(rid, None)
+                if slot is not None: self.free.put_nowait(slot)   # the server is done with it
+                fut = self.pending.pop(rid, None)
+                if fut is not None and not fut.done(): fut.set_result(msg)
+        finally:
+            for fut in self.pending.values():
+                if not fut.done(): fut.set_exception(ConnectionError("shm transport closed"))
+            self.pending.clear()
+            for slot in self.slot_of.values(): self.free.put_nowait(slot)   # no server left reading them
+            self.slot_of.clear()
+
+Handler = Callable[[np.ndarray, str, str, Optional[str]], Awaitable[Dict[str, Any]]]
+
+async def serve_shm(path: str, handler: Handler) -> asyncio.AbstractServer:
+    """Serve gateways on a Unix socket. Requests run concurrently, but in order per session_id."""
+    if os.path.exists(path): os.unlink(path)
+    session_locks: Dict[str, list] = {}   # session_id -> [lock, requests using it]; dropped when unused
+
+    async def on_conn(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = loads(await reader.readline())
+        ring = ShmRing(hello["ring"], hello["slots"], hello["slot_bytes"], create=False)
+        inflight = set()
+
+        async def run(msg: dict):
+            sid = msg["session_id"]
+            entry = session_locks.setdefault(sid, [asyncio.Lock(), 0]); entry[1] += 1
+            try:
+                async with entry[0]:
+                    try:
+                        view = ring.view(msg["slot"], tuple(msg["shape"]))
+                        out = {"id": msg["id"], "result": await handler(view, msg["telemetry"], sid, msg.get("trace_id"))}
+                    except Exception as e:
+                        out = {"id": msg["id"], "error": str(e)}
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0: del session_locks[sid]
+            writer.write(dumps(out) + b"\n")
+
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(run(loads(line)))
+                inflight.add(task); task.add_done_callback(inflight.discard)
+            if inflight: await asyncio.gather(*inflight, return_exceptions=True)
+        finally:
+            writer.close()
+            try: ring.close()
+            except BufferError: pass  # a view is still referenced somewhere; the mapping dies with it
+
+    return await asyncio.start_unix_server(on_conn, path=path, limit=1 << 20)
@@ -0,0 +1,186 @@
+# tracing.py
+"""Opt-in per-frame tracing across client -> backend -> API -> detector / scorer -> coach / TTS.
+
+Every hop derives the same correlation id for a frame ("<session_id>:<seq>") and the
+sampling decision is a hash of that id, so all processes keep or drop the same frames
+without coordinating. Spans are Chrome trace "complete" events on the wall clock (epoch
+microseconds), so files written by different processes on one host line up; merge them with
+
+    python tracing.py merge traces/<session>-*.json -o session.json
+
+and open the result in https://ui.perfetto.dev or chrome://tracing.
+"""
+import argparse, cProfile, glob, io, json, os, pstats, re, threading, time, tracemalloc, zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+
+def trace_id(session_id: str, seq: int) -> str:
+    return f"{session_id}:{seq}"
+
+def safe_name(session_id: str) -> str:
+    """session_id as a file name part: client-supplied, so no path separators or leading dots."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", session_id).lstrip(".") or "_"
+
+class Tracer:
+    """Sampled span recorder, buffered per session and written out as one Chrome trace file each.
+
+    Sessions that are never flushed (client gone, late coach spans) are written out by expire()
+    once idle for `idle_s`; past `max_sessions` buffered sessions the least recently used is dropped.
+    """
+    def __init__(self, process: str, sample: float = 0.0, out_dir: str = "traces", max_events: int = 50000,
+                 idle_s: float = 600.0, max_sessions: int = 1000):
+        self.process = process; self.sample = max(0.0, min(1.0, sample))
+        self.out_dir = out_dir; self.max_events = max_events
+        self.idle_s = idle_s; self.max_sessions = max_sessions
+        self.pid = os.getpid()
+        self.events: Dict[str, List[dict]] = defaultdict(list)
+        self.touched: Dict[str, float] = {}   # session -> monotonic time of its last span (insertion = LRU order)
+        self.dropped = 0; self.expired = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample > 0.0
+
+    def sampled(self, tid: Optional[str]) -> bool:
+        if tid is None or self.sample <= 0.0: return False
+        return self.sample >= 1.0 or zlib.crc32(tid.encode()) % 10000 < self.sample*10000
+
+    def add(self, tid: Optional[str], name: str, start_s: float, end_s: float, **args):
+        """Record a span measured elsewhere (epoch seconds, e.g. a client send timestamp)."""
+        if not self.sampled(tid): return
+        ev = {"name": name, "ph": "X", "ts": start_s*1e6, "dur": max(0.0, end_s - start_s)*1e6,
+              "pid": self.pid, "tid": threading.get_ident(), "args": dict(args, trace_id=tid)}
+        sid = tid.split(":", 1)[0]
+        with self.lock:
+            if sid not in self.events and len(self.events) >= self.max_sessions:
+                old = next(iter(self.touched))   # least recently used session
+                self.dropped += len(self.events.pop(old, ())); del self.touched[old]
+            buf = self.events[sid]
+            self.touched.pop(sid, None); self.touched[sid] = time.monotonic()
+            if len(buf) >= self.max_events: self.dropped += 1; return
+            buf.append(ev)
+
+    @contextmanager
+    def span(self, tid: Optional[str], name: str, **args):
+        if not self.sampled(tid):
+            yield; return
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.add(tid, name, t0, time.time(), **args)
+
+    def flush(self, session_id: str) -> Optional[str]:
+        """Write (and forget) one session's spans; returns the file path, None if nothing was sampled.
+
+        A later flush of the same session (late coach spans, expire()) goes to a new numbered file
+        next to the first, so nothing already written is overwritten.
+        """
+        with self.lock:
+            evs = self.events.pop(session_id, None); self.touched.pop(session_id, None)
+        if not evs: return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.process}}]
+        base = os.path.join(self.out_dir, f"{safe_name(session_id)}-{self.process}-{self.pid}")
+        path = f"{base}.json"; k = 1
+        while True:
+            try:
+                f = open(path, "x"); break
+            except FileExistsError:
+                k += 1; path = f"{base}.{k}.json"
+        with f:
+            json.dump({"traceEvents": meta + evs, "displayTimeUnit": "ms"}, f)
+        return path
+
+    def expire(self, idle_s: Optional[float] = None) -> List[str]:
+        """Flush sessions with no span for idle_s (default self.idle_s; <= 0 keeps them); returns the files written."""
+        idle_s = self.idle_s if idle_s is None else idle_s
+        if idle_s <= 0: return []
+        cutoff = time.monotonic() - idle_s
+        with self.lock:
+            stale = [sid for sid, ts in self.touched.items() if ts < cutoff]
+        self.expired += len(stale)
+        return [p for p in map(self.flush, stale) if p]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sample": self.sample, "sessions": len(self.events),
+                "events": sum(len(v) for v in self.events.values()), "dropped": self.dropped, "expired": self.expired}
+
+def from_env(process: str) -> Tracer:
+    """TRACE_SAMPLE (fraction of frames, 0 = off), TRACE_DIR (default ./traces) and SESSION_IDLE_S
+    (default 600; the same idle limit the API applies to its sessions)."""
+    return Tracer(process, float(os.getenv("TRACE_SAMPLE", "0")), os.getenv("TRACE_DIR", "traces"),
+                  idle_s=float(os.getenv("SESSION_IDLE_S", "600")))
+
+class CallProfiler:
+    """cProfile the next N calls that go through call() (on whichever thread runs them)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining = 0; self.stats: Optional[pstats.Stats] = None
+        self.done = threading.Event()
+
+    def arm(self, calls: int):
+        with self.lock:
+            self.remaining = calls; self.stats = None; self.done.clear()
+
+    def disarm(self):
+        with self.lock:
+            self.remaining = 0
+
+    def call(self, fn, *args, **kw):
+        with self.lock:
+            take = self.remaining > 0
+            if take: self.remaining -= 1
+        if not take:
+            return fn(*args, **kw)
+        prof = cProfile.Profile()
+        try:
+            return prof.runcall(fn, *args, **kw)
+        finally:
+            with self.lock:
+                if self.stats is None: self.stats = pstats.Stats(prof)
+                else: self.stats.add(prof)
+                if self.remaining == 0: self.done.set()
+
+    def report(self, top: int = 30, sort: str = "cumulative") -> str:
+        with self.lock:
+            if self.stats is None: return "no calls profiled\n"
+            out = io.StringIO(); self.stats.stream = out
+            self.stats.sort_stats(sort).print_stats(top)
+            return out.getvalue()
+
+class MemorySnapshots:
+    """tracemalloc on demand: first call starts tracing, later calls diff against the previous snapshot."""
+    def __init__(self, frames: int = 10):
+        self.frames = frames; self.prev = None
+
+    def step(self, top: int = 25, stop: bool = False) -> Dict[str, Any]:
+        if stop:
+            tracemalloc.stop(); self.prev = None
+            return {"tracing": False}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames); self.prev = tracemalloc.take_snapshot()
+            return {"tracing": True, "started": True}
+        snap = tracemalloc.take_snapshot()
+        diff = snap.compare_to(self.prev, "lineno"); self.prev = snap
+        cur, peak = tracemalloc.get_traced_memory()
+        return {"tracing": True, "current_kb": cur//1024, "peak_kb": peak//1024,
+                "top_growth": [str(s) for s in diff[:top]]}
+
+def merge(paths: List[str], out: str):
+    evs: List[dict] = []
+    for p in paths:
+        with open(p) as f: evs.extend(json.load(f)["traceEvents"])
+    with open(out, "w") as f:
+        json.dump({"traceEvents": evs, "displayTimeUnit": "ms"}, f)
+    print(f"{len(evs)} events from {len(paths)} files -> {out}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Merge per-process trace files of one session for Perfetto / chrome://tracing")
+    ap.add_argument("cmd", choices=["merge"])
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("-o", "--out", default="trace.json")
+    args = ap.parse_args()
+    merge(sorted({p for pat in args.files for p in glob.glob(pat)}), args.out)
@@ -0,0 +1,124 @@
+# ttc_engine.py
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+# COCO ids for bicycle, car, motorcycle, bus, truck (same set as estimate_lead_distance_px)
+VEHICLE_CLS = (1, 2, 3, 5, 7)
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (M,4) and (K,4) xyxy boxes -> (M,K)."""
+    if len(a) == 0 or len(b) == 0: return np.zeros((len(a), len(b)), np.float32)
+    x1 = np.maximum(a[:,None,0], b[None,:,0]); y1 = np.maximum(a[:,None,1], b[None,:,1])
+    x2 = np.minimum(a[:,None,2], b[None,:,2]); y2 = np.minimum(a[:,None,3], b[None,:,3])
+    inter = np.clip(x2-x1, 0, None) * np.clip(y2-y1, 0, None)
+    area_a = (a[:,2]-a[:,0]) * (a[:,3]-a[:,1]); area_b = (b[:,2]-b[:,0]) * (b[:,3]-b[:,1])
+    return inter / np.maximum(area_a[:,None] + area_b[None,:] - inter, 1e-6)
+
+class LoomingTTCEngine:
+    """Multi-target TTC via looming over IoU-tracked vehicles.
+
+    Every track keeps a window of (t, ln h) samples; a least-squares slope of ln h
+    over t is the scale-change rate s, and TTC ≈ 1/s (at the window mid-time, moved to
+    the newest sample) while s > 0 (approaching).
+    All per-frame work is array ops over tracks, no per-object loops.
+    """
+    def __init__(self, window: int = 8, iou_thresh: float = 0.3, max_misses: int = 5,
+                 min_samples: int = 3, max_tracks: int = 64, cls_ids=VEHICLE_CLS):
+        self.window = window; self.iou_thresh = iou_thresh; self.max_misses = max_misses
+        self.min_samples = max(2, min_samples); self.max_tracks = max_tracks
+        self.cls_ids = np.array(cls_ids, np.int32)
+        self.next_id = 0
+        self.ids = np.zeros(0, np.int64)
+        self.cls = np.zeros(0, np.int32)
+        self.boxes = np.zeros((0,4), np.float32)
+        self.hist_t = np.zeros((0,window), np.float64)
+        self.hist_logh = np.zeros((0,window), np.float64)
+        self.n = np.zeros(0, np.int32)       # valid samples in window (right-aligned)
+        self.misses = np.zeros(0, np.int32)
+        self.ttc = np.zeros(0, np.float64)   # nan when unknown / not approaching
+
+    def reset(self):
+        self.__init__(self.window, self.iou_thresh, self.max_misses, self.min_samples,
+                      self.max_tracks, tuple(self.cls_ids))
+
+    def step(self, dets: List[Dict[str, Any]], t: float) -> List[Dict[str, Any]]:
+        """Associate this frame's detections and return every visible track with its TTC."""
+        d = [x for x in dets if x["cls_id"] in self.cls_ids]
+        D = np.array([x["xyxy"] for x in d], np.float32).reshape(-1,4)
+        Dc = np.array([x["cls_id"] for x in d], np.int32)
+
+        # mutual-best IoU association (greedy-equivalent for non-crowded scenes)
+        iou = iou_matrix(self.boxes, D)
+        M, K = iou.shape
+        trk_match = np.full(M, -1, np.int64)
+        if M and K:
+            best_d = iou.argmax(1); best_t = iou.argmax(0)
+            ok = (best_t[best_d] == np.arange(M)) & (iou[np.arange(M), best_d] >= self.iou_thresh)
+            trk_match[ok] = best_d[ok]
+        matched = trk_match >= 0
+        det_used = np.zeros(K, bool); det_used[trk_match[matched]] = True
+
+        # update matched tracks: shift window left, append new sample
+        if matched.any():
+            m = np.flatnonzero(matched); j = trk_match[m]
+            h = np.maximum(D[j,3] - D[j,1], 1.0)
+            self.hist_t[m,:-1] = self.hist_t[m,1:]; self.hist_t[m,-1] = t
+            self.hist_logh[m,:-1] = self.hist_logh[m,1:]; self.hist_logh[m,-1] = np.log(h)
+            self.n[m] = np.minimum(self.n[m] + 1, self.window)
+            self.boxes[m] = D[j]; self.cls[m] = Dc[j]
+        self.misses[~matched] += 1; self.misses[matched] = 0
+
+        keep = self.misses <= self.max_misses
+        self._select(keep)
+        visible = np.concatenate([self.misses == 0, np.ones(int((~det_used).sum()), bool)])
+        self._spawn(D[~det_used], Dc[~det_used], t)
+        if len(self.ids) > self.max_tracks:  # drop stalest tracks first
+            order = np.argsort(self.misses, kind="stable")[:self.max_tracks]
+            keep = np.zeros(len(self.ids), bool); keep[order] = True
+            self._select(keep); visible = visible[keep]
+
+        self.ttc = self._fit_ttc()
+        return [{"id": int(i), "cls_id": int(c), "xyxy": b.tolist(),
+                 "ttc": (None if np.isnan(x) else float(x))}
+                for i, c, b, x in zip(self.ids[visible], self.cls[visible], self.boxes[visible], self.ttc[visible])]
+
+    def min_ttc(self, frame_shape: Tuple[int,...], band: float = 0.35) -> Optional[float]:
+        """Smallest TTC among visible tracks whose centre is within `band`*w of the image centre.
+
+        A band wider than the 0.22 lead corridor also covers cut-ins from adjacent lanes.
+        """
+        w = frame_shape[1]
+        cx = (self.boxes[:,0] + self.boxes[:,2]) / 2
+        sel = (self.misses == 0) & (np.abs(cx - w/2) < band*w) & ~np.isnan(self.ttc)
+        return float(self.ttc[sel].min()) if sel.any() else None
+
+    # ---- internals ----
+    def _fit_ttc(self) -> np.ndarray:
+        """Windowed least-squares slope of ln h over t for all tracks at once.
+
+        1/slope is the TTC at the window's mean time; it is moved to the latest sample.
+        """
+        if len(self.ids) == 0: return np.zeros(0, np.float64)
+        mask = np.arange(self.window)[None,:] >= (self.window - self.n)[:,None]
+        cnt = np.maximum(self.n, 1)
+        tm = (self.hist_t * mask).sum(1) / cnt; ym = (self.hist_logh * mask).sum(1) / cnt
+        dt = (self.hist_t - tm[:,None]) * mask
+        var = (dt * dt).sum(1); cov = (dt * (self.hist_logh - ym[:,None])).sum(1)
+        rate = np.where(var > 1e-9, cov / np.maximum(var, 1e-9), 0.0)  # d(ln h)/dt
+        ok = (self.n >= self.min_samples) & (rate > 1e-3)
+        ttc = np.maximum(1.0 / np.maximum(rate, 1e-3) - (self.hist_t[:,-1] - tm), 0.0)
+        return np.where(ok, ttc, np.nan)
+
+    def _select(self, keep: np.ndarray):
+        for name in ("ids","cls","boxes","hist_t","hist_logh","n","misses"):
+            setattr(self, name, getattr(self, name)[keep])
+
+    def _spawn(self, boxes: np.ndarray, cls: np.ndarray, t: float):
+        k = len(boxes)
+        if k == 0: return
+        ht = np.zeros((k,self.window)); ht[:,-1] = t
+        hl = np.zeros((k,self.window)); hl[:,-1] = np.log(np.maximum(boxes[:,3]-boxes[:,1], 1.0))
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id+k)]); self.next_id += k
+        self.cls = np.concatenate([self.cls, cls]); self.boxes = np.concatenate([self.boxes, boxes])
+        self.hist_t = np.concatenate([self.hist_t, ht]); self.hist_logh = np.concatenate([self.hist_logh, hl])
+        self.n = np.concatenate([self.n, np.ones(k, np.int32)]); self.misses = np.concatenate([self.misses, np.zeros(k, np.int32)])
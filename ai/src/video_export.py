@@ -0,0 +1,98 @@
+# video_export.py
+"""HUD drawing shared by the replay scripts, and a headless exporter for replay runs.
+
+The exporter takes (frame, HUD spec, signals) from the perception loop and does the drawing,
+MP4 encoding and JSONL writing on its own thread, behind a bounded queue. The perception loop
+only pays for a frame copy (none at all without overlay, when only the JSONL is written).
+"""
+import json, os, queue, threading, time
+import cv2, numpy as np
+from typing import Optional, List, Dict, Any
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+def draw_hud(frame: np.ndarray, dets: List[Dict[str, Any]], text: str, cues: List[Dict[str, Any]],
+             lead_box: Optional[List[float]] = None, tracks: Optional[List[Dict[str, Any]]] = None) -> np.ndarray:
+    """Boxes, lead box, per-track TTC, one status line and the cues, drawn in place."""
+    for d in dets:
+        x1,y1,x2,y2 = map(int, d["xyxy"])
+        cv2.rectangle(frame,(x1,y1),(x2,y2),(0,255,0),2)
+        cv2.putText(frame, f"{d['cls_name']} {d['conf']:.2f}", (x1,max(12,y1-6)), FONT, 0.45,(0,255,0),1)
+    if lead_box:
+        x1,y1,x2,y2 = map(int, lead_box)
+        cv2.rectangle(frame,(x1,y1),(x2,y2),(255,200,0),2)
+    for tr in tracks or []:
+        if tr["ttc"] is None: continue
+        x1,y1,x2,y2 = map(int, tr["xyxy"])
+        cv2.putText(frame, f"#{tr['id']} {tr['ttc']:.1f}s", (x1,min(frame.shape[0]-4,y2+14)), FONT, 0.45,(255,200,0),1)
+    cv2.putText(frame, text, (10,22), FONT, 0.55,(50,200,255),2)
+    y = 46
+    for cue in cues:
+        cv2.putText(frame, f"CUE: {cue['cue']} {cue['level']:.2f}", (10,y), FONT, 0.65,(0,0,255),2); y += 24
+    return frame
+
+def _plain(obj):
+    if isinstance(obj, np.generic): return obj.item()
+    if isinstance(obj, np.ndarray): return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+class VideoExporter:
+    """Background MP4 (+ JSONL) writer.
+
+    submit() blocks when `max_queue` frames are waiting, so memory stays bounded and no frame is
+    lost; the time spent blocked is reported as `wait_s` (encoder slower than perception).
+    """
+    def __init__(self, video_path: Optional[str], jsonl_path: Optional[str], fps: float = 30.0,
+                 overlay: bool = True, max_queue: int = 32, fourcc: str = "mp4v"):
+        self.video_path = video_path if overlay else None   # without the HUD the video is just the input
+        self.jsonl_path = jsonl_path; self.fps = fps; self.fourcc = fourcc
+        self.q: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.writer = None; self.frames = 0; self.wait_s = 0.0; self.encode_s = 0.0
+        self.error: Optional[BaseException] = None
+        for p in (self.video_path, jsonl_path):
+            if p and os.path.dirname(p): os.makedirs(os.path.dirname(p), exist_ok=True)
+        self.jsonl = open(jsonl_path, "w") if jsonl_path else None
+        self.thread = threading.Thread(target=self._run, name="video-export", daemon=True); self.thread.start()
+
+    def submit(self, frame: np.ndarray, hud: Dict[str, Any], row: Dict[str, Any]):
+        """hud: draw_hud keyword arguments except frame; row: one JSONL record."""
+        if self.error is not None: raise RuntimeError("video export failed") from self.error
+        # the caller may reuse its frame buffer, so the encoder gets its own copy
+        item = (frame.copy() if self.video_path else None, hud, row)
+        try: self.q.put_nowait(item)
+        except queue.Full:
+            t0 = time.perf_counter(); self.q.put(item); self.wait_s += time.perf_counter() - t0
+
+    def close(self) -> Dict[str, Any]:
+        self.q.put(None); self.thread.join()
+        if self.writer is not None: self.writer.release()
+        if self.jsonl is not None: self.jsonl.close()
+        if self.error is not None: raise RuntimeError("video export failed") from self.error
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"frames": self.frames, "video": self.video_path, "jsonl": self.jsonl_path,
+                "wait_s": round(self.wait_s, 3), "encode_s": round(self.encode_s, 3)}
+
+    def _run(self):
+        while (item := self.q.get()) is not None:
+            if self.error is not None: continue   # keep draining so submit() never blocks forever
+            frame, hud, row = item
+            try:
+                t0 = time.perf_counter()
+                if frame is not None:
+                    draw_hud(frame, **hud)
+                    if self.writer is None:
+                        h, w = frame.shape[:2]
+                        self.writer = cv2.VideoWriter(self.video_path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (w, h))
+                        if not self.writer.isOpened(): raise IOError(f"cannot open {self.video_path} for writing")
+                    self.writer.write(frame)
+                if self.jsonl is not None:
+                    self.jsonl.write(json.dumps(row, default=_plain) + "\n")
+                self.encode_s += time.perf_counter() - t0; self.frames += 1
+            except Exception as e:
+                self.error = e
+
+def export_paths(path: str):
+    """--export out.mp4 -> (out.mp4, out.jsonl)."""
+    return path, os.path.splitext(path)[0] + ".jsonl"
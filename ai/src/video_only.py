@@ -1,24 +1,32 @@
 # video_only.py
-import cv2, numpy as np, time
-from typing import Optional, Tuple, Dict, Any, List
+import cv2, numpy as np, math, time
+from typing import Optional, Tuple, Dict, Any, List, Union
 from .lane_simple import estimate_lane_offset_m
+from .pyramid import FramePyramid, as_pyramid, ref_scale, odd
 
 class FlowSpeedEstimator:
-    """Relative speed from optical flow magnitude over road ROI; scale_k maps mag->m/s."""
-    def __init__(self, scale_k: float = 2.5):
+    """Relative speed from optical flow magnitude over road ROI; scale_k maps mag->m/s.
+
+    Flow runs on the pyramid level with long side work_side (None = frame resolution). The
+    Farneback window / levels are tuned at 720 px and scaled to the level, and the magnitude is
+    reported in 720-px pixels, so scale_k holds at any working size.
+    """
+    def __init__(self, scale_k: float = 2.5, work_side: Optional[int] = None):
         self.prev = None
         self.scale_k = scale_k
+        self.work_side = work_side
 
-    def step(self, bgr: np.ndarray) -> float:
-        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-        h, w = gray.shape
+    def step(self, src: Union[np.ndarray, FramePyramid]) -> float:
+        gray = as_pyramid(src).gray(self.work_side)
+        h, w = gray.shape; s = ref_scale(gray)
         roi = gray[int(0.55*h):int(0.95*h), int(0.15*w):int(0.85*w)]
-        if self.prev is None:
+        if self.prev is None or self.prev.shape != roi.shape:
             self.prev = roi
             return 0.0
-        flow = cv2.calcOpticalFlowFarneback(self.prev, roi, None, 0.5, 3, 21, 3, 5, 1.2, 0)
+        levels = max(1, 3 + round(math.log2(s)))
+        flow = cv2.calcOpticalFlowFarneback(self.prev, roi, None, 0.5, levels, odd(21*s, 5), 3, 5, 1.2, 0)
         self.prev = roi
-        mag = np.linalg.norm(flow, axis=2).mean()
+        mag = np.linalg.norm(flow, axis=2).mean() / s
         return float(self.scale_k * mag)  # m/s (rough, calibrate scale_k with one known segment)
 
 class LeadTTC:
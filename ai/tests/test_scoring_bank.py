@@ -0,0 +1,46 @@
+# test_scoring_bank.py
+import os, random, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from rules import ScoringState, ScoringBank, Telemetry
+
+def _tel(rng, t, brake):
+    return Telemetry(t=t, speed_mps=rng.uniform(0, 25), speed_limit_mps=rng.choice([8.3, 13.4, 22.2]),
+                     throttle=rng.random(), brake=brake, steer_deg=rng.uniform(-10, 10),
+                     lane_offset_m=rng.choice([None, rng.uniform(-1, 1)]),
+                     tl_state=rng.choice([None, "red", "green"]), in_stop_zone=rng.random() < 0.2,
+                     collision=rng.random() < 0.02)
+
+def test_bank_matches_scalar_state():
+    """Randomized: 30 trials x 200 steps x 4 slots, same clock; cues (incl. tie order) and scores match."""
+    for trial in range(30):
+        rng = random.Random(trial)
+        bank = ScoringBank(capacity=2)   # grows while allocating
+        slots = [bank.alloc() for _ in range(4)]
+        ref = [ScoringState() for _ in slots]
+        t = [rng.uniform(0, 5) for _ in slots]; brake = [0.0]*len(slots)
+        now = 0.0
+        for step in range(200):
+            now += rng.choice([0.0, 0.05, 0.1, 0.4, 2.0])
+            run = [k for k in range(len(slots)) if rng.random() < 0.8]   # not every session has a frame each tick
+            tels, ttcs = [], []
+            for k in run:
+                t[k] += rng.choice([0.0, 0.033, 0.1, 0.5])
+                brake[k] = min(1.0, max(0.0, brake[k] + rng.choice([0.0, 0.0, 0.3, -0.3, 0.9])))
+                tels.append(_tel(rng, t[k], brake[k])); ttcs.append(rng.choice([None, rng.uniform(0.2, 8.0)]))
+            got = bank.step([slots[k] for k in run], tels, ttcs, now=now)
+            for k, tel, ttc, cues in zip(run, tels, ttcs, got):
+                assert cues == ref[k].step(tel, ttc, now=now), (trial, step, k)
+        for k, slot in enumerate(slots):
+            assert bank.finalize(slot) == ref[k].finalize()
+            assert bank.to_state(slot).tallies() == ref[k].tallies()
+
+def test_released_slot_starts_fresh():
+    bank = ScoringBank(capacity=1); s = bank.alloc()
+    rng = random.Random(0)
+    for i in range(20):
+        bank.step([s], [_tel(rng, 0.1*i, 0.0)], [0.5], now=0.1*i)
+    bank.release(s); s2 = bank.alloc(); ref = ScoringState()
+    assert s2 == s
+    for i in range(5):
+        tel = _tel(rng, 0.1*i, 0.0)
+        assert bank.step([s2], [tel], [0.5], now=0.1*i) == [ref.step(tel, 0.5, now=0.1*i)]
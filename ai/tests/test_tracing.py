@@ -0,0 +1,37 @@
+# test_tracing.py
+import json, os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from tracing import Tracer
+
+def test_idle_sessions_are_written_out(tmp_path):
+    tr = Tracer("test", sample=1.0, out_dir=str(tmp_path), idle_s=60.0)
+    tr.add("old:1", "span", 0.0, 0.1); tr.add("new:1", "span", 0.0, 0.1)
+    tr.touched["old"] -= 120.0
+    paths = tr.expire()
+    assert len(paths) == 1 and os.path.basename(paths[0]).startswith("old-")
+    assert len(json.load(open(paths[0]))["traceEvents"]) == 2   # process name + the span
+    assert list(tr.events) == ["new"] and tr.stats()["expired"] == 1
+
+def test_least_recently_used_session_dropped_at_cap(tmp_path):
+    tr = Tracer("test", sample=1.0, out_dir=str(tmp_path), max_sessions=2)
+    tr.add("a:1", "span", 0.0, 0.1); tr.add("b:1", "span", 0.0, 0.1)
+    tr.add("a:2", "span", 0.0, 0.1)   # a is now the most recent
+    tr.add("c:1", "span", 0.0, 0.1)
+    assert sorted(tr.events) == ["a", "c"] and tr.dropped == 1
+    assert tr.expire(0) == [] and not os.listdir(tmp_path)   # 0 disables expiry
+
+def test_later_flush_does_not_overwrite(tmp_path):
+    tr = Tracer("test", sample=1.0, out_dir=str(tmp_path))
+    tr.add("s:1", "frame", 0.0, 0.1); tr.add("s:2", "frame", 0.1, 0.2)
+    first = tr.flush("s")
+    tr.add("s:2", "coach.wait", 0.2, 0.3)   # arrives after the session ended
+    second = tr.flush("s")
+    assert first != second and os.path.basename(second).startswith("s-test-")
+    assert len(json.load(open(first))["traceEvents"]) == 3 and len(json.load(open(second))["traceEvents"]) == 2
+
+def test_session_id_cannot_escape_trace_dir(tmp_path):
+    tr = Tracer("test", sample=1.0, out_dir=str(tmp_path / "traces"))
+    for sid in ("../../evil", "/etc/passwd", ".."):
+        tr.add(f"{sid}:1", "frame", 0.0, 0.1)
+        path = tr.flush(sid)
+        assert os.path.dirname(os.path.abspath(path)) == str(tmp_path / "traces")
@@ -0,0 +1,24 @@
+# test_ttc_engine.py
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from ttc_engine import LoomingTTCEngine
+
+def _approach(engine, fps, frames, ttc_end, h0=40.0):
+    """Constant-speed approach: box height h(t) ∝ 1/(T - t), with T chosen so TTC at the last frame is ttc_end."""
+    T = (frames - 1)/fps + ttc_end; k = h0*T; tracks = None
+    for i in range(frames):
+        t = i/fps; h = k/(T - t)
+        tracks = engine.step([{"cls_id": 2, "xyxy": [300.0, 200.0, 300.0 + h, 200.0 + h]}], t)
+    return tracks
+
+def test_ttc_is_at_latest_sample():
+    tracks = _approach(LoomingTTCEngine(window=8), fps=10, frames=12, ttc_end=2.10)
+    assert len(tracks) == 1
+    assert abs(tracks[0]["ttc"] - 2.10) < 0.05
+
+def test_receding_has_no_ttc():
+    e = LoomingTTCEngine(window=8)
+    for i in range(10):
+        h = 80.0 - 3*i
+        tracks = e.step([{"cls_id": 2, "xyxy": [300.0, 200.0, 300.0 + h, 200.0 + h]}], i/10)
+    assert tracks[0]["ttc"] is None
@@ -7,16 +7,31 @@ import aiohttp
 import os
 import time
 import uuid
+import sys
+import struct
 from dotenv import load_dotenv
 from verbal_audio import FishTTSStreamer
+from frame_proto import is_frame, unpack_frame, encode_result
+from coach import CoachForwarder, CircuitBreaker
+from upstream import UpstreamPool
+from recorder import SessionRecorder
+from delta_push import DeltaPusher, bucket as _bucket
 from websockets.exceptions import ConnectionClosed, ConnectionClosedOK
 
-# Store frames and telemetry for each connection
-connections = {}
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai", "src"))
+from tracing import from_env as tracer_from_env, trace_id as make_trace_id
+import json_codec
+from log_setup import configure as configure_logging
 
-# Load environment variables from a .env file (e.g., backend/.env)
+# Load environment variables from a .env file (e.g., backend/.env); before anything reads them
 load_dotenv()
 
+# LOG_LEVEL=DEBUG logs every telemetry message and inference result; LOG_FORMAT=json for structured lines
+log = configure_logging("backend")
+
+# Store frames and telemetry for each connection
+connections = {}
+
 FISHAUDIO_API_KEY = os.getenv("FISHAUDIO_API_KEY", "")
 VOICE_MODEL_ID = None
 
@@ -29,17 +44,43 @@ FORWARD_MIN_INTERVAL_S = float(os.getenv("TOOLHOUSE_MIN_INTERVAL_S", "1.0"))
 TOOLHOUSE_FINAL_TIMEOUT_S = float(os.getenv("TOOLHOUSE_FINAL_TIMEOUT_S", "20.0"))
 # How to send payload to Toolhouse: 'wrapped' (default, uses 'message'), 'wrapped_input' (uses 'input'), or 'raw'
 PAYLOAD_STYLE = os.getenv("TOOLHOUSE_PAYLOAD_STYLE", "wrapped").lower()
+# Circuit breaker: stop calling the coach after this many failed/slow calls, retry after the cooldown
+TOOLHOUSE_BREAKER_FAILS = int(os.getenv("TOOLHOUSE_BREAKER_FAILS", "3"))
+TOOLHOUSE_SLOW_S = float(os.getenv("TOOLHOUSE_SLOW_S", "4.0"))
+TOOLHOUSE_BREAKER_COOLDOWN_S = float(os.getenv("TOOLHOUSE_BREAKER_COOLDOWN_S", "30.0"))
+
+# 'http' (default) posts JPEG + telemetry to the inference API; 'shm' hands decoded frames
+# to a co-located api.py (started with SHM_SOCKET) through a shared-memory ring
+INFER_TRANSPORT = os.getenv("INFER_TRANSPORT", "http").lower()
+SHM_SOCKET = os.getenv("SHM_SOCKET", "/tmp/crashcourse-infer.sock")
+if INFER_TRANSPORT == "shm":
+    from shm_transport import ShmClient
+# Inference API instances (comma separated); sessions are consistently hashed onto them
+INFER_URLS = [u.strip() for u in os.getenv("INFER_URLS", "http://localhost:8000").split(",") if u.strip()]
+upstreams = UpstreamPool(INFER_URLS)
+shm_client = None
+# Change-driven push (clients opt in with "push": "delta" in hello): full snapshot this often, deltas in between
+PUSH_SNAPSHOT_S = float(os.getenv("PUSH_SNAPSHOT_S", "5.0"))
+# Record every session's frames + telemetry under RECORD_DIR for replay (recorder.py); off when unset
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+recorder = SessionRecorder(RECORD_DIR) if RECORD_DIR else None
+# Sampled per-frame spans (TRACE_SAMPLE, TRACE_DIR); same correlation ids as the inference API
+tracer = tracer_from_env("backend")
+shm_client_lock = asyncio.Lock()
+
+
+async def get_shm_client():
+    global shm_client
+    async with shm_client_lock:
+        if shm_client is None:
+            client = ShmClient(SHM_SOCKET)
+            await client.connect()
+            shm_client = client
+    return shm_client
 
 
 tts_streamer = FishTTSStreamer(FISHAUDIO_API_KEY, VOICE_MODEL_ID)
 
-def _bucket(val, step):
-    try:
-        return None if val is None else round(float(val) / step) * step
-    except Exception:
-        return None
-
-
 def _cue_fingerprint(obs):
     cue = obs.get("cue") or ""
     lvl = _bucket(obs.get("cue_level"), 0.2)
@@ -89,23 +130,43 @@ async def forward_to_toolhouse(session: aiohttp.ClientSession, payload: dict, ti
                 body = await resp.json()
             except Exception:
                 body = {"text": await resp.text()}
-            print(f"[coach] forwarded event={payload.get('event')} status={status}")
+            log.debug("coach forwarded", extra={"event": payload.get("event"), "status": status})
             body["status"] = status
             return body
     except Exception as e:
-        print(f"Coach forward error: {e}")
+        log.warning("coach forward error: %s", e)
         return None
 
-async def safe_send(ws, obj: dict) -> bool:
+async def infer(frame, telemetry: dict, session_id: str, sent_ts: float | None = None,
+                trace_id: str | None = None) -> dict:
+    if INFER_TRANSPORT == "shm":
+        client = await get_shm_client()
+        return await client.infer(frame, json_codec.dumps_str(telemetry), session_id, trace_id)
+
+    with tracer.span(trace_id, "backend.encode"):
+        _, img_encoded = cv2.imencode('.jpg', frame)
+        img_bytes = img_encoded.tobytes()
+
+    form_data = aiohttp.FormData()
+    form_data.add_field('image', img_bytes, filename='frame.jpg', content_type='image/jpeg')
+    form_data.add_field('telemetry', json_codec.dumps_str(telemetry))
+    form_data.add_field('session_id', session_id)
+    if sent_ts is not None:
+        form_data.add_field('sent_ts', repr(sent_ts))  # lets the API shed frames that would arrive too late
+    if trace_id is not None:
+        form_data.add_field('trace_id', trace_id)
+    return await upstreams.post(session_id, '/infer_frame', data=form_data)
+
+async def safe_send(ws, obj: dict | str) -> bool:
     if getattr(ws, "closed", False):
         return False
     try:
-        await ws.send(json.dumps(obj))
+        await ws.send(obj if isinstance(obj, str) else json_codec.dumps_str(obj))
         return True
     except (ConnectionClosed, ConnectionClosedOK):
         return False
     except Exception as e:
-        print(f"Send error: {e}")
+        log.warning("send error: %s", e)
         return False
 
 
@@ -172,6 +233,49 @@ def _fallback_final_coach(final_result: dict) -> dict:
         "source": "fallback",
     }
 
+CUE_MESSAGES = {
+    "SLOW_DOWN": "Ease off—you're over the limit.",
+    "KEEP_LANE": "Drifting—center the car in your lane.",
+    "INCREASE_HEADWAY": "Too close—open the gap to the car ahead.",
+    "SMOOTHER_BRAKE": "Brake earlier and more gently.",
+    "BRAKE_NOW": "Brake now—stop for the light.",
+}
+
+
+def _fallback_observation_coach(obs: dict) -> dict:
+    """Local stand-in for the realtime coach reply while Toolhouse is unavailable."""
+    cue = obs.get("cue")
+    return {
+        "cue": cue,
+        "cue_level": obs.get("cue_level"),
+        "message": CUE_MESSAGES.get(cue, "Looking good—keep it steady."),
+        "notes": None,
+        "source": "fallback",
+    }
+
+
+def _fallback_coach(payload: dict) -> dict:
+    if payload.get("event") == "session_end":
+        return _fallback_final_coach(payload.get("final") or {})
+    return _fallback_observation_coach(payload)
+
+
+def _coach_text(reply: dict, key: str) -> str | None:
+    """Pull `key` out of a coach reply: Toolhouse wraps its JSON in 'text', fallbacks don't."""
+    if "text" in reply:
+        try:
+            return json.loads(reply["text"]).get(key)
+        except (ValueError, AttributeError):
+            return None
+    return reply.get(key)
+
+
+coach = CoachForwarder(
+    forward_to_toolhouse, _fallback_coach,
+    breaker=CircuitBreaker(TOOLHOUSE_BREAKER_FAILS, TOOLHOUSE_SLOW_S, TOOLHOUSE_BREAKER_COOLDOWN_S),
+)
+
+
 async def handler(websocket):
     connection_id = id(websocket)
     connections[connection_id] = {
@@ -180,6 +284,10 @@ async def handler(websocket):
         'session_id': str(uuid.uuid4()),
         'last_forward_ts': 0.0,
         'last_cue_fp': None,
+        'proto': 1,
+        'seq': 0,   # v1 frame counter, for trace ids
+        'last_jpeg': None,  # v1: encoded bytes of the latest frame, kept only when recording
+        'push': None,       # DeltaPusher when the client asked for change-driven results
     }
 
     async def send_audio_chunk(chunk):
@@ -189,131 +297,224 @@ async def handler(websocket):
     async def send_tts_msg(msg):
         await tts_streamer.stream_tts(msg.strip(), send_audio_chunk)
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            while True:
-                try:
-                    message = await websocket.recv()
-                except (ConnectionClosed, ConnectionClosedOK):
-                    # client closed the socket gracefully
-                    break
-                if isinstance(message, bytes):
-                    img = cv2.imdecode(np.frombuffer(message, np.uint8), cv2.IMREAD_COLOR)
-                    connections[connection_id]['frames'].append(img)
-                    continue
-
-                # TTS data (TESTING PURPOSES ONLY)
-                # if isinstance(message, str) and message.startswith("TTS:"):
-                #     # Extract text message, e.g. "TTS:Say this to the client"
-                #     tts_text = message[4:].strip()
-                #     await tts_streamer.stream_tts(tts_text, send_audio_chunk)
-                #     continue
+    async def deliver_coach(reply):
+        log.debug("coach reply %s", reply, extra={"session": connections[connection_id]['session_id']})
+        if await safe_send(websocket, {"type": "coach", "coach": reply}):
+            msg = _coach_text(reply, "message")
+            if msg:
+                await send_tts_msg(msg)
+
+    async def run_inference(frame, data, env=None, tid=None):
+        """Infer one frame, optionally forward to the coach, and reply (v1 JSON or v2 compact)."""
+        try:
+            with tracer.span(tid, "backend.infer"):
+                result = await infer(frame, data, connections[connection_id]['session_id'],
+                                     sent_ts=time.time(), trace_id=tid)
+            if result.get("shed"):
+                # load-shed by the inference API (429/503); this frame gets no reply
+                log.debug("frame shed: %s", result.get("detail"),
+                          extra={"session": connections[connection_id]['session_id'], "retry_after_ms": result.get("retry_after_ms")})
+                return
+            log.debug("inference result %s", result, extra={"session": connections[connection_id]['session_id']})
+
+            # Optionally forward a reduced observation to Toolhouse (rate-limited)
+            now = time.time()
+            tel = data
+            cues = result.get('cues') or []
+            top = cues[0] if cues else None
+            obs = {
+                "event": "observations",
+                "session_id": connections[connection_id]['session_id'],
+                "t": tel.get("t"),
+                "lane_offset_m": tel.get("lane_offset_m"),
+                "ttc": result.get("ttc"),
+                "speed_mps": tel.get("speed_mps"),
+                "speed_limit_mps": tel.get("speed_limit_mps"),
+                "cue": (top.get('cue') if top else None),
+                "cue_level": (top.get('level') if top else None),
+                "detections": result.get("detections"),
+            }
+            cue_fp = _cue_fingerprint(obs)
+            changed_cue = cue_fp != connections[connection_id]['last_cue_fp']
+            last_ts = connections[connection_id]['last_forward_ts']
+            first_send_ok = (last_ts == 0.0)
+            interval_ok = (now - last_ts) >= FORWARD_MIN_INTERVAL_S
+            should_send = changed_cue and (first_send_ok or interval_ok)
+            if should_send and TOOLHOUSE_URL:
+                # Coached in the background; only the newest observation per session is sent
+                if tracer.sampled(tid):
+                    t_submit = time.time()
+                    async def deliver(reply, tid=tid, t_submit=t_submit):
+                        tracer.add(tid, "coach.wait", t_submit, time.time())
+                        with tracer.span(tid, "coach.deliver_tts"):
+                            await deliver_coach(reply)
+                else:
+                    deliver = deliver_coach
+                coach.submit(connections[connection_id]['session_id'], obs, deliver)
+                connections[connection_id]['last_forward_ts'] = now
+                connections[connection_id]['last_cue_fp'] = cue_fp
+
+            # Send cues back to client; coach replies follow as separate "coach" messages
+            out = dict(result)
+            out["type"] = "inference"
+            with tracer.span(tid, "backend.reply"):
+                pusher = connections[connection_id]['push']
+                if pusher is not None:
+                    msg = pusher.update(out, env["seq"] if env is not None else None)
+                    if msg is not None:
+                        await safe_send(websocket, msg)
+                elif env is not None:
+                    # protocol v2: compact reply keyed by the frame's sequence number
+                    await safe_send(websocket, encode_result(env["seq"], out, env["t_capture"]))
+                else:
+                    if data.get("seq") is not None:
+                        out["seq"] = data["seq"]  # v1: echo the client's optional frame counter
+                    await safe_send(websocket, out)
+        except Exception as e:
+            log.error("error calling inference API: %s", e, extra={"session": connections[connection_id]['session_id']})
 
-                # Telemetry JSON data or control message (`DONE`)
-                try:
-                    data = json.loads(message)
+    try:
+        while True:
+            try:
+                message = await websocket.recv()
+            except (ConnectionClosed, ConnectionClosedOK):
+                # client closed the socket gracefully
+                break
+            if isinstance(message, bytes):
+                if connections[connection_id]['proto'] >= 2 and is_frame(message):
+                    # protocol v2: frame and telemetry arrive in one envelope
+                    t_recv = time.time()
+                    try:
+                        env, data, payload = unpack_frame(message)
+                    except (ValueError, struct.error) as e:
+                        log.warning("bad frame envelope: %s", e)
+                        continue
+                    if recorder is not None:
+                        recorder.record(connections[connection_id]['session_id'], message, t_recv)
+                    tid = make_trace_id(connections[connection_id]['session_id'], env["seq"])
+                    # client-side timestamps; only meaningful when client and backend share a clock
+                    tracer.add(tid, "client.capture_to_send", env["t_capture"], env["t_send"])
+                    tracer.add(tid, "client.send_to_backend", env["t_send"], t_recv)
+                    with tracer.span(tid, "backend.decode"):
+                        img = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
                     connections[connection_id]['telemetry'].append(data)
-                    print("Received telemetry:", data)
-
-                    # Send frame + telemetry to inference API
-                    if connections[connection_id]['frames']:
-                        frame = connections[connection_id]['frames'][-1]  # Use latest frame
-                        _, img_encoded = cv2.imencode('.jpg', frame)
-                        img_bytes = img_encoded.tobytes()
-
-                        form_data = aiohttp.FormData()
-                        form_data.add_field('image', img_bytes, filename='frame.jpg', content_type='image/jpeg')
-                        form_data.add_field('telemetry', json.dumps(data))
-
+                    await run_inference(img, data, env, tid)
+                    continue
+                img = cv2.imdecode(np.frombuffer(message, np.uint8), cv2.IMREAD_COLOR)
+                connections[connection_id]['frames'].append(img)
+                if recorder is not None:
+                    connections[connection_id]['last_jpeg'] = message
+                continue
+
+            # TTS data (TESTING PURPOSES ONLY)
+            # if isinstance(message, str) and message.startswith("TTS:"):
+            #     # Extract text message, e.g. "TTS:Say this to the client"
+            #     tts_text = message[4:].strip()
+            #     await tts_streamer.stream_tts(tts_text, send_audio_chunk)
+            #     continue
+
+            # Telemetry JSON data or control message (`DONE`)
+            try:
+                data = json_codec.loads(message)
+                if isinstance(data, dict) and data.get("type") == "hello":
+                    # protocol negotiation; anything we don't speak falls back to v1
+                    proto = 2 if data.get("proto") == 2 else 1
+                    connections[connection_id]['proto'] = proto
+                    push = "delta" if data.get("push") == "delta" else None
+                    connections[connection_id]['push'] = DeltaPusher(PUSH_SNAPSHOT_S) if push else None
+                    await safe_send(websocket, {"type": "hello", "proto": proto, "push": push})
+                    continue
+                if isinstance(data, dict) and data.get("type") == "resync":
+                    # client saw a gap in push sequence numbers; next result goes out as a snapshot
+                    if connections[connection_id]['push'] is not None:
+                        connections[connection_id]['push'].resync()
+                    continue
+                connections[connection_id]['telemetry'].append(data)
+                log.debug("telemetry %s", data, extra={"session": connections[connection_id]['session_id']})
+
+                # Send frame + telemetry to inference API
+                if connections[connection_id]['frames']:
+                    frame = connections[connection_id]['frames'][-1]  # Use latest frame
+                    connections[connection_id]['seq'] += 1
+                    if recorder is not None and connections[connection_id]['last_jpeg'] is not None:
+                        recorder.record_v1(connections[connection_id]['session_id'], connections[connection_id]['seq'],
+                                           data, connections[connection_id]['last_jpeg'], time.time())
+                    await run_inference(frame, data, tid=make_trace_id(connections[connection_id]['session_id'],
+                                                                       connections[connection_id]['seq']))
+            except json.JSONDecodeError:
+                    if message == "DONE":
+                        # Request final score
                         try:
-                            async with session.post('http://localhost:8000/infer_frame', data=form_data) as resp:
-                                result = await resp.json()
-                                print("Inference result:", result)
-
-                                # Optionally forward a reduced observation to Toolhouse (rate-limited)
-                                now = time.time()
-                                tel = data
-                                cues = result.get('cues') or []
-                                top = cues[0] if cues else None
-                                obs = {
-                                    "event": "observations",
-                                    "session_id": connections[connection_id]['session_id'],
-                                    "t": tel.get("t"),
-                                    "lane_offset_m": tel.get("lane_offset_m"),
-                                    "ttc": result.get("ttc"),
-                                    "speed_mps": tel.get("speed_mps"),
-                                    "speed_limit_mps": tel.get("speed_limit_mps"),
-                                    "cue": (top.get('cue') if top else None),
-                                    "cue_level": (top.get('level') if top else None),
-                                    "detections": result.get("detections"),
-                                }
-                                cue_fp = _cue_fingerprint(obs)
-                                changed_cue = cue_fp != connections[connection_id]['last_cue_fp']
-                                last_ts = connections[connection_id]['last_forward_ts']
-                                first_send_ok = (last_ts == 0.0)
-                                interval_ok = (now - last_ts) >= FORWARD_MIN_INTERVAL_S
-                                should_send = changed_cue and (first_send_ok or interval_ok)
-                                coach_reply = None
-                                if should_send:
-                                    coach_reply = await forward_to_toolhouse(session, obs)
-                                    connections[connection_id]['last_forward_ts'] = now
-                                    connections[connection_id]['last_cue_fp'] = cue_fp
-
-                                # Send cues back to client, include optional coach reply
-                                out = dict(result)
-                                out["type"] = "inference"
-                                if coach_reply is not None:
-                                    print(coach_reply)
-                                    out["coach"] = coach_reply
-                                    await send_tts_msg(json.loads(coach_reply['text'])['message'])
-                                await safe_send(websocket, out)
+                            end_form = aiohttp.FormData()
+                            end_form.add_field('session_id', connections[connection_id]['session_id'])
+                            final_result = await upstreams.post(connections[connection_id]['session_id'], '/end_session', data=end_form)
+
+                            # Prepare final payload immediately
+                            out = dict(final_result)
+                            out["type"] = "final"
+
+                            # Try to fetch coach quickly; don't block too long
+                            # Always attempt to fetch coach; wait up to TOOLHOUSE_FINAL_TIMEOUT_S
+                            final_payload = {
+                                "event": "session_end",
+                                "session_id": connections[connection_id]['session_id'],
+                                "final": final_result,
+                            }
+                            # (returns the local fallback at once while the circuit breaker is open)
+                            coach.drop(connections[connection_id]['session_id'])
+                            # a slow summary is normal (LLM); only a timeout or error counts against the breaker
+                            out["coach"] = await coach.call(final_payload, timeout_s=TOOLHOUSE_FINAL_TIMEOUT_S,
+                                                            slow_s=TOOLHOUSE_FINAL_TIMEOUT_S)
+
+                            await safe_send(websocket, out)
+                            summary = _coach_text(out["coach"], "summary")
+                            if summary:
+                                await send_tts_msg(summary)
                         except Exception as e:
-                            print(f"Error calling inference API: {e}")
-                except json.JSONDecodeError:
-                        if message == "DONE":
-                            # Request final score
-                            try:
-                                async with session.post('http://localhost:8000/end_session') as resp:
-                                    final_result = await resp.json()
-
-                                    # Prepare final payload immediately
-                                    out = dict(final_result)
-                                    out["type"] = "final"
-
-                                    # Try to fetch coach quickly; don't block too long
-                                    # Always attempt to fetch coach; wait up to TOOLHOUSE_FINAL_TIMEOUT_S
-                                    final_payload = {
-                                        "event": "session_end",
-                                        "session_id": connections[connection_id]['session_id'],
-                                        "final": final_result,
-                                    }
-                                    coach_final = await forward_to_toolhouse(session, final_payload, timeout_s=TOOLHOUSE_FINAL_TIMEOUT_S)
-                                    if not coach_final or int(coach_final.get("status", 0)) >= 400:
-                                        coach_final = _fallback_final_coach(final_result)
-                                    out["coach"] = coach_final
-
-                                    await safe_send(websocket, out)
-                                    await send_tts_msg(json.loads(out['coach']['text'])['summary'])
-                            except Exception as e:
-                                print(f"Error getting final score: {e}")
-                                # Fallback to displaying error message 
-                                result = {"errMsg": "Error getting final score"}
-                                await safe_send(websocket, result)
-
-                            connections[connection_id]['frames'].clear()
-                            connections[connection_id]['telemetry'].clear()
-                            break
-                        else:
-                            print("Unknown message type:", message)
+                            log.error("error getting final score: %s", e)
+                            # Fallback to displaying error message 
+                            result = {"errMsg": "Error getting final score"}
+                            await safe_send(websocket, result)
+
+                        connections[connection_id]['frames'].clear()
+                        connections[connection_id]['telemetry'].clear()
+                        break
+                    else:
+                        log.warning("unknown message type: %.80s", message)
     finally:
         # Clean up connection data
         if connection_id in connections:
+            coach.drop(connections[connection_id]['session_id'])
+            upstreams.release(connections[connection_id]['session_id'])
+            tracer.flush(connections[connection_id]['session_id'])
+            if recorder is not None:
+                recorder.end(connections[connection_id]['session_id'])
             del connections[connection_id]
 
 
+async def expire_traces():
+    """Write out trace buffers idle for SESSION_IDLE_S (e.g. coach spans that arrived after the session's flush)."""
+    while True:
+        await asyncio.sleep(min(60.0, tracer.idle_s / 4))
+        await asyncio.to_thread(tracer.expire)
+
+
 async def main():
-    async with websockets.serve(handler, "localhost", 8765):
-        await asyncio.Future()  # run forever
+    await coach.start()
+    await upstreams.start()
+    if recorder is not None:
+        recorder.start()
+    trace_sweep = asyncio.create_task(expire_traces()) if tracer.enabled and tracer.idle_s > 0 else None
+    try:
+        async with websockets.serve(handler, "localhost", 8765):
+            await asyncio.Future()  # run forever
+    finally:
+        if trace_sweep is not None:
+            trace_sweep.cancel()
+        await coach.close()
+        await upstreams.close()
+        if recorder is not None:
+            recorder.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,143 @@
+# Background Toolhouse coach forwarding, kept off the per-frame path.
+#
+# - submit() never waits: observations are coalesced per session (only the newest is sent)
+#   and the number of sessions waiting is bounded.
+# - One keep-alive aiohttp connection pool is shared by every WebSocket connection.
+# - A circuit breaker stops calling the coach while it is failing or slow; local fallback
+#   replies are used instead until a trial call succeeds again.
+# - Replies are handed to a per-submit `deliver` coroutine (push to the client when they arrive),
+#   run as its own task so one session's TTS stream never holds a worker.
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+# child of the gateway's "backend" logger: same non-blocking handler and LOG_LEVEL
+log = logging.getLogger("backend.coach")
+
+
+class CircuitBreaker:
+    """closed -> open after `fail_threshold` consecutive failures/slow calls;
+    open -> half-open after `cooldown_s` (one trial call); a good trial closes it again."""
+
+    def __init__(self, fail_threshold: int = 3, slow_s: float = 4.0, cooldown_s: float = 30.0):
+        self.fail_threshold = fail_threshold
+        self.slow_s = slow_s
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial_inflight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown_s else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_inflight:
+            self.trial_inflight = True
+            return True
+        return False
+
+    def record(self, ok: bool, elapsed_s: float, slow_s: float | None = None):
+        """slow_s overrides the breaker's threshold for calls that are expected to take longer."""
+        self.trial_inflight = False
+        if ok and elapsed_s <= (self.slow_s if slow_s is None else slow_s):
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.failures >= self.fail_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class CoachForwarder:
+    def __init__(self, send_fn, fallback_fn, workers: int = 2, max_sessions: int = 256,
+                 timeout_s: float = 5.0, breaker: CircuitBreaker | None = None):
+        """send_fn(http, payload, timeout_s) -> reply dict or None (forward_to_toolhouse);
+        fallback_fn(payload) -> local reply dict."""
+        self.send_fn = send_fn
+        self.fallback_fn = fallback_fn
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self.timeout_s = timeout_s
+        self.breaker = breaker or CircuitBreaker()
+        self.pending: OrderedDict = OrderedDict()  # session_id -> (payload, deliver), newest wins
+        self.wakeup = asyncio.Event()
+        self.http = None
+        self.tasks = []
+        self.deliveries = set()  # running deliver() tasks, referenced until done
+        self.stats = {"submitted": 0, "coalesced": 0, "evicted": 0, "sent": 0, "fallback": 0}
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=32, keepalive_timeout=60)
+        self.http = aiohttp.ClientSession(connector=connector)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for t in self.tasks + list(self.deliveries):
+            t.cancel()
+        if self.http is not None:
+            await self.http.close()
+
+    def submit(self, session_id: str, payload: dict, deliver):
+        """Queue an observation for this session, replacing any not yet sent. Never blocks."""
+        self.stats["submitted"] += 1
+        if session_id in self.pending:
+            self.stats["coalesced"] += 1
+            self.pending[session_id] = (payload, deliver)  # keeps its place in line
+        else:
+            if len(self.pending) >= self.max_sessions:
+                self.pending.popitem(last=False)
+                self.stats["evicted"] += 1
+            self.pending[session_id] = (payload, deliver)
+        self.wakeup.set()
+
+    def drop(self, session_id: str):
+        self.pending.pop(session_id, None)
+
+    async def call(self, payload: dict, timeout_s: float | None = None, slow_s: float | None = None) -> dict:
+        """Send now (used for the session summary); falls back locally if the breaker is open or the call fails.
+        slow_s: latency that still counts as healthy for this call (default: the breaker's slow_s)."""
+        if self.http is None or not self.breaker.allow():
+            self.stats["fallback"] += 1
+            return self.fallback_fn(payload)
+        t0 = time.monotonic()
+        reply = None
+        try:
+            reply = await self.send_fn(self.http, payload, timeout_s or self.timeout_s)
+        finally:
+            ok = reply is not None and int(reply.get("status", 0)) < 400
+            self.breaker.record(ok, time.monotonic() - t0, slow_s)
+        if not ok:
+            self.stats["fallback"] += 1
+            return self.fallback_fn(payload)
+        self.stats["sent"] += 1
+        return reply
+
+    async def _worker(self):
+        while True:
+            while not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            _, (payload, deliver) = self.pending.popitem(last=False)
+            try:
+                reply = await self.call(payload)
+                task = asyncio.create_task(deliver(reply))
+                self.deliveries.add(task)
+                task.add_done_callback(self._delivered)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("coach worker error: %s", e)
+
+    def _delivered(self, task: asyncio.Task):
+        self.deliveries.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("coach delivery error: %s", task.exception())
@@ -0,0 +1,141 @@
+# Change-driven result push (opt-in per connection with {"type": "hello", ..., "push": "delta"}).
+#
+# Instead of one full result per frame, the client gets
+#   {"type": "snapshot", "ps": n, "cues": [[cue, level]], "ttc", "d", "col", "n", "w"}
+# on connect, every `snapshot_every_s` and on request ({"type": "resync"}), and in between
+#   {"type": "delta", "ps": n, "c+": [[cue, level]], "c-": [cue], "ttc", "d", "col", "n", "w"}
+# only when something changed: a cue appeared or disappeared, a cue level moved to another
+# 0.2 bucket (same bucketing as the Toolhouse cue fingerprint), TTC changed meaningfully, the
+# lead distance moved a bucket, the collision flag flipped, or a window score ("w") moved by
+# `score_step` points. Deltas carry only changed keys; the detection count "n" rides along on a
+# delta that is sent anyway (it flickers frame to frame, so on its own it never triggers a push).
+# "ps" increases by one per pushed message, so a client that sees a gap sends "resync".
+# "fs" is the frame sequence number (protocol v2) that produced the message.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai", "src"))
+import json_codec
+
+
+def bucket(val, step):
+    try:
+        return None if val is None else round(float(val) / step) * step
+    except Exception:
+        return None
+
+
+class DeltaPusher:
+    def __init__(self, snapshot_every_s: float = 5.0, level_step: float = 0.2,
+                 ttc_abs_s: float = 0.3, ttc_rel: float = 0.15, dist_step_m: float = 1.0,
+                 score_step: float = 1.0):
+        self.snapshot_every_s = snapshot_every_s
+        self.level_step = level_step
+        self.ttc_abs_s = ttc_abs_s
+        self.ttc_rel = ttc_rel
+        self.dist_step_m = dist_step_m
+        self.score_step = score_step
+        self.ps = 0
+        self.last_snapshot = None
+        self.cues = {}      # cue -> level bucket, as last pushed
+        self.ttc = None
+        self.dist = None
+        self.col = False
+        self.n = 0
+        self.w = None       # window scores as last pushed
+        self.stats = {"frames": 0, "snapshots": 0, "deltas": 0, "suppressed": 0}
+
+    def resync(self):
+        self.last_snapshot = None
+
+    def _ttc_changed(self, new) -> bool:
+        old = self.ttc
+        if old is None or new is None:
+            return (old is None) != (new is None)
+        return abs(new - old) > max(self.ttc_abs_s, self.ttc_rel * old)
+
+    def _scores_changed(self, new) -> bool:
+        old = self.w
+        if not old or not new:
+            return bool(old) != bool(new)
+        return old.keys() != new.keys() or any(abs(new[k] - old[k]) >= self.score_step for k in new)
+
+    def update(self, result: dict, frame_seq: int | None = None, now: float | None = None) -> str | None:
+        """JSON text to push for this frame's result, or None if nothing meaningful changed."""
+        now = time.monotonic() if now is None else now
+        self.stats["frames"] += 1
+        cues = {c["cue"]: c["level"] for c in result.get("cues") or []}
+        ttc = result.get("ttc")
+        dist = result.get("lead_distance_m")
+        col = bool(result.get("collision"))
+        n = result.get("detections", 0)
+        w = result.get("window_scores") or None
+        if self.last_snapshot is None or now - self.last_snapshot >= self.snapshot_every_s:
+            msg = {"type": "snapshot", "cues": [[k, round(v, 2)] for k, v in cues.items()],
+                   "ttc": _r(ttc), "d": _r(dist), "col": int(col), "n": n}
+            if w:
+                msg["w"] = w
+            self.last_snapshot = now
+            self.stats["snapshots"] += 1
+            self.cues = {k: bucket(v, self.level_step) for k, v in cues.items()}
+            self.ttc, self.dist, self.col, self.n, self.w = ttc, dist, col, n, w
+        else:
+            msg = {"type": "delta"}
+            levels = {k: bucket(v, self.level_step) for k, v in cues.items()}
+            added = [[k, round(cues[k], 2)] for k, b in levels.items() if self.cues.get(k, -1.0) != b]
+            removed = [k for k in self.cues if k not in levels]
+            if added:
+                msg["c+"] = added
+            if removed:
+                msg["c-"] = removed
+            self.cues = levels
+            if self._ttc_changed(ttc):
+                msg["ttc"] = _r(ttc)
+                self.ttc = ttc
+            if bucket(dist, self.dist_step_m) != bucket(self.dist, self.dist_step_m):
+                msg["d"] = _r(dist)
+                self.dist = dist
+            if col != self.col:
+                msg["col"] = int(col)
+                self.col = col
+            if self._scores_changed(w):
+                msg["w"] = w
+                self.w = w
+            if len(msg) == 1:
+                self.stats["suppressed"] += 1
+                return None
+            if n != self.n:
+                msg["n"] = n
+                self.n = n
+            self.stats["deltas"] += 1
+        self.ps += 1
+        msg["ps"] = self.ps
+        if frame_seq is not None:
+            msg["fs"] = frame_seq
+        return json_codec.dumps_str(msg)
+
+
+def _r(x, nd=3):
+    return None if x is None else round(x, nd)
+
+
+def apply_push(state: dict, msg: dict) -> bool:
+    """Client side: fold a snapshot / delta into `state` (cues as {cue: level}).
+    Returns False on a sequence gap (the caller should send {"type": "resync"})."""
+    ok = msg["type"] == "snapshot" or msg.get("ps") == state.get("ps", 0) + 1
+    state["ps"] = msg.get("ps")
+    if msg["type"] == "snapshot":
+        state["cues"] = {k: v for k, v in msg.get("cues", [])}
+        for key in ("ttc", "d", "col", "n", "w"):
+            state[key] = msg.get(key)
+        return True
+    cues = state.setdefault("cues", {})
+    for k, v in msg.get("c+", []):
+        cues[k] = v
+    for k in msg.get("c-", []):
+        cues.pop(k, None)
+    for key in ("ttc", "d", "col", "n", "w"):
+        if key in msg:
+            state[key] = msg[key]
+    return ok
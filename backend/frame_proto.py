@@ -0,0 +1,115 @@
+# Binary frame+telemetry envelope (protocol v2) for the WebSocket backend.
+#
+# One binary message per frame instead of "binary frame, then JSON telemetry":
+#   header (fixed, little endian) | image payload (JPEG bytes)
+# Results go back as compact JSON text with short keys and the frame's sequence number,
+# so they can't be confused with binary TTS audio chunks on the same socket.
+#
+# Negotiation: the client sends {"type": "hello", "proto": 2} as its first text message and
+# the server answers with the protocol it will use. Clients that never say hello get v1.
+import math
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai", "src"))
+import json_codec
+
+MAGIC = b"CCF2"
+VERSION = 2
+
+# magic, version, flags, reserved, seq, t_capture, t_send,
+# telemetry: t, speed, limit, throttle, brake, steer, lane_offset (NaN = None),
+#            tl_state code, in_stop_zone (2 = None), collision, pad,
+# payload length
+HEADER = struct.Struct("<4sBBHIdd" "dffffff" "BBBB" "I")
+
+TL_CODES = {None: 0, "red": 1, "yellow": 2, "green": 3}
+TL_NAMES = {v: k for k, v in TL_CODES.items()}
+
+
+def pack_frame(seq: int, tel: dict, payload: bytes, t_capture: float | None = None) -> bytes:
+    """Envelope one encoded frame with its telemetry. Unknown tl_state strings become None."""
+    lane = tel.get("lane_offset_m")
+    stop = tel.get("in_stop_zone")
+    now = time.time()
+    hdr = HEADER.pack(
+        MAGIC, VERSION, 0, 0, seq & 0xFFFFFFFF,
+        now if t_capture is None else t_capture, now,
+        float(tel.get("t", 0.0)), float(tel.get("speed_mps", 0.0)), float(tel.get("speed_limit_mps", 0.0)),
+        float(tel.get("throttle", 0.0)), float(tel.get("brake", 0.0)), float(tel.get("steer_deg", 0.0)),
+        math.nan if lane is None else float(lane),
+        TL_CODES.get(tel.get("tl_state"), 0), 2 if stop is None else int(bool(stop)),
+        int(bool(tel.get("collision", False))), 0,
+        len(payload),
+    )
+    return hdr + payload
+
+
+def is_frame(message) -> bool:
+    return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:4]) == MAGIC
+
+
+def unpack_frame(message: bytes) -> tuple[dict, dict, memoryview]:
+    """Return (header, telemetry dict in the README format, payload view)."""
+    (magic, version, flags, _, seq, t_capture, t_send,
+     t, speed, limit, throttle, brake, steer, lane,
+     tl, stop, collision, _, n) = HEADER.unpack_from(message)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"bad frame envelope magic={magic!r} version={version}")
+    payload = memoryview(message)[HEADER.size:HEADER.size + n]
+    if len(payload) != n:
+        raise ValueError(f"truncated frame: {len(payload)} of {n} payload bytes")
+    tel = {
+        "t": t, "speed_mps": speed, "speed_limit_mps": limit,
+        "throttle": throttle, "brake": brake, "steer_deg": steer,
+        "lane_offset_m": None if math.isnan(lane) else lane,
+        "tl_state": TL_NAMES.get(tl),
+        "in_stop_zone": None if stop == 2 else bool(stop),
+        "collision": bool(collision),
+    }
+    return {"seq": seq, "flags": flags, "t_capture": t_capture, "t_send": t_send}, tel, payload
+
+
+def _r(x, nd=3):
+    return None if x is None else round(x, nd)
+
+
+def encode_result(seq: int, result: dict, t_capture: float | None = None) -> str:
+    """Compact inference reply: s=seq, c=[[cue, level]], ttc, d=lead distance, col, n=detections, w=window scores."""
+    out = {
+        "s": seq,
+        "c": [[c["cue"], round(c["level"], 2)] for c in result.get("cues") or []],
+        "ttc": _r(result.get("ttc")),
+        "d": _r(result.get("lead_distance_m")),
+        "col": int(bool(result.get("collision"))),
+        "n": result.get("detections", 0),
+    }
+    if result.get("window_scores"):
+        out["w"] = result["window_scores"]
+    if t_capture is not None:
+        out["tc"] = t_capture  # echoed so the client can compute capture-to-cue latency
+    if result.get("coach") is not None:
+        out["coach"] = result["coach"]
+    return json_codec.dumps_str(out)
+
+
+def decode_result(msg: dict) -> dict:
+    """Expand a compact reply back to the v1 field names."""
+    out = {
+        "type": "inference",
+        "seq": msg.get("s"),
+        "cues": [{"cue": c, "level": lvl} for c, lvl in msg.get("c", [])],
+        "ttc": msg.get("ttc"),
+        "lead_distance_m": msg.get("d"),
+        "collision": bool(msg.get("col")),
+        "detections": msg.get("n"),
+    }
+    if "w" in msg:
+        out["window_scores"] = msg["w"]
+    if "tc" in msg:
+        out["t_capture"] = msg["tc"]
+    if "coach" in msg:
+        out["coach"] = msg["coach"]
+    return out
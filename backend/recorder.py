@@ -0,0 +1,296 @@
+# Opt-in recorder for live sessions (RECORD_DIR) and a replay tool for the archives.
+#
+# One directory per session:
+#   frames.bin  concatenated protocol v2 envelopes (frame_proto header with telemetry + JPEG bytes)
+#   index.bin   one fixed record per frame: offset, length, seq, arrival time (see INDEX_DTYPE)
+#   meta.json   session id, creation time, format version
+# v2 envelopes are stored as received; v1 frame + telemetry pairs are packed into the same format.
+# The WebSocket handler only enqueues; a background thread does all packing and file I/O, and
+# frames are dropped (and counted) rather than blocking when the queue is full.
+#
+# Replay into the WebSocket backend or straight into the inference API:
+#   python recorder.py info   recordings/<session_id>
+#   python recorder.py replay recordings/<session_id> --ws ws://localhost:8765
+#   python recorder.py replay recordings/<session_id> --http http://localhost:8000 --speed 0   # as fast as possible
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from frame_proto import pack_frame, unpack_frame, decode_result
+
+# child of the gateway's "backend" logger when running inside app.py
+log = logging.getLogger("backend.recorder")
+
+FORMAT_VERSION = 1
+INDEX = struct.Struct("<QIId")  # offset, length, seq, t_recv (epoch seconds at the backend)
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("seq", "<u4"), ("t_recv", "<f8")])
+
+
+class SessionRecorder:
+    def __init__(self, root: str, max_queue: int = 1024, flush_every: int = 64):
+        self.root = root
+        self.flush_every = flush_every
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.files = {}  # session_id -> [frames file, index file, bytes written, records since flush]
+        self.thread = None
+        self.stats = {"frames": 0, "bytes": 0, "dropped": 0, "sessions": 0}
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)  # blocking on purpose: drain everything before exit
+            self.thread.join()
+            self.thread = None
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def record(self, session_id: str, envelope: bytes, t_recv: float):
+        """A protocol v2 message, stored as received."""
+        self._put(("env", session_id, envelope, t_recv))
+
+    def record_v1(self, session_id: str, seq: int, telemetry: dict, jpeg: bytes, t_recv: float):
+        """A protocol v1 frame + telemetry pair; enveloped on the writer thread."""
+        self._put(("v1", session_id, (seq, telemetry, jpeg), t_recv))
+
+    def end(self, session_id: str):
+        self._put(("end", session_id, None, 0.0))
+
+    def _open(self, session_id: str):
+        d = os.path.join(self.root, session_id)
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, "meta.json"), "w") as f:
+            json.dump({"session_id": session_id, "created": time.time(), "format": FORMAT_VERSION}, f)
+        entry = [open(os.path.join(d, "frames.bin"), "ab"), open(os.path.join(d, "index.bin"), "ab"), 0, 0]
+        entry[2] = entry[0].tell()
+        self.files[session_id] = entry
+        self.stats["sessions"] += 1
+        return entry
+
+    def _close_files(self, session_id: str):
+        entry = self.files.pop(session_id, None)
+        if entry is not None:
+            entry[0].close()
+            entry[1].close()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            kind, session_id, data, t_recv = item
+            try:
+                if kind == "end":
+                    self._close_files(session_id)
+                    continue
+                if kind == "v1":
+                    seq, tel, jpeg = data
+                    data = pack_frame(seq, tel, jpeg, t_capture=t_recv)
+                entry = self.files.get(session_id) or self._open(session_id)
+                seq = struct.unpack_from("<I", data, 8)[0]  # envelope header: 4s B B H | I seq
+                entry[0].write(data)
+                entry[1].write(INDEX.pack(entry[2], len(data), seq, t_recv))
+                entry[2] += len(data)
+                entry[3] += 1
+                if entry[3] >= self.flush_every:
+                    entry[0].flush()
+                    entry[1].flush()
+                    entry[3] = 0
+                self.stats["frames"] += 1
+                self.stats["bytes"] += len(data)
+            except Exception as e:
+                log.warning("recorder error (%s): %s", session_id, e)
+        for session_id in list(self.files):
+            self._close_files(session_id)
+
+
+class Archive:
+    """Read-only view of one recorded session (frames memory-mapped)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.index = np.fromfile(os.path.join(path, "index.bin"), dtype=INDEX_DTYPE)
+        self._file = open(os.path.join(path, "frames.bin"), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # a record whose bytes never made it to disk (crash mid-write) is ignored
+        self.index = self.index[self.index["offset"] + self.index["length"] <= size]
+
+    def __len__(self):
+        return len(self.index)
+
+    def envelope(self, i: int) -> bytes:
+        rec = self.index[i]
+        return self.blob[int(rec["offset"]):int(rec["offset"]) + int(rec["length"])]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield float(self.index[i]["t_recv"]), self.envelope(i)
+
+    def info(self) -> dict:
+        t = self.index["t_recv"]
+        return {"session_id": self.meta.get("session_id"), "frames": len(self),
+                "duration_s": round(float(t[-1] - t[0]), 3) if len(t) else 0.0,
+                "bytes": int(self.index["length"].sum()) if len(t) else 0}
+
+    def close(self):
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self._file.close()
+
+
+async def _paced(archive: Archive, speed: float):
+    """Yield envelopes at the recorded pace scaled by `speed` (0 = as fast as possible)."""
+    t0_rec = None
+    t0 = time.perf_counter()
+    for t_recv, env in archive:
+        if t0_rec is None:
+            t0_rec = t_recv
+        if speed > 0:
+            delay = t0 + (t_recv - t0_rec) / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield env
+
+
+async def replay_ws(archive: Archive, ws_url: str, speed: float = 1.0, proto: int = 2, final_timeout_s: float = 25.0) -> dict:
+    import websockets
+    sent_at = {}
+    fifo = []
+    lat = []
+    final = {}
+    done = asyncio.Event()
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        if proto >= 2:
+            await ws.send(json.dumps({"type": "hello", "proto": 2}))
+            reply = json.loads(await asyncio.wait_for(ws.recv(), timeout=2.0))
+            proto = int(reply.get("proto", 1)) if reply.get("type") == "hello" else 1
+
+        async def receiver():
+            async for msg in ws:
+                if isinstance(msg, bytes):
+                    continue  # TTS audio
+                data = json.loads(msg)
+                if "s" in data:
+                    data = decode_result(data)
+                if data.get("type") == "final" or "errMsg" in data:
+                    final.update(data)
+                    done.set()
+                elif data.get("type") == "inference":
+                    t_sent = sent_at.pop(data.get("seq"), None) if proto >= 2 else (fifo.pop(0) if fifo else None)
+                    if t_sent is not None:
+                        lat.append((time.perf_counter() - t_sent) * 1000.0)
+
+        recv_task = asyncio.create_task(receiver())
+        n = 0
+        try:
+            async for env in _paced(archive, speed):
+                hdr, tel, payload = unpack_frame(env)
+                if proto >= 2:
+                    # re-stamp the send time; capture time and telemetry are kept as recorded
+                    sent_at[hdr["seq"]] = time.perf_counter()
+                    await ws.send(pack_frame(hdr["seq"], tel, bytes(payload), t_capture=hdr["t_capture"]))
+                else:
+                    fifo.append(time.perf_counter())
+                    await ws.send(bytes(payload))
+                    await ws.send(json.dumps(tel))
+                n += 1
+            await ws.send("DONE")
+            try:
+                await asyncio.wait_for(done.wait(), timeout=final_timeout_s)
+            except asyncio.TimeoutError:
+                print("Final score response timed out or missing")
+        finally:
+            recv_task.cancel()
+    return _report(n, lat, final)
+
+
+async def replay_http(archive: Archive, base_url: str, speed: float = 1.0, session_id: str | None = None) -> dict:
+    import aiohttp
+    session_id = session_id or f"replay-{uuid.uuid4().hex[:8]}"
+    lat = []
+    shed = 0
+    n = 0
+    async with aiohttp.ClientSession() as http:
+        # sequential, so the session's frames reach the scorer in order; at speed > 0 a frame is
+        # never sent before its recorded time, but is sent late if the previous reply was slow
+        async for env in _paced(archive, speed):
+            _, tel, payload = unpack_frame(env)
+            form = aiohttp.FormData()
+            form.add_field("image", bytes(payload), filename="frame.jpg", content_type="image/jpeg")
+            form.add_field("telemetry", json.dumps(tel))
+            form.add_field("session_id", session_id)
+            t0 = time.perf_counter()
+            async with http.post(base_url.rstrip("/") + "/infer_frame", data=form) as resp:
+                await resp.read()
+                shed += resp.status in (429, 503)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+            n += 1
+        end = aiohttp.FormData()
+        end.add_field("session_id", session_id)
+        async with http.post(base_url.rstrip("/") + "/end_session", data=end) as resp:
+            final = await resp.json()
+    out = _report(n, lat, final)
+    out["shed"] = shed
+    return out
+
+
+def _report(sent: int, lat: list, final: dict) -> dict:
+    a = np.array(lat) if lat else None
+    return {
+        "frames_sent": sent,
+        "replies": len(lat),
+        "latency_ms_p50": None if a is None else round(float(np.percentile(a, 50)), 1),
+        "latency_ms_p99": None if a is None else round(float(np.percentile(a, 99)), 1),
+        "final": final.get("final"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or replay recorded sessions")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_info = sub.add_parser("info", help="Summarize one or more archives")
+    p_info.add_argument("archives", nargs="+")
+    p_rep = sub.add_parser("replay", help="Replay an archive into the WebSocket backend or the inference API")
+    p_rep.add_argument("archive")
+    target = p_rep.add_mutually_exclusive_group(required=True)
+    target.add_argument("--ws", help="WebSocket backend URL, e.g. ws://localhost:8765")
+    target.add_argument("--http", help="Inference API base URL, e.g. http://localhost:8000")
+    p_rep.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace, 2 = twice as fast, 0 = as fast as possible")
+    p_rep.add_argument("--proto", type=int, default=2, choices=[1, 2], help="WebSocket protocol to replay with")
+    args = parser.parse_args()
+
+    if args.cmd == "info":
+        for path in args.archives:
+            a = Archive(path)
+            print(json.dumps(a.info()))
+            a.close()
+    else:
+        a = Archive(args.archive)
+        try:
+            if args.ws:
+                report = asyncio.run(replay_ws(a, args.ws, args.speed, args.proto))
+            else:
+                report = asyncio.run(replay_http(a, args.http, args.speed))
+        finally:
+            a.close()
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,72 @@
+# Round trip of the change-driven push: DeltaPusher.update on the server, apply_push on the client.
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from delta_push import DeltaPusher, apply_push
+
+CUES = ("SLOW_DOWN", "KEEP_LANE", "INCREASE_HEADWAY", "BRAKE_NOW")
+
+
+def random_result(rng, t):
+    return {
+        "cues": [{"cue": c, "level": rng.random()} for c in CUES if rng.random() < 0.3],
+        "ttc": rng.choice([None, rng.uniform(0.5, 8.0)]),
+        "lead_distance_m": rng.choice([None, rng.uniform(2.0, 60.0)]),
+        "collision": rng.random() < 0.05,
+        "detections": rng.randint(0, 6),
+        "window_scores": {"30": round(80 + 10 * rng.random(), 1), "60": round(85 + 5 * rng.random(), 1)},
+    }
+
+
+def check_matches(pusher, state):
+    """Client state agrees with what the server last pushed (levels within their bucket; pushed levels are rounded)."""
+    assert state["cues"].keys() == pusher.cues.keys()
+    for k, v in state["cues"].items():
+        assert abs(v - pusher.cues[k]) <= pusher.level_step / 2 + 0.01
+    assert state["ttc"] == (None if pusher.ttc is None else round(pusher.ttc, 3))
+    assert state["d"] == (None if pusher.dist is None else round(pusher.dist, 3))
+    assert bool(state["col"]) == pusher.col
+    assert state["w"] == pusher.w
+
+
+def test_round_trip():
+    rng = random.Random(1)
+    pusher, state = DeltaPusher(snapshot_every_s=5.0), {}
+    for k in range(500):
+        msg = pusher.update(random_result(rng, k * 0.1), frame_seq=k, now=k * 0.1)
+        if msg is not None:
+            assert apply_push(state, json.loads(msg))
+            assert state.get("fs") is None  # fs is for latency matching, not state
+        check_matches(pusher, state)
+    assert pusher.stats["deltas"] > 0 and pusher.stats["snapshots"] > 1
+
+
+def test_window_scores_and_detections_in_deltas():
+    pusher, state = DeltaPusher(), {}
+    base = {"cues": [], "ttc": None, "lead_distance_m": None, "collision": False,
+            "detections": 2, "window_scores": {"30": 90.0}}
+    apply_push(state, json.loads(pusher.update(base, now=0.0)))
+    assert pusher.update(dict(base, detections=3), now=0.1) is None           # n alone: no push
+    assert pusher.update(dict(base, window_scores={"30": 90.5}), now=0.2) is None
+    msg = json.loads(pusher.update(dict(base, detections=4, window_scores={"30": 88.9}), now=0.3))
+    assert msg["type"] == "delta" and msg["w"] == {"30": 88.9} and msg["n"] == 4
+    assert apply_push(state, msg) and state["w"] == {"30": 88.9} and state["n"] == 4
+
+
+def test_gap_then_resync():
+    pusher, state = DeltaPusher(), {}
+    r = {"cues": [{"cue": "SLOW_DOWN", "level": 0.5}], "ttc": 3.0, "lead_distance_m": 20.0,
+         "collision": False, "detections": 1}
+    assert apply_push(state, json.loads(pusher.update(r, now=0.0)))
+    pusher.update(dict(r, cues=[]), now=0.1)                                  # lost in transit
+    msg = json.loads(pusher.update(dict(r, ttc=1.0), now=0.2))
+    assert not apply_push(state, msg)                                         # gap detected
+    pusher.resync()                                                           # client sent {"type": "resync"}
+    msg = json.loads(pusher.update(dict(r, cues=[], ttc=1.0), now=0.3))
+    assert msg["type"] == "snapshot" and apply_push(state, msg)
+    assert state["cues"] == {} and state["ttc"] == 1.0
+    msg = json.loads(pusher.update(dict(r, cues=[], ttc=4.0), now=0.4))
+    assert msg["type"] == "delta" and apply_push(state, msg) and state["ttc"] == 4.0
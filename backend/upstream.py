@@ -0,0 +1,145 @@
+# Session-aware pool of inference API instances.
+#
+# - Consistent hashing on session_id picks an instance, so a session's ScoringState stays
+#   on one API process; the first request of a session chooses the less busy of the first
+#   `choices` healthy instances on the ring (least outstanding requests) and is then pinned.
+# - One keep-alive aiohttp connection pool is shared by every WebSocket connection.
+# - A background task polls GET /healthz; unhealthy instances are skipped until they recover.
+#   Request errors only mark an instance unhealthy after `fail_threshold` in a row.
+# - A pinned session is never moved on a transient error (its frames fail instead), because a
+#   new instance starts a fresh ScoringState and the final score would be split. It moves only
+#   once its instance has been unhealthy for `failover_s`.
+#
+# Try it with several local instances:
+#   uvicorn api:app --port 8000 & uvicorn api:app --port 8001 &
+#   INFER_URLS=http://localhost:8000,http://localhost:8001 python app.py
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+
+import aiohttp
+
+log = logging.getLogger("backend.upstream")
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class Upstream:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.down_since = None   # monotonic time it was last marked unhealthy
+        self.consecutive_failures = 0
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+    def set_healthy(self, ok: bool):
+        if ok:
+            self.consecutive_failures = 0
+            self.down_since = None
+        elif self.healthy:
+            self.down_since = time.monotonic()
+        self.healthy = ok
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "outstanding": self.outstanding,
+                "requests": self.requests, "failures": self.failures}
+
+
+class UpstreamPool:
+    def __init__(self, urls: list[str], vnodes: int = 64, choices: int = 2,
+                 health_path: str = "/healthz", health_interval_s: float = 2.0, timeout_s: float = 10.0,
+                 fail_threshold: int = 3, failover_s: float = 30.0):
+        if not urls:
+            raise ValueError("UpstreamPool needs at least one inference URL")
+        self.upstreams = [Upstream(u) for u in urls]
+        self.choices = max(1, choices)
+        self.health_path = health_path
+        self.health_interval_s = health_interval_s
+        self.fail_threshold = max(1, fail_threshold)
+        self.failover_s = failover_s
+        self.timeout = aiohttp.ClientTimeout(total=timeout_s)
+        ring = sorted((_hash(f"{u.url}#{i}"), u) for u in self.upstreams for i in range(vnodes))
+        self.ring_keys = [k for k, _ in ring]
+        self.ring_nodes = [u for _, u in ring]
+        self.pinned: dict[str, Upstream] = {}
+        self.http = None
+        self.health_task = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=256, limit_per_host=64, keepalive_timeout=60)
+        self.http = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        self.health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self.health_task:
+            self.health_task.cancel()
+        if self.http is not None:
+            await self.http.close()
+
+    def candidates(self, session_id: str) -> list[Upstream]:
+        """Distinct instances in ring order starting at the session's hash (healthy ones first)."""
+        start = bisect.bisect(self.ring_keys, _hash(session_id))
+        seen, out = set(), []
+        for k in range(len(self.ring_nodes)):
+            u = self.ring_nodes[(start + k) % len(self.ring_nodes)]
+            if id(u) not in seen:
+                seen.add(id(u))
+                out.append(u)
+                if len(out) == len(self.upstreams):
+                    break
+        return [u for u in out if u.healthy] + [u for u in out if not u.healthy]
+
+    def pick(self, session_id: str) -> Upstream:
+        u = self.pinned.get(session_id)
+        if u is not None:
+            if u.healthy or time.monotonic() - u.down_since < self.failover_s:
+                return u  # stay pinned through transient errors; the frame fails instead
+            log.warning("session %s moved off %s (down %.0fs); its score restarts on the new instance",
+                        session_id, u.url, time.monotonic() - u.down_since)
+        cands = self.candidates(session_id)
+        healthy = [c for c in cands if c.healthy][:self.choices] or cands[:1]
+        u = min(healthy, key=lambda c: c.outstanding)  # min() keeps ring order on ties
+        self.pinned[session_id] = u
+        return u
+
+    def release(self, session_id: str):
+        self.pinned.pop(session_id, None)
+
+    async def post(self, session_id: str, path: str, data=None) -> dict:
+        u = self.pick(session_id)
+        u.outstanding += 1
+        u.requests += 1
+        try:
+            async with self.http.post(u.url + path, data=data) as resp:
+                out = await resp.json()
+            u.consecutive_failures = 0
+            return out
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            u.failures += 1
+            u.consecutive_failures += 1
+            if u.consecutive_failures >= self.fail_threshold:
+                u.set_healthy(False)  # health loop brings it back
+            raise
+        finally:
+            u.outstanding -= 1
+
+    def stats(self) -> dict:
+        return {u.url: u.stats() for u in self.upstreams}
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self._check(u) for u in self.upstreams))
+            await asyncio.sleep(self.health_interval_s)
+
+    async def _check(self, u: Upstream):
+        try:
+            async with self.http.get(u.url + self.health_path, timeout=aiohttp.ClientTimeout(total=2.0)) as resp:
+                u.set_healthy(resp.status == 200)
+        except Exception:
+            u.set_healthy(False)
@@ -9,6 +9,8 @@ import os
 from dotenv import load_dotenv
 import cv2
 import numpy as np
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()  # take environment variables
 
@@ -24,6 +26,53 @@ TOKEN = api.AccessToken() \
         room="my-room",
     )).to_jwt()
 
+# 'http' posts every frame to the inference API; 'inprocess' hosts detector + scorer in this process;
+# 'shm' hands decoded frames to a co-located api.py (started with SHM_SOCKET) through shared memory
+INFER_MODE = os.getenv("INFER_MODE", "http").lower()
+INFER_URL = os.getenv("INFER_URL", "http://localhost:8000/infer_frame")
+# Worker threads for in-process inference. All workers share one model, so >1 only helps
+# when part of the per-frame work (decode, tracking, scoring) overlaps with the detector.
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", "1"))
+
+inference = None
+executor = None
+if INFER_MODE == "inprocess":
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai", "src"))
+    import api as inference  # loads the model once, sessions keyed by participant identity
+    executor = ThreadPoolExecutor(max_workers=INFER_WORKERS, thread_name_prefix="infer")
+SHM_SOCKET = os.getenv("SHM_SOCKET", "/tmp/crashcourse-infer.sock")
+if INFER_MODE == "shm":
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai", "src"))
+    from shm_transport import ShmClient
+
+
+class LatestFrame:
+    """Single-slot mailbox: a new frame overwrites one that hasn't been picked up yet."""
+    def __init__(self):
+        self.frame = None
+        self.event = asyncio.Event()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        if self.frame is not None:
+            self.dropped += 1
+        self.frame = frame
+        self.received += 1
+        self.event.set()
+
+    async def take(self):
+        while self.frame is None and not self.closed:
+            self.event.clear()
+            await self.event.wait()
+        frame, self.frame = self.frame, None
+        return frame
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
 async def main():
     room = rtc.Room()
 
@@ -32,47 +81,103 @@ async def main():
         logging.info(
                 "participant connected: %s %s", participant.sid, participant.identity)
 
-    telemetry_cache = {}
-
-    async def receive_video_frames(stream: rtc.VideoStream):
-        async with aiohttp.ClientSession() as session:
-            async for frame in stream:
-                # Convert frame to JPEG bytes properly
+    telemetry_cache = {}  # participant identity -> latest telemetry JSON string
+    tasks = set()
+
+    def spawn(coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    async def infer(http: aiohttp.ClientSession, arr: np.ndarray, identity: str):
+        telemetry_str = telemetry_cache[identity]  # callers skip frames until telemetry has arrived
+        if shm_client is not None:
+            return await shm_client.infer(arr, telemetry_str, identity)
+        if inference is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                executor, inference.process_image_and_telemetry, arr, telemetry_str, identity)
+
+        # Encode as JPEG
+        _, image_bytes = cv2.imencode('.jpg', arr)
+        data = aiohttp.FormData()
+        data.add_field('image', image_bytes.tobytes(), filename='frame.jpg', content_type='image/jpeg')
+        data.add_field('telemetry', telemetry_str)
+        data.add_field('session_id', identity)
+        async with http.post(INFER_URL, data=data) as resp:
+            return await resp.json()
+
+    async def receive_video_frames(http: aiohttp.ClientSession, stream: rtc.VideoStream, identity: str):
+        # Reader keeps only the newest frame; the worker processes whatever is newest when it is free
+        slot = LatestFrame()
+
+        async def reader():
+            try:
+                async for event in stream:
+                    slot.put(event.frame if hasattr(event, "frame") else event)
+            finally:
+                slot.close()
+
+        reader_task = spawn(reader())
+        no_telemetry = 0
+        try:
+            while True:
+                frame = await slot.take()
+                if frame is None:
+                    break
+                if identity not in telemetry_cache:
+                    # a frame can't be scored without telemetry (the API rejects "{}"); wait for the first packet
+                    no_telemetry += 1
+                    continue
                 # Convert the frame to numpy array
                 arr = frame.to_ndarray(format="bgr24")
-                # Encode as JPEG
-                _, image_bytes = cv2.imencode('.jpg', arr)
-                image_bytes = image_bytes.tobytes()
-
-                telemetry_str = telemetry_cache.get("latest", "{}")
-                data = aiohttp.FormData()
-                data.add_field('image', image_bytes, filename='frame.jpg', content_type='image/jpeg')
-                data.add_field('telemetry', telemetry_str)
-
                 try:
-                    async with session.post('http://localhost:8000/infer_frame', data=data) as resp:
-                        result = await resp.json()
-                        print("Inference result:", result)
+                    result = await infer(http, arr, identity)
+                    logging.debug("Inference result[%s]: %s", identity, result)
                 except Exception as e:
                     logging.error(f"Error during inference: {e}")
+        finally:
+            reader_task.cancel()
+            logging.info("video track ended for %s: %d frames, %d dropped (latest-frame-wins), %d before telemetry",
+                         identity, slot.received, slot.dropped, no_telemetry)
 
-    async def receive_telemetry_data(track: rtc.Track):
+    async def receive_telemetry_data(track: rtc.Track, identity: str):
         while True:
             data = await track.read()  # reads the next data packet (bytes)
             if data is None:
                 break  # track ended
-            telemetry_cache["latest"] = data.decode('utf-8')
+            telemetry_cache[identity] = data.decode('utf-8')
 
-    # track_subscribed is emitted whenever the local participant is subscribed to a new track
+    async def expire_sessions():
+        # in-process mode has no FastAPI startup task: sweep sessions of participants that left
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(inference.SWEEP_INTERVAL_S)
+            stale = await loop.run_in_executor(None, inference.expire_idle)
+            if stale:
+                logging.info("expired %d idle session(s)", len(stale))
+
+    if inference is not None and inference.SESSION_IDLE_S > 0:
+        spawn(expire_sessions())
+
+    http = aiohttp.ClientSession()
+    shm_client = None
+    if INFER_MODE == "shm":
+        shm_client = ShmClient(SHM_SOCKET)
+        await shm_client.connect()
+
+    # track_subscribed is emitted whenever the local participant is subscribed to a new track.
+    # Each track gets its own task so participants (and their tracks) never wait on each other.
     @room.on("track_subscribed")
-    async def on_track_subscribed(track: rtc.Track, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant):
+    def on_track_subscribed(track: rtc.Track, publication: rtc.RemoteTrackPublication, participant: rtc.RemoteParticipant):
         logging.info("track subscribed: %s", publication.sid)
         if track.kind == rtc.TrackKind.KIND_VIDEO:
             video_stream = rtc.VideoStream(track)
-            await receive_video_frames(video_stream)
+            spawn(receive_video_frames(http, video_stream, participant.identity))
         # if track.kind == rtc.TrackKind.TELEMETRY_DATA:
         if track.kind == rtc.TrackKind.KIND_UNKNOWN:
-            await receive_telemetry_data(track)
+            spawn(receive_telemetry_data(track, participant.identity))
 
     # By default, autosubscribe is enabled. The participant will be subscribed to
     # all published tracks in the room
@@ -88,7 +193,12 @@ async def main():
             print(f"\ttrack id: {publication}")
 
     # Keep the connection alive
-    await asyncio.Future()  # runs forever
+    try:
+        await asyncio.Future()  # runs forever
+    finally:
+        await http.close()
+        if shm_client is not None:
+            await shm_client.close()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -1,15 +1,22 @@
 import asyncio
 import json
+import os
+import sys
 import time
 import cv2
 import websockets
 import argparse
 import math
-import sounddevice as sd
+import random
 import numpy as np
-from pydub import AudioSegment
 from io import BytesIO
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from frame_proto import pack_frame, decode_result
+from delta_push import apply_push
+
+# Frames per driver when load testing with several clients and no --max-frames (each clip is held in memory)
+LOAD_MAX_FRAMES = 600
 
 def gen_telemetry(t: float, speed_limit_mps: float = 13.4) -> dict:
     # Simple synthetic telemetry resembling README format
@@ -29,6 +36,10 @@ def gen_telemetry(t: float, speed_limit_mps: float = 13.4) -> dict:
 
 
 def play_audio(audio_bytes):
+    # Imported lazily so --headless load runs don't need audio libraries or a sound device
+    import sounddevice as sd
+    from pydub import AudioSegment
+
     # Decode bytes (assumed MP3 or other compressed format) to PCM audio
     audio_segment = AudioSegment.from_file(BytesIO(audio_bytes), format="mp3")  # adjust format if needed
     raw_data = audio_segment.raw_data
@@ -55,99 +66,222 @@ def play_audio(audio_bytes):
     sd.play(audio_float, samplerate=sample_rate)
     sd.wait()
 
-async def stream_video(video_path: str, ws_url: str = "ws://localhost:8765", fps: float = 12.0):
+async def negotiate(ws, proto: int, push: bool = False) -> tuple[int, bool]:
+    """Ask for the binary envelope protocol (and change-driven push); fall back to v1 / per-frame
+    results if the server doesn't confirm."""
+    if proto < 2 and not push:
+        return 1, False
+    hello = {"type": "hello", "proto": proto}
+    if push:
+        hello["push"] = "delta"
+    await ws.send(json.dumps(hello))
+    try:
+        reply = json.loads(await asyncio.wait_for(ws.recv(), timeout=2.0))
+        if reply.get("type") != "hello":
+            return 1, False
+        return int(reply.get("proto", 1)), reply.get("push") == "delta"
+    except (asyncio.TimeoutError, ValueError, TypeError):
+        return 1, False
+
+def load_frames(video_path: str, max_frames: int) -> list[bytes]:
+    """Decode and JPEG-encode a video once up front, so client-side encoding never limits the send rate.
+    max_frames 0 means the whole clip."""
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise SystemExit(f"Cannot open {video_path}")
+    frames = []
+    try:
+        while not max_frames or len(frames) < max_frames:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            ok_jpg, enc = cv2.imencode('.jpg', frame)
+            if not ok_jpg:
+                print("Warn: JPEG encode failed; skipping frame")
+                continue
+            frames.append(enc.tobytes())
+    finally:
+        cap.release()
+    if not frames:
+        raise SystemExit(f"No frames decoded from {video_path}")
+    return frames
 
-    frame_period = 1.0 / max(1e-3, fps)
-    t0 = time.time()
 
-    async with websockets.connect(ws_url) as ws:
-        audio_file_idx = 0
-        audio_bytes = b''
+class LoadStats:
+    """Counters shared by every simulated driver."""
+    def __init__(self):
+        self.sent = 0
+        self.replies = 0
+        self.errors = 0
+        self.finals = 0
+        self.audio_chunks = 0
+        self.push_msgs = 0
+        self.push_gaps = 0
+        self.latencies_ms: list[float] = []
+        self.approx_latency = False   # v1 server without seq echo: replies matched to sends in order
+        self.t_start = time.perf_counter()
+        self.t_end = None
 
-        try:
-            while True:
-                ok, frame = cap.read()
-                if not ok:
-                    break
-
-                ok_jpg, enc = cv2.imencode('.jpg', frame)
-                if not ok_jpg:
-                    print("Warn: JPEG encode failed; skipping frame")
-                    await asyncio.sleep(frame_period)
-                    continue
+    def report(self) -> dict:
+        elapsed = (self.t_end or time.perf_counter()) - self.t_start
+        lat = np.array(self.latencies_ms) if self.latencies_ms else None
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "frames_sent": self.sent,
+            "replies": self.replies,
+            "dropped": self.sent - self.replies,
+            "server_errors": self.errors,
+            "finals": self.finals,
+            "audio_chunks": self.audio_chunks,
+            "push_msgs": self.push_msgs,
+            "push_gaps": self.push_gaps,
+            "send_fps": round(self.sent / max(elapsed, 1e-9), 2),
+            "reply_fps": round(self.replies / max(elapsed, 1e-9), 2),
+            "latency_ms_p50": None if lat is None else round(float(np.percentile(lat, 50)), 1),
+            "latency_ms_p99": None if lat is None else round(float(np.percentile(lat, 99)), 1),
+            "latency_ms_max": None if lat is None else round(float(lat.max()), 1),
+            "latency_approx": self.approx_latency,
+        }
 
-                # Send binary frame
-                await ws.send(enc.tobytes())
 
-                # Send matching telemetry
-                t = time.time() - t0
-                tel = gen_telemetry(t)
-                await ws.send(json.dumps(tel))
+async def run_driver(idx: int, frames: list[bytes], ws_url: str, fps: float, proto: int,
+                     stats: LoadStats, headless: bool = True, verbose: bool = False,
+                     final_timeout_s: float = 25.0, push: bool = False):
+    """One simulated driver: sends frames open-loop at a fixed rate and matches replies to sends."""
+    frame_period = 1.0 / max(1e-3, fps)
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        proto, push = await negotiate(ws, proto, push)
+        if verbose:
+            print(f"[driver {idx}] using protocol v{proto}" + (" with delta push" if push else ""))
+        push_state: dict = {}
+        sent_at: dict[int, float] = {}   # seq -> send time (v1 sends it in the telemetry; the server echoes it)
+        fifo: list[int] = []             # v1 seqs in send order, for servers that don't echo seq
+        final_seen = asyncio.Event()
+        audio_bytes = b''
 
-                # Optionally read back inference result (non-blocking)
-                try:
-                    while (resp := await asyncio.wait_for(ws.recv(), timeout=2.5)) and isinstance(resp, bytes): # then we are receiving audio bytes
-                        audio_bytes += resp
-                    if audio_bytes:
-                        play_audio(audio_bytes)
-                        audio_bytes = b''
-                        audio_file_idx += 1
-                        continue
-                    try:
-                        data = json.loads(resp)
-                        collided = data.get("collision")
-                        ttc = data.get("ttc")
-                        dist = data.get("lead_distance_m")
-                        cues = data.get("cues")
-                        kind = data.get("type", "inference")
-                        print(f"Result[{kind}]: ttc={ttc}  dist_m={dist}  collided={collided}  cues={cues}")
-                        coach = data.get("coach")
-                        if coach is not None:
-                            print("Coach:", coach)
-                    except Exception:
-                        print("Result:", resp)
-                except asyncio.TimeoutError:
-                    pass
-
-                await asyncio.sleep(frame_period)
-
-            # Signal end of session and read final
-            await ws.send("DONE")
-            # Drain messages until we receive the one marked as final
-            received_final = False
-            deadline = time.time() + 25.0
-            while time.time() < deadline and not received_final:
-                try:
-                    msg = await asyncio.wait_for(ws.recv(), timeout=max(0.1, deadline - time.time()))
-                except asyncio.TimeoutError:
-                    break
+        async def receiver():
+            nonlocal audio_bytes
+            loop = asyncio.get_running_loop()
+            async for msg in ws:
+                if isinstance(msg, bytes):  # TTS audio chunk
+                    stats.audio_chunks += 1
+                    audio_bytes += msg
+                    continue
+                if audio_bytes and not headless:
+                    # Play on a worker thread so sd.wait() never stalls sending or latency timing
+                    loop.run_in_executor(None, play_audio, audio_bytes)
+                audio_bytes = b''
                 try:
                     data = json.loads(msg)
-                except Exception:
-                    print("Final (raw):", msg)
+                except ValueError:
+                    stats.errors += 1
                     continue
-                if data.get("type") == "final":
-                    print("Final:", data)
+                if "s" in data:
+                    data = decode_result(data)
+                kind = data.get("type")
+                if kind == "coach":  # pushed asynchronously, not tied to a frame
+                    if verbose:
+                        print(f"[driver {idx}] Coach:", data.get("coach"))
+                    continue
+                if kind in ("snapshot", "delta"):  # change-driven push: no reply per frame
+                    stats.push_msgs += 1
+                    if not apply_push(push_state, data):
+                        stats.push_gaps += 1
+                        await ws.send(json.dumps({"type": "resync"}))
+                    t_sent = sent_at.pop(data["fs"], None) if data.get("fs") is not None else None
+                    if t_sent is not None:
+                        stats.replies += 1
+                        stats.latencies_ms.append((time.perf_counter() - t_sent) * 1000.0)
+                    if verbose:
+                        print(f"[driver {idx}] {kind}: ttc={push_state.get('ttc')}  cues={push_state.get('cues')}")
+                    continue
+                if kind == "final":
+                    stats.finals += 1
+                    if verbose:
+                        print(f"[driver {idx}] Final:", data)
+                    final_seen.set()
+                    continue
+                if "errMsg" in data or "detail" in data:
+                    stats.errors += 1
+                    final_seen.set()
+                    continue
+                if data.get("seq") is not None:
+                    t_sent = sent_at.pop(data["seq"], None)
+                else:
+                    # older server: match in order; after a dropped reply every later latency is off, so flag it
+                    stats.approx_latency = True
+                    t_sent = sent_at.pop(fifo.pop(0), None) if fifo else None
+                if t_sent is None:
+                    continue
+                stats.replies += 1
+                stats.latencies_ms.append((time.perf_counter() - t_sent) * 1000.0)
+                if verbose:
+                    print(f"[driver {idx}] Result: ttc={data.get('ttc')}  dist_m={data.get('lead_distance_m')}  "
+                          f"collided={data.get('collision')}  cues={data.get('cues')}")
                     if data.get("coach") is not None:
-                        print("Coach (final):", data["coach"])
-                    received_final = True
+                        print("Coach:", data["coach"])
+
+        recv_task = asyncio.create_task(receiver())
+        # random phase so N drivers don't all send on the same tick
+        t0 = time.perf_counter() + random.random() * frame_period
+        try:
+            for k, jpg in enumerate(frames):
+                delay = t0 + k * frame_period - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tel = gen_telemetry(k * frame_period)
+                sent_at[k] = time.perf_counter()
+                if proto >= 2:
+                    await ws.send(pack_frame(k, tel, jpg))
                 else:
-                    # late in-flight inference; print briefly and continue waiting
-                    print("Late inference after DONE:", data)
-            if not received_final:
-                print("Final score response timed out or missing")
+                    fifo.append(k)
+                    await ws.send(jpg)
+                    await ws.send(json.dumps(dict(tel, seq=k)))
+                stats.sent += 1
+
+            # Signal end of session and wait for the final score
+            await ws.send("DONE")
+            try:
+                await asyncio.wait_for(final_seen.wait(), timeout=final_timeout_s)
+            except asyncio.TimeoutError:
+                print(f"[driver {idx}] Final score response timed out or missing")
         finally:
-            cap.release()
+            recv_task.cancel()
+
+
+async def run_load(videos: list[str], ws_url: str, clients: int, fps: float, proto: int,
+                   headless: bool, max_frames: int, verbose: bool, push: bool = False) -> dict:
+    if not max_frames and clients > 1:
+        max_frames = LOAD_MAX_FRAMES   # every driver's clip is held in memory
+    clips = [load_frames(v, max_frames) for v in videos]
+    stats = LoadStats()
+    drivers = [run_driver(i, clips[i % len(clips)], ws_url, fps, proto, stats, headless, verbose, push=push)
+               for i in range(clients)]
+    results = await asyncio.gather(*drivers, return_exceptions=True)
+    stats.t_end = time.perf_counter()
+    for i, r in enumerate(results):
+        if isinstance(r, Exception):
+            stats.errors += 1
+            print(f"[driver {i}] failed: {r!r}")
+    return stats.report()
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--video", default="ai/src/sample_drive.mp4", help="Path to MP4 file")
+    parser = argparse.ArgumentParser(description="Stream MP4s to the WebSocket backend; with --clients N it is a load generator.")
+    parser.add_argument("--video", nargs="+", default=["ai/src/sample_drive.mp4"], help="One or more MP4 files (drivers round-robin over them)")
     parser.add_argument("--ws", default="ws://localhost:8765", help="WebSocket URL of backend")
-    parser.add_argument("--fps", type=float, default=12.0, help="Send rate (frames per second)")
+    parser.add_argument("--fps", type=float, default=12.0, help="Open-loop send rate per driver (frames per second)")
+    parser.add_argument("--proto", type=int, default=2, choices=[1, 2], help="1: frame + JSON telemetry messages, 2: single binary envelope")
+    parser.add_argument("--clients", type=int, default=1, help="Number of concurrent simulated drivers")
+    parser.add_argument("--max-frames", type=int, default=0,
+                        help=f"Frames per driver, pre-encoded in memory (default: whole clip; {LOAD_MAX_FRAMES} with --clients > 1)")
+    parser.add_argument("--headless", action="store_true", help="Don't play TTS audio")
+    parser.add_argument("--quiet", action="store_true", help="Only print the final report")
+    parser.add_argument("--push", action="store_true", help="Ask for change-driven snapshot/delta results instead of one per frame")
     args = parser.parse_args()
 
-    asyncio.run(stream_video(args.video, args.ws, args.fps))
+    report = asyncio.run(run_load(args.video, args.ws, args.clients, args.fps, args.proto,
+                                  args.headless or args.clients > 1, args.max_frames,
+                                  verbose=(args.clients == 1 and not args.quiet), push=args.push))
+    print("\n=== LOAD REPORT ===")
+    print(json.dumps(report, indent=2))